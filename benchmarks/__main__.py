@@ -0,0 +1,57 @@
+"""Run the timing benchmarks, optionally saving the results as JSON.
+
+Run with `python -m benchmarks [--json results.json] [suite ...]` and compare
+two result files with `python -m benchmarks.compare`.
+"""
+import argparse
+import sys
+import typing
+
+from . import (
+    bench_jail,
+    bench_limiter,
+    bench_middleware,
+    bench_snapshot,
+    bench_strategy,
+    bench_upload,
+)
+from .harness import Result, dump, report, run_main
+
+SUITES: dict[str, typing.Callable[[], typing.Awaitable[list[Result]]]] = {
+    "middleware": bench_middleware.collect,
+    "limiter": bench_limiter.collect,
+    "strategy": bench_strategy.collect,
+    "jail": bench_jail.collect,
+    "snapshot": bench_snapshot.collect,
+    "upload": bench_upload.collect,
+}
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument(
+        "suites", nargs="*", metavar="suite", help=f"one of {', '.join(SUITES)}"
+    )
+    parser.add_argument("--json", metavar="PATH", help="write the results here")
+    args = parser.parse_args(argv)
+    for name in args.suites:
+        if name not in SUITES:
+            parser.error(f"unknown suite {name!r}")
+
+    async def run_suites() -> None:
+        results = []
+        for name in args.suites or SUITES:
+            suite = await SUITES[name]()
+            report(suite)
+            results.extend(suite)
+        if args.json == "-":
+            dump(results, sys.stdout)
+        elif args.json:
+            with open(args.json, "w") as fp:
+                dump(results, fp)
+
+    run_main(run_suites)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Cost of IPJail.is_jailed, by number of jailed ranges.
+
+Run with `python -m benchmarks.bench_jail`.
+
+Each call checks a fresh request, so the address is parsed every time like it
+is for real requests. `request` is the cost of creating that request alone.
+"""
+import itertools
+import random
+import typing
+
+from starlette.requests import Request
+
+from slowerapi import IPJail, get_visitor_ip
+
+from .harness import Result, make_scope, report, run, run_main
+
+ITERATIONS = 200_000
+RANGES = (0, 100, 10_000)
+ADDRESSES = 1_000
+
+
+def make_ips(rng: random.Random, first: int, count: int) -> list[str]:
+    return [
+        f"{first}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}"
+        for _ in range(count)
+    ]
+
+
+def make_call(
+    jail: IPJail | None, ips: list[str]
+) -> typing.Callable[[], typing.Any]:
+    scopes = itertools.cycle([make_scope(None, client=ip) for ip in ips])
+    if jail is None:
+        return lambda: Request(dict(next(scopes)))
+    is_jailed = jail.is_jailed
+    return lambda: is_jailed(Request(dict(next(scopes))))
+
+
+async def bench(ranges: int) -> list[Result]:
+    rng = random.Random(0)
+    jail = IPJail(get_visitor_ip, ["1/s"])
+    jailed = make_ips(rng, 10, ranges)
+    for ip in jailed:
+        await jail.jail(Request(make_scope(None, client=ip)))
+
+    results = [
+        run(
+            f"is_jailed miss ({ranges} ranges)",
+            make_call(jail, make_ips(rng, 11, ADDRESSES)),
+            ITERATIONS,
+        )
+    ]
+    if jailed:
+        results.append(
+            run(
+                f"is_jailed hit ({ranges} ranges)",
+                make_call(jail, jailed[:ADDRESSES]),
+                ITERATIONS,
+            )
+        )
+    return results
+
+
+async def collect() -> list[Result]:
+    ips = make_ips(random.Random(0), 11, ADDRESSES)
+    results = [run("request", make_call(None, ips), ITERATIONS)]
+    for ranges in RANGES:
+        results.extend(await bench(ranges))
+    return results
+
+
+async def main() -> None:
+    report(await collect())
+
+
+if __name__ == "__main__":
+    run_main(main)
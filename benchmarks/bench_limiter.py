@@ -0,0 +1,54 @@
+"""Cost of Limiter.check_bucket by number of distinct keys.
+
+Run with `python -m benchmarks.bench_limiter`.
+
+Every key is hit once before timing, so the timed calls find existing entries
+in buckets of the given size.
+"""
+import itertools
+
+from slowerapi import Limiter, get_visitor_ip
+from slowerapi.hitters import HeavyHitters
+from slowerapi.limit import parse_limits
+
+from .harness import Result, report, run, run_main
+
+ITERATIONS = 200_000
+CARDINALITIES = (1, 1_000, 100_000)
+LIMITS = {
+    "1 limit": parse_limits(["1000000000/1d"]),
+    "3 limits": parse_limits(["1000000/1s", "100000000/1h", "1000000000/1d"]),
+}
+
+
+def bench(name: str, keys: int, heavy_hitters: bool = False) -> Result:
+    limits = LIMITS[name]
+    limiter = Limiter(get_visitor_ip)
+    if heavy_hitters:
+        limiter.heavy_hitters = HeavyHitters
+    key_list = [str(i) for i in range(keys)]
+    for key in key_list:
+        limiter.check_bucket("global", key, limits, True)
+
+    cycle = itertools.cycle(key_list)
+    if heavy_hitters:
+        name = "1 limit, top keys"  # past 100 keys every new key evicts one
+    return run(
+        f"check_bucket {name} ({keys} keys)",
+        lambda: limiter.check_bucket("global", next(cycle), limits, True),
+        ITERATIONS,
+    )
+
+
+async def collect() -> list[Result]:
+    results = [bench(name, keys) for name in LIMITS for keys in CARDINALITIES]
+    results.extend(bench("1 limit", keys, True) for keys in CARDINALITIES)
+    return results
+
+
+async def main() -> None:
+    report(await collect())
+
+
+if __name__ == "__main__":
+    run_main(main)
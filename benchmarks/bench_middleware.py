@@ -0,0 +1,127 @@
+"""Per-request overhead of RatelimitMiddleware.
+
+Run with `python -m benchmarks.bench_middleware`.
+
+`basehttp-passthrough` is a `BaseHTTPMiddleware` that only calls `call_next`,
+the minimum the previous `BaseHTTPMiddleware`-based `RatelimitMiddleware` paid
+on every request before doing any ratelimiting work.
+
+`routes` requests cycle over an app with `ROUTES` limited routes (half with a
+path parameter) and `CLIENTS` client addresses; their latency percentiles
+include the cost of reading the clock around each request.
+"""
+import itertools
+import typing
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+from starlette.routing import Route
+
+from slowerapi import Limiter, RatelimitMiddleware, get_visitor_ip
+
+from .harness import (
+    Result,
+    make_receive,
+    make_scope,
+    report,
+    run_async,
+    run_latency,
+    run_main,
+    send,
+)
+
+ITERATIONS = 20_000
+ROUTES = 200
+CLIENTS = 1_000
+
+
+class PassthroughMiddleware(BaseHTTPMiddleware):
+    async def dispatch(
+        self, request: Request, call_next: RequestResponseEndpoint
+    ) -> Response:
+        return await call_next(request)
+
+
+async def endpoint(request: Request) -> Response:
+    return PlainTextResponse("ok")
+
+
+def make_app(middleware: list[Middleware], limit: str = "1000000000/1d") -> Starlette:
+    app = Starlette(routes=[Route("/", endpoint)], middleware=middleware)
+    app.state.limiter = Limiter(get_visitor_ip, [limit])
+    return app
+
+
+def make_endpoint(name: str) -> typing.Callable[[Request], typing.Awaitable[Response]]:
+    async def handler(request: Request) -> Response:
+        return PlainTextResponse("ok")
+
+    handler.__name__ = name  # limits are keyed by handler name
+    return handler
+
+
+def make_routes_app(middleware: list[Middleware]) -> tuple[Starlette, list[str]]:
+    limiter = Limiter(get_visitor_ip, ["1000000000/1d"])
+    routes, paths = [], []
+    for i in range(ROUTES):
+        handler = limiter.limit("1000000/1h")(make_endpoint(f"endpoint{i}"))
+        if i % 2:
+            routes.append(Route(f"/items{i}/{{item_id}}", handler, name=f"r{i}"))
+            paths.append(f"/items{i}/{i}")
+        else:
+            routes.append(Route(f"/static{i}", handler, name=f"r{i}"))
+            paths.append(f"/static{i}")
+    app = Starlette(routes=routes, middleware=middleware)
+    app.state.limiter = limiter
+    return app, paths
+
+
+async def bench(name: str, app: Starlette) -> Result:
+    scope = make_scope(app)
+
+    def call() -> typing.Awaitable[None]:
+        return app(dict(scope), make_receive(), send)
+
+    return await run_async(name, call, ITERATIONS)
+
+
+async def bench_routes(name: str, middleware: list[Middleware]) -> Result:
+    app, paths = make_routes_app(middleware)
+    clients = [f"10.0.{i // 256}.{i % 256}" for i in range(CLIENTS)]
+    scopes = itertools.cycle(
+        [
+            make_scope(app, path, client=client)
+            for path, client in zip(itertools.cycle(paths), clients)
+        ]
+    )
+
+    def call() -> typing.Awaitable[None]:
+        return app(dict(next(scopes)), make_receive(), send)
+
+    return await run_latency(f"{name} ({ROUTES} routes)", call, ITERATIONS)
+
+
+async def collect() -> list[Result]:
+    return [
+        await bench("app", make_app([])),
+        await bench(
+            "basehttp-passthrough", make_app([Middleware(PassthroughMiddleware)])
+        ),
+        await bench("ratelimit", make_app([Middleware(RatelimitMiddleware)])),
+        await bench(
+            "ratelimit 429", make_app([Middleware(RatelimitMiddleware)], "1/1d")
+        ),
+        await bench_routes("app", []),
+        await bench_routes("ratelimit", [Middleware(RatelimitMiddleware)]),
+    ]
+
+
+async def main() -> None:
+    report(await collect())
+
+
+if __name__ == "__main__":
+    run_main(main)
@@ -0,0 +1,58 @@
+"""Memory/accuracy trade-off of CountMinSketchStrategy.
+
+Run with `python -m benchmarks.bench_sketch`.
+
+Replays a skewed stream over many distinct keys (a few heavy hitters and a
+long tail of one-off keys) and compares the sketch estimates against exact
+counts, next to the memory an exact per-key strategy needs for the same keys.
+"""
+import random
+
+from slowerapi.limit import Limit
+from slowerapi.strategy import CountMinSketchStrategy, SlidingWindowStrategy
+
+from .bench_strategy import memory_per_key
+
+KEYS = 100_000
+HITS = 300_000
+LIMIT = Limit(1_000_000, 60)
+ERRORS = (0.01, 0.001, 0.0001)
+
+
+def make_stream() -> list[str]:
+    rng = random.Random(0)
+    weights = [1 / (rank + 1) for rank in range(KEYS)]
+    return rng.choices([str(i) for i in range(KEYS)], weights, k=HITS)
+
+
+def main() -> None:
+    stream = make_stream()
+    exact: dict[str, int] = {}
+    for key in stream:
+        exact[key] = exact.get(key, 0) + 1
+
+    exact_bytes = memory_per_key(SlidingWindowStrategy) * len(exact)
+    print(f"{len(exact)} keys, {HITS} hits")
+    # without the key strings, which the sketch does not keep either
+    print(f"{'exact (sliding-window)':<28} {exact_bytes / 1024:>10.0f} KiB")
+
+    for error in ERRORS:
+        sketch = CountMinSketchStrategy(LIMIT, error=error)
+        sketch.time_func = lambda: 0.0
+        for key in stream:
+            sketch.limit(key, True)
+
+        overestimates = [
+            LIMIT.requests - sketch.limit(key, False).remaining - count
+            for key, count in exact.items()
+        ]
+        print(
+            f"{f'sketch error={error}':<28} {sketch.memory / 1024:>10.0f} KiB  "
+            f"bound {error * HITS:>8.0f}  "
+            f"mean overestimate {sum(overestimates) / len(overestimates):>8.2f}  "
+            f"max {max(overestimates):>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Cost per key of Limiter.snapshot and Limiter.restore, by strategy.
+
+Run with `python -m benchmarks.bench_snapshot`.
+"""
+import io
+import time
+
+from slowerapi import Limiter, get_visitor_ip
+from slowerapi.limit import parse_limits
+from slowerapi.strategy import StrategyFactory
+
+from .bench_strategy import STRATEGIES
+from .harness import Result, report, run_main
+
+KEYS = 1_000_000
+LIMITS = parse_limits(["1000/1h"])
+
+
+def bench(name: str, factory: StrategyFactory) -> list[Result]:
+    limiter = Limiter(get_visitor_ip, strategy=factory)
+    for i in range(KEYS):
+        limiter.check_bucket("global", str(i), LIMITS, True)
+
+    fp = io.BytesIO()
+    start = time.perf_counter()
+    limiter.snapshot(fp)
+    snapshot = Result(f"snapshot {name}", KEYS, time.perf_counter() - start)
+
+    fp.seek(0)
+    limiter = Limiter(get_visitor_ip, strategy=factory)
+    start = time.perf_counter()
+    limiter.restore(fp)
+    restore = Result(f"restore {name}", KEYS, time.perf_counter() - start)
+    return [snapshot, restore]
+
+
+async def collect() -> list[Result]:
+    results = []
+    for name, factory in STRATEGIES.items():
+        if name != "count-min-sketch":  # no per key state to snapshot
+            results.extend(bench(name, factory))
+    return results
+
+
+async def main() -> None:
+    report(await collect())
+
+
+if __name__ == "__main__":
+    run_main(main)
@@ -0,0 +1,72 @@
+"""Per-check cost and per-key memory of each strategy.
+
+Run with `python -m benchmarks.bench_strategy`.
+"""
+import itertools
+import tracemalloc
+import typing
+
+from slowerapi.limit import Limit
+from slowerapi.strategy import (
+    CountMinSketchStrategy,
+    GCRAStrategy,
+    MovingWindowStrategy,
+    SlidingWindowStrategy,
+    StrategyFactory,
+)
+
+from .harness import Result, report, run
+
+ITERATIONS = 200_000
+KEYS = 100_000
+LIMIT = Limit(1_000_000, 60)
+
+STRATEGIES: dict[str, StrategyFactory] = {
+    "moving-window": MovingWindowStrategy,
+    "gcra": GCRAStrategy,
+    "sliding-window": SlidingWindowStrategy,
+    "count-min-sketch": CountMinSketchStrategy,
+}
+
+
+def bench(name: str, factory: StrategyFactory) -> list[Result]:
+    strategy = factory(LIMIT, "global", None)
+    hot = run(f"{name} (1 key)", lambda: strategy.limit("key", True), ITERATIONS)
+
+    strategy = factory(LIMIT, "global", None)
+    keys = itertools.cycle([str(i) for i in range(KEYS)])
+    spread = run(
+        f"{name} ({KEYS} keys)",
+        lambda: strategy.limit(next(keys), True),
+        ITERATIONS,
+    )
+    return [hot, spread]
+
+
+def memory_per_key(factory: StrategyFactory) -> float:
+    keys = [str(i) for i in range(KEYS)]
+    tracemalloc.start()
+    strategy = factory(LIMIT, "global", None)
+    for key in keys:
+        strategy.limit(key, True)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size / KEYS
+
+
+async def collect() -> list[Result]:
+    results = []
+    for name, factory in STRATEGIES.items():
+        results.extend(bench(name, factory))
+    return results
+
+
+def main(strategies: typing.Mapping[str, StrategyFactory] = STRATEGIES) -> None:
+    for name, factory in strategies.items():
+        report(bench(name, factory))
+    for name, factory in strategies.items():
+        print(f"{name:<40} {memory_per_key(factory):>12.0f} bytes/key")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Cost of a flood of large uploads from jailed and ratelimited clients.
+
+Run with `python -m benchmarks.bench_upload`.
+
+Every request is a POST with a `BODY_SIZE` body that arrives in `CHUNK_SIZE`
+messages, to a route that reads it. `app` reads the whole body every time,
+like the app behind a middleware that has to run before deciding; rejected
+requests never call `receive`, so their cost does not grow with the body.
+"""
+import typing
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+from starlette.routing import Route
+from starlette.types import Message, Receive
+
+from slowerapi import IPJail, Limiter, RatelimitMiddleware, get_visitor_ip
+
+from .harness import Result, make_scope, report, run_async, run_main, send
+
+ITERATIONS = 2_000
+BODY_SIZE = 4 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+async def upload(request: Request) -> Response:
+    return PlainTextResponse(str(len(await request.body())))
+
+
+def make_receive(chunk: bytes, chunks: int) -> Receive:
+    left = chunks
+
+    async def receive() -> Message:
+        nonlocal left
+        left -= 1
+        return {"type": "http.request", "body": chunk, "more_body": left > 0}
+
+    return receive
+
+
+async def bench(name: str, app: Starlette, limiter: Limiter | None) -> Result:
+    app.state.limiter = limiter
+    if limiter is not None and limiter.jail is not None:
+        await limiter.jail.jail(Request(make_scope(app)))
+    scope = make_scope(app, method="POST")
+    chunk = b"x" * CHUNK_SIZE
+
+    def call() -> typing.Awaitable[None]:
+        return app(dict(scope), make_receive(chunk, BODY_SIZE // CHUNK_SIZE), send)
+
+    return await run_async(name, call, ITERATIONS)
+
+
+def make_app(middleware: list[Middleware]) -> Starlette:
+    return Starlette(
+        routes=[Route("/", upload, methods=["POST"])], middleware=middleware
+    )
+
+
+async def collect() -> list[Result]:
+    mb = BODY_SIZE // 1024 // 1024
+    return [
+        await bench(f"app ({mb}MB uploads)", make_app([]), None),
+        await bench(
+            f"ratelimit 429 ({mb}MB uploads)",
+            make_app([Middleware(RatelimitMiddleware)]),
+            Limiter(get_visitor_ip, ["1/1d"]),
+        ),
+        await bench(
+            f"ratelimit jailed ({mb}MB uploads)",
+            make_app([Middleware(RatelimitMiddleware)]),
+            Limiter(get_visitor_ip, jail=IPJail(get_visitor_ip, ["1/1d"])),
+        ),
+        await bench(
+            f"ratelimit jailed, close ({mb}MB uploads)",
+            make_app([Middleware(RatelimitMiddleware, close_jailed=True)]),
+            Limiter(get_visitor_ip, jail=IPJail(get_visitor_ip, ["1/1d"])),
+        ),
+    ]
+
+
+async def main() -> None:
+    report(await collect())
+
+
+if __name__ == "__main__":
+    run_main(main)
@@ -0,0 +1,43 @@
+"""Compare two result files written by `python -m benchmarks --json`.
+
+Run with `python -m benchmarks.compare base.json head.json`. Exits with 1 when
+a benchmark got slower by more than `--threshold` (10% by default).
+"""
+import argparse
+import sys
+
+from .harness import load
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.compare")
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    with open(args.base) as fp:
+        base = load(fp)
+    with open(args.head) as fp:
+        head = load(fp)
+
+    regressions = 0
+    for name, result in head.items():
+        before = base.get(name, None)
+        if before is None:
+            print(f"{name:<40} {result.per_call_ns:>12.0f} ns/call (new)")
+            continue
+        change = result.per_call_ns / before.per_call_ns - 1
+        flag = ""
+        if change > args.threshold:
+            regressions += 1
+            flag = "  slower"
+        print(
+            f"{name:<40} {before.per_call_ns:>12.0f} -> "
+            f"{result.per_call_ns:>12.0f} ns/call {change:>+8.1%}{flag}"
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
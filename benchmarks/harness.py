@@ -0,0 +1,167 @@
+import asyncio
+import json
+import platform
+import subprocess
+import time
+import typing
+
+from starlette.types import Message, Receive, Scope
+
+
+class Result(typing.NamedTuple):
+    name: str
+    iterations: int
+    seconds: float
+    p50_ns: float | None = None
+    p99_ns: float | None = None
+
+    @property
+    def per_call_ns(self) -> float:
+        return self.seconds / self.iterations * 1e9
+
+    @property
+    def per_second(self) -> float:
+        return self.iterations / self.seconds
+
+    def as_dict(self) -> dict[str, typing.Any]:
+        return {
+            **self._asdict(),
+            "per_call_ns": self.per_call_ns,
+            "per_second": self.per_second,
+        }
+
+
+def run(name: str, func: typing.Callable[[], typing.Any], iterations: int) -> Result:
+    for _ in range(min(iterations, 1000)):  # warmup
+        func()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return Result(name, iterations, time.perf_counter() - start)
+
+
+async def run_async(
+    name: str,
+    func: typing.Callable[[], typing.Awaitable[typing.Any]],
+    iterations: int,
+) -> Result:
+    for _ in range(min(iterations, 1000)):  # warmup
+        await func()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await func()
+    return Result(name, iterations, time.perf_counter() - start)
+
+
+async def run_latency(
+    name: str,
+    func: typing.Callable[[], typing.Awaitable[typing.Any]],
+    iterations: int,
+) -> Result:
+    # times every call on its own for the percentiles, which adds the cost of
+    # reading the clock to each call: only for calls in the microseconds
+    for _ in range(min(iterations, 1000)):  # warmup
+        await func()
+    clock = time.perf_counter_ns
+    timings = []
+    for _ in range(iterations):
+        start = clock()
+        await func()
+        timings.append(clock() - start)
+    timings.sort()
+    return Result(
+        name,
+        iterations,
+        sum(timings) / 1e9,
+        timings[len(timings) // 2],
+        timings[len(timings) * 99 // 100],
+    )
+
+
+def report(results: typing.Iterable[Result]) -> None:
+    for result in results:
+        latency = ""
+        if result.p50_ns is not None and result.p99_ns is not None:
+            latency = f" p50 {result.p50_ns:.0f} ns, p99 {result.p99_ns:.0f} ns"
+        print(
+            f"{result.name:<40} {result.per_call_ns:>12.0f} ns/call "
+            f"({result.iterations} iterations){latency}"
+        )
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def dump(results: typing.Iterable[Result], fp: typing.TextIO) -> None:
+    json.dump(
+        {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.time(),
+            "results": [result.as_dict() for result in results],
+        },
+        fp,
+        indent=2,
+    )
+    fp.write("\n")
+
+
+def load(fp: typing.TextIO) -> dict[str, Result]:
+    fields = Result._fields
+    return {
+        result["name"]: Result(**{k: v for k, v in result.items() if k in fields})
+        for result in json.load(fp)["results"]
+    }
+
+
+def make_scope(
+    app: typing.Any, path: str = "/", method: str = "GET", client: str = "1.2.3.4"
+) -> Scope:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"testserver")],
+        "client": (client, 12345),
+        "server": ("testserver", 80),
+        "app": app,
+    }
+
+
+def make_receive(body: bytes = b"") -> Receive:
+    sent = False
+
+    async def receive() -> Message:
+        nonlocal sent
+        if sent:  # like a client that stays connected: block until cancelled
+            await asyncio.get_running_loop().create_future()
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    return receive
+
+
+async def send(message: Message) -> None:
+    pass
+
+
+def run_main(
+    main: typing.Callable[[], typing.Coroutine[typing.Any, typing.Any, None]]
+) -> None:
+    asyncio.run(main())
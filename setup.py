@@ -10,6 +10,7 @@ setup(
     author_email="git@leodev.xyz",
     description="ratelimit library for fastapi",
     install_requires=Path("requirements.txt").read_text().splitlines(),
+    extras_require={"redis": ["redis>=4.2,<9"]},
     packages=find_namespace_packages(include=["slowerapi*"]),
     package_data={"slowerapi": ["py.typed"]},
 )
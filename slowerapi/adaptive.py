@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import asyncio
+import random
+
+
+class LoadShedder:
+    # scales limits down while the worker is saturated. every `interval` a
+    # timer measures how late the event loop woke it up (the lag); while the
+    # lag is over `max_lag` or more than `max_in_flight` requests are running,
+    # the factor is multiplied by `decrease` (down to `min_factor`), otherwise
+    # it recovers by `increase` per interval back up to 1.
+    # hits cost 1 / factor times as much, routes marked sheddable are rejected
+    # while the factor is below their threshold.
+    factor: float
+    lag: float
+    in_flight: int
+    shed: int
+
+    def __init__(
+        self,
+        interval: float = 0.1,
+        max_lag: float = 0.05,
+        max_in_flight: int | None = None,
+        decrease: float = 0.5,
+        increase: float = 0.05,
+        min_factor: float = 0.1,
+    ) -> None:
+        self.interval = interval
+        self.max_lag = max_lag
+        self.max_in_flight = max_in_flight
+        self.decrease = decrease
+        self.increase = increase
+        self.min_factor = min_factor
+        self.factor = 1.0
+        self.lag = 0.0
+        self.in_flight = 0
+        self.shed = 0
+        self.random = random.random
+
+        self._task: asyncio.Task[None] | None = None
+
+    @property
+    def overloaded(self) -> bool:
+        return self.lag > self.max_lag or (
+            self.max_in_flight is not None and self.in_flight > self.max_in_flight
+        )
+
+    def update(self, lag: float) -> None:
+        self.lag = lag
+        if self.overloaded:
+            self.factor = max(self.min_factor, self.factor * self.decrease)
+        else:
+            self.factor = min(1.0, self.factor + self.increase)
+
+    def scale(self, cost: int) -> int:
+        # rounded at random so hits cost cost / factor on average
+        scaled = cost / self.factor
+        whole = int(scaled)
+        return whole + (self.random() < scaled - whole)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.update(max(0.0, loop.time() - start - self.interval))
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import math
+import socket
+import typing
+
+IPV4_MAPPED = 0xFFFF  # ::ffff:0:0/96, shifted down by 32 bits
+
+
+def pack_ip(ip: str) -> tuple[int, int]:
+    # (address width, address as int), ipv4-mapped ipv6 addresses count as ipv4
+    try:
+        return 32, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+    except OSError:
+        pass
+    try:
+        addr = int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), "big")
+    except OSError:
+        raise ValueError(f"{ip!r} does not appear to be an IPv4 or IPv6 address")
+    if addr >> 32 == IPV4_MAPPED:
+        return 32, addr & 0xFFFFFFFF
+    return 128, addr
+
+
+def network(addr: int, width: int, length: int) -> int:
+    return addr >> (width - length) << (width - length)
+
+
+def format_network(prefix: int, width: int, length: int) -> str:
+    if width == 32:
+        return f"{socket.inet_ntoa(prefix.to_bytes(4, 'big'))}/{length}"
+    groups = prefix.to_bytes(16, "big").hex(":", 2).split(":")
+    used = -(-length // 16)
+    suffix = "::" if used < 8 else ""
+    return f"{':'.join(groups[:used])}{suffix}/{length}"
+
+
+class _Node:
+    __slots__ = ("prefix", "length", "mask", "expires", "children")
+
+    def __init__(self, prefix: int, length: int, width: int) -> None:
+        self.prefix = prefix
+        self.length = length
+        self.mask = ((1 << length) - 1) << (width - length)
+        self.expires: float | None = None  # None when no entry ends here
+        self.children: list[_Node | None] = [None, None]
+
+
+class RadixTree:
+    # path-compressed binary trie of network prefixes over `width`-bit
+    # addresses, each entry expires at its own time (math.inf for never).
+    # a lookup walks at most one node per prefix bit.
+    def __init__(self, width: int) -> None:
+        self.width = width
+        self._root = _Node(0, 0, width)
+        self._size = 0
+        # the earliest expiry of any entry, prune has nothing to do before
+        self.next_expiry = math.inf
+        self.prune_at = 1024
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _bit(self, addr: int, index: int) -> int:
+        return (addr >> (self.width - index - 1)) & 1
+
+    def _common(self, a: int, b: int, limit: int) -> int:
+        return min(limit, self.width - (a ^ b).bit_length())
+
+    def lookup(self, addr: int, now: float) -> float | None:
+        # expiry of a live entry covering addr, the shortest prefix wins
+        node: _Node | None = self._root
+        width = self.width
+        while node is not None:
+            if addr & node.mask != node.prefix:
+                return None
+            expires = node.expires
+            if expires is not None:
+                if expires > now:
+                    return expires
+                self.remove(node.prefix, node.length)
+            if node.length == width:
+                return None
+            node = node.children[(addr >> (width - node.length - 1)) & 1]
+        return None
+
+    def insert(self, addr: int, length: int, expires: float = math.inf) -> None:
+        prefix = network(addr, self.width, length)
+        node = self._root
+        while node.length < length:
+            bit = self._bit(prefix, node.length)
+            child = node.children[bit]
+            if child is None:
+                node.children[bit] = child = _Node(prefix, length, self.width)
+                node = child
+                break
+
+            common = self._common(child.prefix, prefix, min(child.length, length))
+            if common < child.length:
+                # split the edge to child at the first differing bit
+                split = _Node(network(prefix, self.width, common), common, self.width)
+                split.children[self._bit(child.prefix, common)] = child
+                node.children[bit] = split
+            node = node.children[bit]  # type: ignore
+
+        if node.expires is None:
+            self._size += 1
+        node.expires = expires
+        if expires < self.next_expiry:
+            self.next_expiry = expires
+
+    def remove(self, addr: int, length: int) -> bool:
+        prefix = network(addr, self.width, length)
+        path = [self._root]
+        node: _Node | None = self._root
+        while node is not None and node.length < length:
+            node = node.children[self._bit(prefix, node.length)]
+            if node is not None:
+                path.append(node)
+        if node is None or node.length != length or node.prefix != prefix:
+            return False
+        if node.expires is None:
+            return False
+
+        node.expires = None
+        self._size -= 1
+        # drop nodes that no longer hold an entry or a branch
+        while len(path) > 1:
+            node, parent = path[-1], path[-2]
+            if node.expires is not None:
+                break
+            children = [child for child in node.children if child is not None]
+            if len(children) == 2:
+                break
+            index = parent.children.index(node)
+            parent.children[index] = children[0] if children else None
+            path.pop()
+        return True
+
+    def items(self) -> typing.Iterator[tuple[int, int, float]]:
+        # (prefix, length, expires) of every entry, live or not
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node.expires is not None:
+                yield node.prefix, node.length, node.expires
+            stack.extend(child for child in node.children if child is not None)
+
+    def prune(self, now: float) -> int:
+        if self.next_expiry > now:
+            return 0
+        expired = []
+        next_expiry = math.inf
+        for prefix, length, expires in self.items():
+            if expires <= now:
+                expired.append((prefix, length))
+            elif expires < next_expiry:
+                next_expiry = expires
+        for prefix, length in expired:
+            self.remove(prefix, length)
+        self.next_expiry = next_expiry
+        return len(expired)
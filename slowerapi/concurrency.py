@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+
+
+class ConcurrencyLimit:
+    # at most `limit` requests in flight at once, per key if `per_key`.
+    # requests over it wait up to `queue_timeout` seconds for a slot (0 rejects
+    # right away), with at most `max_queue` waiting in total. a released slot is
+    # handed straight to the oldest waiter, keys without slots in use are
+    # dropped so idle keys take no memory.
+    queued: int
+    rejected: int
+
+    def __init__(
+        self,
+        limit: int,
+        per_key: bool = False,
+        queue_timeout: float = 0.0,
+        max_queue: int = 1024,
+    ) -> None:
+        self.limit = limit
+        self.per_key = per_key
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self.queued = 0
+        self.rejected = 0
+
+        self._active: dict[str, int] = {}
+        self._waiters: dict[str, deque[asyncio.Future[None]]] = {}
+
+    def in_flight(self, key: str = "") -> int:
+        return self._active.get(key if self.per_key else "", 0)
+
+    async def acquire(self, key: str) -> bool:
+        if not self.per_key:
+            key = ""
+        active = self._active.get(key, 0)
+        if active < self.limit and key not in self._waiters:
+            self._active[key] = active + 1
+            return True
+        if self.queue_timeout <= 0 or self.queued >= self.max_queue:
+            self.rejected += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, deque()).append(waiter)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            # since 3.12 wait_for raises even if the slot was handed over as
+            # the timeout fired, the slot is ours then
+            if waiter.done() and not waiter.cancelled():
+                return True
+            self.rejected += 1
+            return False
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(key)  # got the slot just as the request went away
+            raise
+        finally:
+            self.queued -= 1
+
+    def release(self, key: str) -> None:
+        if not self.per_key:
+            key = ""
+        waiters = self._waiters.get(key, None)
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiters:
+                del self._waiters[key]
+            if not waiter.done():  # skip waiters that timed out
+                waiter.set_result(None)
+                return
+
+        active = self._active[key] - 1
+        if active:
+            self._active[key] = active
+        else:
+            del self._active[key]
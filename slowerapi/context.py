@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import typing
+
+from starlette.requests import Request
+
+from .cidr import format_network, network, pack_ip
+
+T = typing.TypeVar("T")
+RequestFunc = typing.Callable[[Request], T]
+
+STATE_KEY = "slowerapi"
+
+
+class RequestContext:
+    # values derived from one request, computed at most once and shared by the
+    # key func, jail and reporters. custom key funcs can keep their own values
+    # in `extra`, or hand an address they resolved to `set_ip`. it lives in
+    # the scope, so it does not keep the request: that would be a reference
+    # cycle per request for the garbage collector.
+    __slots__ = ("key", "extra", "_memo", "_packed", "_ranges")
+
+    def __init__(self) -> None:
+        self.key: str | None = None
+        self.extra: dict[str, typing.Any] = {}
+        self._memo: dict[RequestFunc[typing.Any], typing.Any] = {}
+        self._packed: dict[RequestFunc[str], tuple[int, int]] = {}
+        self._ranges: dict[tuple[RequestFunc[str], int, int], str] = {}
+
+    def memo(self, func: RequestFunc[T], request: Request) -> T:
+        try:
+            return self._memo[func]  # type: ignore
+        except KeyError:
+            self._memo[func] = value = func(request)
+            return value
+
+    def set_ip(self, ip_func: RequestFunc[str], ip: str) -> None:
+        self._memo[ip_func] = ip
+
+    def packed_ip(
+        self, ip_func: RequestFunc[str], request: Request
+    ) -> tuple[int, int]:
+        packed = self._packed.get(ip_func, None)
+        if packed is None:
+            self._packed[ip_func] = packed = pack_ip(self.memo(ip_func, request))
+        return packed
+
+    def ip_range(
+        self,
+        ip_func: RequestFunc[str],
+        request: Request,
+        ipv4_prefix: int = 24,
+        ipv6_prefix: int = 64,
+    ) -> str:
+        cache_key = (ip_func, ipv4_prefix, ipv6_prefix)
+        ip_range = self._ranges.get(cache_key, None)
+        if ip_range is None:
+            width, addr = self.packed_ip(ip_func, request)
+            length = ipv4_prefix if width == 32 else ipv6_prefix
+            ip_range = format_network(network(addr, width, length), width, length)
+            self._ranges[cache_key] = ip_range
+        return ip_range
+
+
+def get_context(request: Request) -> RequestContext:
+    state = request.scope.setdefault("state", {})
+    context: RequestContext | None = state.get(STATE_KEY, None)
+    if context is None:
+        state[STATE_KEY] = context = RequestContext()
+    return context
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+import typing
+from collections import deque
+
+if typing.TYPE_CHECKING:  # pragma: no cover
+    from .strategy import Strategy
+
+_Entry = tuple[int, "Strategy", str]
+
+
+class ExpiryEngine:
+    # hierarchical timing wheel of keys that might have expired, reclaimed by a
+    # background task in batches of at most `batch` keys per tick.
+    # level n has `1 << bits` slots of `tick << (bits * n)` seconds each.
+    reclaimed: int
+
+    def __init__(
+        self,
+        tick: float = 0.1,
+        batch: int = 1000,
+        bits: int = 6,
+        levels: int = 4,
+        time_func: typing.Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.tick = tick
+        self.batch = batch
+        self.bits = bits
+        self.levels = levels
+        self.time_func = time_func
+        self.reclaimed = 0
+
+        self._mask = (1 << bits) - 1
+        self._horizon = (1 << (bits * levels)) - 1
+        self._wheels: list[list[list[_Entry]]] = [
+            [[] for _ in range(1 << bits)] for _ in range(levels)
+        ]
+        self._due: deque[tuple[Strategy, str]] = deque()
+        self._now = self._current_tick()
+        self._task: asyncio.Task[None] | None = None
+
+    def _current_tick(self) -> int:
+        return int(self.time_func() / self.tick)
+
+    @property
+    def pending(self) -> int:
+        scheduled = sum(len(slot) for wheel in self._wheels for slot in wheel)
+        return scheduled + len(self._due)
+
+    def schedule(self, strategy: Strategy, key: str, delay: float) -> None:
+        if self._task is None:
+            # started on first use even if Limiter.startup is not hooked up,
+            # outside an event loop advance and reclaim are up to the caller
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                pass
+            else:
+                self.start()
+        self._insert((self._now + math.ceil(delay / self.tick), strategy, key))
+
+    def _insert(self, entry: _Entry) -> None:
+        deadline = entry[0]
+        delta = deadline - self._now
+        if delta <= 0:
+            self._due.append(entry[1:])
+            return
+
+        # too far out: park it on the last level, it is re-inserted from there
+        tick = self._now + min(delta, self._horizon)
+        for level in range(self.levels):
+            if delta < 1 << (self.bits * (level + 1)) or level == self.levels - 1:
+                slot = (tick >> (self.bits * level)) & self._mask
+                self._wheels[level][slot].append(entry)
+                return
+
+    def advance(self) -> None:
+        target = self._current_tick()
+        while self._now < target:
+            self._now += 1
+            self._cascade(0)
+            for level in range(1, self.levels):
+                if (self._now >> (self.bits * level - self.bits)) & self._mask:
+                    break
+                self._cascade(level)
+
+    def _cascade(self, level: int) -> None:
+        wheel = self._wheels[level]
+        slot = (self._now >> (self.bits * level)) & self._mask
+        entries, wheel[slot] = wheel[slot], []
+        for entry in entries:
+            self._insert(entry)
+
+    def reclaim(self) -> int:
+        reclaimed = 0
+        for _ in range(min(self.batch, len(self._due))):
+            strategy, key = self._due.popleft()
+            expires_in = strategy.expires_in(key)
+            if expires_in is None:  # already gone
+                continue
+            elif expires_in <= 0:
+                strategy.forget(key)
+                reclaimed += 1
+            else:
+                self.schedule(strategy, key, expires_in)
+        self.reclaimed += reclaimed
+        return reclaimed
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.tick)
+            self.advance()
+            self.reclaim()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
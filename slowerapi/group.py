@@ -0,0 +1,41 @@
+import typing
+
+from .limit import Limit
+from .strategy import Ratelimited, Strategy
+
+
+class LimitGroup:
+    # all limits of one bucket with their strategies resolved, checked in one
+    # pass. the key's hash is cached by str, so every strategy reuses it.
+    def __init__(
+        self, bucket: str, limits: list[Limit], strategies: list[Strategy]
+    ) -> None:
+        self.bucket = bucket
+        self.limits = limits
+        self.size = len(limits)
+        self.strategies = strategies
+        self._pairs = list(zip(limits, [strategy.check for strategy in strategies]))
+
+    def is_for(self, limits: typing.Sequence[Limit]) -> bool:
+        return limits is self.limits and len(limits) == self.size
+
+    def check(self, key: str, increase: bool, cost: int = 1) -> Ratelimited | None:
+        best_limit = None
+        limited = False
+        remaining = 0
+        reset_after = 0.0
+        # same order as most_restrictive, without a Ratelimited per limit
+        for limit, check in self._pairs:
+            is_limited, left, reset = check(key, increase, cost)
+            if (
+                best_limit is None
+                or (not limited and is_limited)
+                or (limited and is_limited and reset_after < reset)
+                or (not limited and remaining > left)
+            ):
+                best_limit = limit
+                limited, remaining, reset_after = is_limited, left, reset
+
+        if best_limit is None:
+            return None
+        return Ratelimited(limited, best_limit, remaining, reset_after)
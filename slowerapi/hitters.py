@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import heapq
+import time
+import typing
+
+
+class HeavyHitter(typing.NamedTuple):
+    key: str
+    hits: int
+    # hits may be overestimated by up to this much
+    error: int
+
+
+class _Summary:
+    # space-saving: at most `capacity` keys, a new key replaces the key with
+    # the lowest count and inherits that count as its error. keys are grouped
+    # by count so the lowest is found from a heap of counts; the heap is
+    # cleaned lazily and rebuilt once stale counts pile up.
+    __slots__ = ("capacity", "counts", "errors", "groups", "heap")
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.counts: dict[str, int] = {}
+        self.errors: dict[str, int] = {}
+        self.groups: dict[int, dict[str, None]] = {}
+        self.heap: list[int] = []
+
+    def _ungroup(self, key: str, count: int) -> None:
+        group = self.groups[count]
+        del group[key]
+        if not group:
+            del self.groups[count]
+
+    # the most hits a key that is not kept can have had
+    def floor(self) -> int:
+        if len(self.counts) < self.capacity:
+            return 0
+        heap, groups = self.heap, self.groups
+        while heap[0] not in groups:
+            heapq.heappop(heap)
+        return heap[0]
+
+    def add(self, key: str, cost: int) -> None:
+        counts, groups = self.counts, self.groups
+        count = counts.get(key, None)
+        if count is not None:
+            self._ungroup(key, count)
+        elif len(counts) < self.capacity:
+            count = 0
+            self.errors[key] = 0
+        else:
+            count = self.floor()
+            evicted = next(iter(groups[count]))
+            self._ungroup(evicted, count)
+            del counts[evicted], self.errors[evicted]
+            self.errors[key] = count
+        counts[key] = count = count + cost
+
+        group = groups.get(count, None)
+        if group is None:
+            groups[count] = group = {}
+            heap = self.heap
+            if len(heap) > 4 * self.capacity:
+                heap[:] = groups
+                heapq.heapify(heap)
+            else:
+                heapq.heappush(heap, count)
+        group[key] = None
+
+
+class HeavyHitters:
+    # the keys with the most hits in the last one to two `window`s, in fixed
+    # memory: two summaries of at most `capacity` keys, the current one and
+    # the one from the window before. counts are never underestimated, a key
+    # with more than 1 / capacity of the hits in a window is always kept.
+    def __init__(self, capacity: int = 100, window: float = 60.0) -> None:
+        self.capacity = capacity
+        self.window = window
+        self.time_func = time.monotonic
+
+        self._current = _Summary(capacity)
+        self._previous = _Summary(capacity)
+        self._index = 0
+        self._rotate_at = 0.0
+
+    def _rotate(self, now: float) -> None:
+        index = int(now // self.window)
+        self._previous = (
+            self._current if index == self._index + 1 else _Summary(self.capacity)
+        )
+        self._current = _Summary(self.capacity)
+        self._index = index
+        self._rotate_at = (index + 1) * self.window
+
+    def add(self, key: str, cost: int = 1) -> None:
+        now = self.time_func()
+        if now >= self._rotate_at:
+            self._rotate(now)
+        self._current.add(key, cost)
+
+    def top(self, n: int = 10) -> list[HeavyHitter]:
+        now = self.time_func()
+        if now >= self._rotate_at:
+            self._rotate(now)
+        hitters = []
+        current, previous = self._current, self._previous
+        # a key missing from a full summary may have had up to its floor there
+        floors = current.floor(), previous.floor()
+        keys = [*current.counts, *previous.counts.keys() - current.counts.keys()]
+        for key in keys:
+            count = error = 0
+            for summary, floor in zip((current, previous), floors):
+                kept = summary.counts.get(key, None)
+                if kept is None:
+                    count += floor
+                    error += floor
+                else:
+                    count += kept
+                    error += summary.errors[key]
+            hitters.append(HeavyHitter(key, count, error))
+        # ties go to the key with the more certain count
+        return heapq.nlargest(n, hitters, key=lambda hit: (hit.hits, -hit.error))
+
+
+HeavyHittersFactory = typing.Callable[[], HeavyHitters]
@@ -1,35 +1,41 @@
 from __future__ import annotations
 
-import ipaddress
+import asyncio
+import math
+import time
 import typing
 from abc import ABC
 
 from fastapi import Request
 
+from .cidr import RadixTree, format_network, network, pack_ip
+from .context import get_context
+from .journal import Entry, JailJournal
 from .limit import LimitType, parse_limits
+from .reporters import start_reporter, stop_reporter
 
 if typing.TYPE_CHECKING:  # pragma: no cover
     from .limiter import Limiter
+    from .metrics import Metrics
 
 
 IpFunc = typing.Callable[[Request], str]
 ReportFunc = typing.Callable[[Request, str], typing.Any]
 
 
-def reduce_ip_range(ip: str) -> str:
-    addr = ipaddress.ip_address(ip)
-    if isinstance(addr, ipaddress.IPv4Address):
-        a, b, c, _ = addr.packed
-        return f"{a}.{b}.{c}.0/24"
-    else:
-        return f"{addr.packed[:8].hex(':', 2)}::/64"
+def reduce_ip_range(ip: str, ipv4_prefix: int = 24, ipv6_prefix: int = 64) -> str:
+    width, addr = pack_ip(ip)
+    length = ipv4_prefix if width == 32 else ipv6_prefix
+    return format_network(network(addr, width, length), width, length)
 
 
 class Jail(ABC):
+    metrics: Metrics | None = None
+
     def is_jailed(self, request: Request) -> bool:  # pragma: no cover
         ...
 
-    def should_jail(
+    async def should_jail(
         self, request: Request, key: str, limiter: Limiter
     ) -> bool:  # pragma: no cover
         ...
@@ -37,33 +43,135 @@ class Jail(ABC):
     async def jail(self, request: Request) -> None:  # pragma: no cover
         ...
 
+    async def startup(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
 
 class IPJail(Jail):
-    _jailed: set[str]
+    _trees: dict[int, RadixTree]
 
     def __init__(
         self,
         ip_func: IpFunc,
         limits: typing.Sequence[LimitType],
         reporters: list[ReportFunc] | None = None,
+        ipv4_prefix: int = 24,
+        ipv6_prefix: int = 64,
+        jail_time: float | None = None,
+        journal: JailJournal | None = None,
     ):
         self.ip_func = ip_func
         self.limits = parse_limits(limits)
         self.reporters = reporters if reporters else []
-        self._jailed = set()
+        self.prefixes = {32: ipv4_prefix, 128: ipv6_prefix}
+        self.jail_time = jail_time
+        self.time_func = time.time
+        self.journal = journal
+        self._trees = {32: RadixTree(32), 128: RadixTree(128)}
+        self._task: asyncio.Task[None] | None = None
+        self.sync()
+
+    def _load(self, entries: typing.Iterable[Entry]) -> None:
+        now = self.time_func()
+        for width, prefix, length, expires in entries:
+            if expires > now and width in self._trees:
+                self._insert(width, prefix, length, expires)
+
+    def _insert(self, width: int, addr: int, length: int, expires: float) -> None:
+        tree = self._trees[width]
+        tree.insert(addr, length, expires)
+        # drop expired ranges whenever the tree doubled, lookups only drop
+        # the ones they pass
+        if len(tree) >= tree.prune_at:
+            tree.prune(self.time_func())
+            tree.prune_at = max(1024, 2 * len(tree))
+
+    # drops expired ranges, returns how many
+    def prune(self) -> int:
+        now = self.time_func()
+        return sum(tree.prune(now) for tree in self._trees.values())
+
+    def sync(self) -> None:
+        # pick up entries jailed by other workers sharing the journal
+        if self.journal is not None:
+            self._load(self.journal.read())
+
+    async def _run_sync(self, journal: JailJournal) -> None:
+        # file io and compaction run in a thread, off the event loop
+        while True:
+            await asyncio.sleep(journal.sync_interval)
+            journal.flush()
+            self._load(await asyncio.to_thread(journal.read))
+            if journal.should_compact():
+                await asyncio.to_thread(journal.compact, journal.compact_after)
+            self.prune()
+
+    async def startup(self) -> None:
+        for reporter in self.reporters:
+            await start_reporter(reporter)
+        if self.journal is not None and self._task is None:
+            self._task = asyncio.create_task(self._run_sync(self.journal))
+
+    async def shutdown(self) -> None:
+        for reporter in self.reporters:
+            await stop_reporter(reporter)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.journal is not None:
+            # may wait for a compaction the sync task left running in a thread
+            await asyncio.to_thread(self.journal.close)
+
+    # jailed ranges by address width
+    def ranges(self) -> dict[int, int]:
+        self.prune()
+        return {width: len(tree) for width, tree in self._trees.items()}
+
+    def _lookup(self, width: int, addr: int) -> bool:
+        return self._trees[width].lookup(addr, self.time_func()) is not None
 
     def is_jailed(self, request: Request) -> bool:
-        ip_range = reduce_ip_range(self.ip_func(request))
-        return ip_range in self._jailed
+        trees = self._trees
+        if not trees[32] and not trees[128]:
+            return False
+        return self._lookup(*get_context(request).packed_ip(self.ip_func, request))
 
-    def should_jail(self, request: Request, key: str, limiter: Limiter) -> bool:
-        ratelimited = limiter.check_bucket("jailed", key, self.limits, True)
+    async def should_jail(
+        self, request: Request, key: str, limiter: Limiter
+    ) -> bool:
+        ratelimited = await limiter.hit("jailed", key, self.limits, True)
         return ratelimited is not None and ratelimited.limited
 
     async def jail(self, request: Request) -> None:
-        ip_range = reduce_ip_range(self.ip_func(request))
-        if ip_range in self._jailed:
+        context = get_context(request)
+        width, addr = context.packed_ip(self.ip_func, request)
+        if self._lookup(width, addr):
             return
-        self._jailed.add(ip_range)
+        length = self.prefixes[width]
+        expires = math.inf
+        if self.jail_time is not None:
+            expires = self.time_func() + self.jail_time
+        self._insert(width, addr, length, expires)
+        if self.journal is not None:
+            prefix = network(addr, width, length)
+            self.journal.append(width, prefix, length, expires)
+
+        ip_range = context.ip_range(
+            self.ip_func, request, self.prefixes[32], self.prefixes[128]
+        )
+        metrics = self.metrics
+        if metrics is None:
+            for reporter in self.reporters:
+                await reporter(request, ip_range)
+            return
+
+        metrics.jailed.inc()
         for reporter in self.reporters:
-            await reporter(request, ip_range)
+            await metrics.report(reporter, request, ip_range)
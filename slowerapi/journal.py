@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+import typing
+
+MAGIC = b"SLWRJAL1"
+HEADER = struct.Struct("<8sQ")  # magic, entries
+RECORD = struct.Struct("<BB16sd")  # address width, prefix length, prefix, expires
+
+Entry = tuple[int, int, int, float]  # address width, prefix, prefix length, expires
+
+
+def _pack(width: int, prefix: int, length: int, expires: float) -> bytes:
+    return RECORD.pack(width, length, prefix.to_bytes(16, "big"), expires)
+
+
+def _unpack(buffer: typing.Any) -> list[Entry]:
+    return [
+        (width, int.from_bytes(prefix, "big"), length, expires)
+        for width, length, prefix, expires in RECORD.iter_unpack(buffer)
+    ]
+
+
+class JailJournal:
+    # jail entries on disk: `path` holds a compacted snapshot and `path.log` an
+    # append-only log of the entries since. every worker opening the same path
+    # shares both, the log is folded into the snapshot once it holds
+    # `compact_after` records. append never blocks and never compacts, it runs
+    # on the event loop; read and compact may run in a thread, on their own
+    # file descriptor so their locks do not mix with append's. close waits
+    # for a read or compaction still running in a thread.
+    def __init__(
+        self, path: str, compact_after: int = 1024, sync_interval: float = 5.0
+    ) -> None:
+        self.path = path
+        self.compact_after = compact_after
+        self.sync_interval = sync_interval
+        self.time_func = time.time
+
+        flags = os.O_RDWR | os.O_APPEND | os.O_CREAT
+        self._log = os.open(f"{path}.log", flags, 0o600)
+        self._reader = os.open(f"{path}.log", os.O_RDWR)
+        self._pending: list[bytes] = []  # records waiting for the lock
+        self._snapshot: tuple[int, int] | None = None  # inode and mtime read last
+        self._offset = 0  # bytes of the log read so far
+        self._io = threading.Lock()  # held by read, compact and close
+        self._closed = False
+
+    def _stat_snapshot(self) -> tuple[int, int] | None:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _read_snapshot(self) -> list[Entry]:
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            return []
+        try:
+            if os.fstat(fd).st_size < HEADER.size:
+                return []
+            with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+                magic, count = HEADER.unpack_from(mm)
+                if magic != MAGIC:
+                    raise ValueError(f"{self.path} is not a jail snapshot")
+                end = HEADER.size + count * RECORD.size
+                with memoryview(mm) as view:
+                    return _unpack(view[HEADER.size : end])
+        finally:
+            os.close(fd)
+
+    def _read_log(self, offset: int) -> tuple[list[Entry], int]:
+        size = os.fstat(self._reader).st_size
+        size -= (size - offset) % RECORD.size  # a record still being written
+        if size <= offset:
+            return [], offset
+        return _unpack(os.pread(self._reader, size - offset, offset)), size
+
+    def read(self) -> list[Entry]:
+        # entries added since the last read, all of them after a compaction
+        with self._io:
+            fcntl.flock(self._reader, fcntl.LOCK_SH)
+            try:
+                entries = []
+                snapshot = self._stat_snapshot()
+                if snapshot != self._snapshot:  # first read or compacted since
+                    entries = self._read_snapshot()
+                    self._snapshot = snapshot
+                    self._offset = 0
+                log, self._offset = self._read_log(self._offset)
+                return entries + log
+            finally:
+                fcntl.flock(self._reader, fcntl.LOCK_UN)
+
+    def append(self, width: int, prefix: int, length: int, expires: float) -> None:
+        self._pending.append(_pack(width, prefix, length, expires))
+        self.flush()
+
+    def flush(self, block: bool = False) -> None:
+        # writes pending records, unless a compaction holds the lock and
+        # `block` is False: they are written by the next append or flush then
+        if not self._pending:
+            return
+        try:
+            fcntl.flock(self._log, fcntl.LOCK_SH | (0 if block else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return
+        try:
+            # O_APPEND keeps concurrent writers from interleaving records
+            os.write(self._log, b"".join(self._pending))
+            self._pending.clear()
+        finally:
+            fcntl.flock(self._log, fcntl.LOCK_UN)
+
+    def should_compact(self) -> bool:
+        return os.fstat(self._log).st_size >= self.compact_after * RECORD.size
+
+    def compact(self, min_records: int = 0) -> None:
+        with self._io:
+            self._compact(min_records)
+
+    def _compact(self, min_records: int) -> None:
+        fcntl.flock(self._reader, fcntl.LOCK_EX)
+        try:
+            log, _ = self._read_log(0)
+            if len(log) < min_records:
+                return  # another worker compacted first
+
+            now = self.time_func()
+            live: dict[tuple[int, int, int], float] = {}
+            for width, prefix, length, expires in self._read_snapshot() + log:
+                if expires > now and expires > live.get((width, prefix, length), 0):
+                    live[width, prefix, length] = expires
+
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(HEADER.pack(MAGIC, len(live)))
+                for (width, prefix, length), expires in live.items():
+                    f.write(_pack(width, prefix, length, expires))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            os.ftruncate(self._reader, 0)
+        finally:
+            fcntl.flock(self._reader, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        with self._io:
+            if self._closed:
+                return
+            self._closed = True
+            self.flush(block=True)
+            os.close(self._log)
+            os.close(self._reader)
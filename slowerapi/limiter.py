@@ -1,86 +1,383 @@
+import logging
+import os
 import typing
 
 from fastapi import Request
+from starlette.responses import JSONResponse, Response
+from starlette.types import Scope
 
+from .adaptive import LoadShedder
+from .concurrency import ConcurrencyLimit
+from .expiry import ExpiryEngine
+from .group import LimitGroup
+from .hitters import HeavyHitter, HeavyHitters, HeavyHittersFactory
 from .jail import Jail
 from .limit import Limit, LimitType, parse_limits
-from .strategy import MovingWindowStrategy, Ratelimited, Strategy
+from .metrics import Metrics
+from .routing import Cost, HandlerFunc, RouteIndex, RoutePlan
+from .snapshot import read_snapshot, write_snapshot
+from .storage import Hit, Storage
+from .strategy import MovingWindowStrategy, Ratelimited, Strategy, StrategyFactory
 
 KeyFunc = typing.Callable[[Request], str]
 P = typing.ParamSpec("P")
 R = typing.TypeVar("R")
+logger = logging.getLogger(__name__)
+MAX_TOP_KEYS = 1000  # the most keys top_keys_endpoint returns per bucket
 # I can't do this for some reason because mypy is stupid
 # DecoratedFunc = typing.Callable[P, R]
 
 
+def most_restrictive(
+    ratelimit: Ratelimited | None, ratelimited: Ratelimited
+) -> Ratelimited:
+    # 1. first cycle, ratelimit is None
+    # 2. this is limited and the current one isnt
+    # 3. this one resets later
+    # 4. this one has less calls remaining
+    if (
+        ratelimit is None
+        or (not ratelimit.limited and ratelimited.limited)
+        or (
+            ratelimit.limited
+            and ratelimited.limited
+            and ratelimit.reset_after < ratelimited.reset_after
+        )
+        or (not ratelimit.limited and ratelimit.remaining > ratelimited.remaining)
+    ):
+        return ratelimited
+    return ratelimit
+
+
 class Limiter:
     route_only_count_failed: set[str]
     route_limits: dict[str, list[Limit]]
+    route_costs: dict[str, Cost]
+    route_concurrency: dict[str, list[ConcurrencyLimit]]
+    route_shed_below: dict[str, float]
     global_limits: list[Limit]
+    global_concurrency: list[ConcurrencyLimit]
     jail: Jail | None
     buckets: dict[str, Strategy]
+    _groups: dict[str, LimitGroup]
+    storage: Storage | None
+    expiry: ExpiryEngine | None
+    metrics: Metrics | None
+    heavy_hitters: HeavyHittersFactory | None
+    shedder: LoadShedder | None
+    hitters: dict[str, HeavyHitters]
+    _route_index: RouteIndex | None
 
     def __init__(
         self,
         key_func: KeyFunc,
         global_limits: typing.Sequence[LimitType] | None = None,
         jail: Jail | None = None,
-        strategy: typing.Type[Strategy] = MovingWindowStrategy,
+        strategy: StrategyFactory = MovingWindowStrategy,
         enabled: bool = True,
         only_count_failed: bool = False,
+        storage: Storage | None = None,
+        max_keys: int | None = None,
+        expiry: ExpiryEngine | None = None,
+        metrics: Metrics | None = None,
+        heavy_hitters: HeavyHittersFactory | None = None,
+        snapshot_path: str | None = None,
+        shedder: LoadShedder | None = None,
     ) -> None:
+        if storage is not None:
+            # storages count fixed windows on their own, these would do nothing
+            ignored = [
+                name
+                for name, used in (
+                    ("strategy", strategy is not MovingWindowStrategy),
+                    ("max_keys", max_keys is not None),
+                    ("expiry", expiry is not None),
+                    ("snapshot_path", snapshot_path is not None),
+                )
+                if used
+            ]
+            if ignored:
+                raise ValueError(
+                    f"{', '.join(ignored)} cannot be used with storage, "
+                    "storages count fixed windows"
+                )
+
         self.key_func = key_func
         self.route_limits = {}
+        self.route_costs = {}
+        self.route_concurrency = {}
+        self.route_shed_below = {}
         self.route_only_count_failed = set()
         self.global_only_count_failed = only_count_failed
         self.global_limits = parse_limits(global_limits) if global_limits else []
+        self.global_concurrency = []
         self.jail = jail
         self.strategy = strategy
         self.enabled = enabled
         self.buckets = {}
+        self._groups = {}
+        self.storage = storage
+        self.max_keys = max_keys
+        self.expiry = expiry
+        self.metrics = metrics
+        self.heavy_hitters = heavy_hitters
+        self.hitters = {}
+        self.snapshot_path = snapshot_path
+        self.shedder = shedder
+        self._route_index = None
+        if metrics is not None:
+            metrics.bind(self)
 
     def check_bucket(
-        self, bucket: str, key: str, limits: list[Limit], increase: bool
+        self,
+        bucket: str,
+        key: str,
+        limits: list[Limit],
+        increase: bool,
+        cost: int = 1,
+    ) -> Ratelimited | None:
+        group = self._groups.get(bucket, None)
+        if group is None or not group.is_for(limits):
+            self._groups[bucket] = group = self.group(bucket, limits)
+        ratelimited = group.check(key, increase, cost)
+        heavy_hitters = self.heavy_hitters
+        if heavy_hitters is not None and increase:
+            self._track(heavy_hitters, bucket, key, cost)
+        if self.metrics is not None and ratelimited is not None:
+            result = "limited" if ratelimited.limited else "allowed"
+            self.metrics.checks.inc((bucket, result))
+        return ratelimited
+
+    def _track(
+        self, factory: HeavyHittersFactory, bucket: str, key: str, cost: int
+    ) -> None:
+        hitters = self.hitters.get(bucket, None)
+        if hitters is None:
+            self.hitters[bucket] = hitters = factory()
+        hitters.add(key, cost)
+
+    # the keys with the most hits in `bucket` lately, heaviest first. needs
+    # `heavy_hitters`, empty for buckets without hits.
+    def top_keys(self, bucket: str, n: int = 10) -> list[HeavyHitter]:
+        hitters = self.hitters.get(bucket, None)
+        return [] if hitters is None else hitters.top(n)
+
+    async def top_keys_endpoint(self, request: Request) -> Response:
+        try:
+            n = int(request.query_params.get("n", 10))
+        except ValueError:
+            return JSONResponse({"detail": "n must be an integer"}, 400)
+        n = min(max(n, 0), MAX_TOP_KEYS)
+        bucket = request.query_params.get("bucket", None)
+        buckets = list(self.hitters) if bucket is None else [bucket]
+        return JSONResponse(
+            {
+                name: [hitter._asdict() for hitter in self.top_keys(name, n)]
+                for name in buckets
+            }
+        )
+
+    def group(self, bucket: str, limits: list[Limit]) -> LimitGroup:
+        strategies = [
+            self._bucket(f"{bucket}:{limit.requests}/{limit.window}", limit)
+            for limit in limits
+        ]
+        return LimitGroup(bucket, limits, strategies)
+
+    def _bucket(self, name: str, limit: Limit) -> Strategy:
+        b = self.buckets.get(name, None)
+        if b is None:
+            if self.max_keys is None:
+                b = self.strategy(limit, name)
+            else:  # a keyword, partials may set it too
+                b = self.strategy(limit, name, max_keys=self.max_keys)
+            self.buckets[name] = b
+            b.expiry = self.expiry
+        return b
+
+    # writes the state of every bucket to `fp`, returns the number of keys
+    def snapshot(self, fp: typing.BinaryIO) -> int:
+        return write_snapshot(fp, list(self.buckets.values()))
+
+    # loads a snapshot into the buckets, keys that expired since are skipped.
+    # returns the number of keys restored.
+    def restore(self, fp: typing.BinaryIO) -> int:
+        return read_snapshot(fp, self._bucket)
+
+    def _restore_path(self, path: str) -> None:
+        try:
+            with open(path, "rb", buffering=1 << 20) as fp:
+                restored = self.restore(fp)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            logger.warning("restoring %s failed", path, exc_info=True)
+            return
+        logger.info("restored %d keys from %s", restored, path)
+
+    def _snapshot_path(self, path: str) -> None:
+        # written next to it first, so a crash never leaves half a snapshot
+        temp = f"{path}.tmp"
+        try:
+            with open(temp, "wb", buffering=1 << 20) as fp:
+                saved = self.snapshot(fp)
+            os.replace(temp, path)
+        except OSError:
+            # the rest of the shutdown still has to run
+            logger.warning("writing snapshot %s failed", path, exc_info=True)
+            return
+        logger.info("saved %d keys to %s", saved, path)
+
+    async def startup(self) -> None:
+        if self.snapshot_path is not None:
+            self._restore_path(self.snapshot_path)
+        if self.expiry is not None:
+            self.expiry.start()
+        if self.jail is not None:
+            await self.jail.startup()
+        if self.storage is not None:
+            await self.storage.startup()
+        if self.shedder is not None:
+            self.shedder.start()
+
+    async def shutdown(self) -> None:
+        if self.snapshot_path is not None:
+            self._snapshot_path(self.snapshot_path)
+        if self.expiry is not None:
+            await self.expiry.stop()
+        if self.jail is not None:
+            await self.jail.shutdown()
+        if self.storage is not None:
+            await self.storage.shutdown()
+        if self.shedder is not None:
+            await self.shedder.stop()
+
+    @property
+    def evictions(self) -> int:
+        return sum(bucket.evictions for bucket in self.buckets.values())
+
+    async def hit(
+        self,
+        bucket: str,
+        key: str,
+        limits: list[Limit],
+        increase: bool,
+        cost: int = 1,
+    ) -> Ratelimited | None:
+        if self.storage is None:
+            return self.check_bucket(bucket, key, limits, increase, cost)
+
+        results = await self.storage.hit(bucket, key, limits, increase, cost)
+        return self._combine(bucket, key, results, increase, cost)
+
+    # the buckets of one request. with a storage they are all sent in one
+    # call (one round-trip for RedisStorage), so every bucket is counted.
+    # without, buckets after the first limited one are not checked and left
+    # out of the results.
+    async def hit_many(
+        self, hits: typing.Sequence[Hit], increase: bool
+    ) -> list[Ratelimited | None]:
+        ratelimits: list[Ratelimited | None] = []
+        if self.storage is None:
+            for bucket, key, limits, cost in hits:
+                # the same list every time, so its LimitGroup is reused
+                limits = typing.cast("list[Limit]", limits)
+                ratelimited = self.check_bucket(bucket, key, limits, increase, cost)
+                ratelimits.append(ratelimited)
+                if ratelimited is not None and ratelimited.limited:
+                    break
+            return ratelimits
+
+        results = await self.storage.hit_many(hits, increase)
+        for (bucket, key, _, cost), bucket_results in zip(hits, results):
+            ratelimits.append(
+                self._combine(bucket, key, bucket_results, increase, cost)
+            )
+        return ratelimits
+
+    def _combine(
+        self,
+        bucket: str,
+        key: str,
+        results: list[Ratelimited],
+        increase: bool,
+        cost: int,
     ) -> Ratelimited | None:
         ratelimit = None
-        for limit in limits:
-            limit_bucket = f"{bucket}:{limit.requests}/{limit.window}"
-            b = self.buckets.get(limit_bucket, None)
-            if b is None:
-                self.buckets[limit_bucket] = b = self.strategy(limit)
-
-            ratelimited = b.limit(key, increase)
-            # 1. first cycle, ratelimit is None
-            # 2. this is limited and the current one isnt
-            # 3. this one resets later
-            # 4. this one has less calls remaining
-            if (
-                ratelimit is None
-                or (not ratelimit.limited and ratelimited.limited)
-                or (
-                    ratelimit.limited
-                    and ratelimited.limited
-                    and ratelimit.reset_after < ratelimited.reset_after
-                )
-                or (
-                    not ratelimit.limited
-                    and ratelimit.remaining > ratelimited.remaining
-                )
-            ):
-                ratelimit = ratelimited
+        for ratelimited in results:
+            ratelimit = most_restrictive(ratelimit, ratelimited)
+        heavy_hitters = self.heavy_hitters
+        if heavy_hitters is not None and increase:
+            self._track(heavy_hitters, bucket, key, cost)
+        if self.metrics is not None and ratelimit is not None:
+            result = "limited" if ratelimit.limited else "allowed"
+            self.metrics.checks.inc((bucket, result))
         return ratelimit
 
+    def route_plan(self, scope: Scope) -> RoutePlan | None:
+        routes = scope["app"].routes
+        index = self._route_index
+        if index is None or not index.is_for(routes):
+            self._route_index = index = RouteIndex(routes, self._make_route_plan)
+        return index.lookup(scope)
+
+    # the route index only notices routes replaced in place when a request
+    # matches the old route, call this after changing app.routes otherwise
+    def invalidate_routes(self) -> None:
+        self._route_index = None
+
+    def _make_route_plan(self, handler: HandlerFunc) -> RoutePlan:
+        name = f"{handler.__module__}.{handler.__name__}"
+        return RoutePlan(
+            name,
+            self.route_limits.get(name, []),
+            self.global_only_count_failed or name in self.route_only_count_failed,
+            self.route_costs.get(name, 1),
+            self.route_concurrency.get(name, ()),
+            self.route_shed_below.get(name, 0.0),
+        )
+
     def add_global_limit(self, limit: LimitType, *limits: LimitType) -> None:
         parsed_limits = parse_limits((limit, *limits))
         self.global_limits.extend(parsed_limits)
 
+    def add_global_concurrency(
+        self,
+        limit: int,
+        per_key: bool = False,
+        queue_timeout: float = 0.0,
+        max_queue: int = 1024,
+    ) -> None:
+        self.global_concurrency.append(
+            ConcurrencyLimit(limit, per_key, queue_timeout, max_queue)
+        )
+
+    def concurrency(
+        self,
+        limit: int,
+        per_key: bool = False,
+        queue_timeout: float = 0.0,
+        max_queue: int = 1024,
+    ) -> typing.Callable[[typing.Callable[P, R]], typing.Callable[P, R]]:
+        concurrency_limit = ConcurrencyLimit(limit, per_key, queue_timeout, max_queue)
+
+        def wrapper(func: typing.Callable[P, R]) -> typing.Callable[P, R]:
+            name = f"{func.__module__}.{func.__name__}"
+            self.route_concurrency.setdefault(name, []).append(concurrency_limit)
+            self._route_index = None
+            return func
+
+        return wrapper
+
     def limit(
-        self, limit: LimitType, *limits: LimitType
+        self, limit: LimitType, *limits: LimitType, cost: Cost | None = None
     ) -> typing.Callable[[typing.Callable[P, R]], typing.Callable[P, R]]:
         parsed_limits = parse_limits((limit, *limits))
 
         def wrapper(func: typing.Callable[P, R]) -> typing.Callable[P, R]:
             name = f"{func.__module__}.{func.__name__}"
+            if cost is not None:
+                self.route_costs[name] = cost
 
             current_limits = self.route_limits.get(name, None)
             if current_limits is None:
@@ -88,6 +385,19 @@ class Limiter:
             else:
                 current_limits.extend(parsed_limits)
 
+            self._route_index = None
+            return func
+
+        return wrapper
+
+    def sheddable(
+        self, below: float = 1.0
+    ) -> typing.Callable[[typing.Callable[P, R]], typing.Callable[P, R]]:
+        # rejected while a LoadShedder's factor is below `below`
+        def wrapper(func: typing.Callable[P, R]) -> typing.Callable[P, R]:
+            name = f"{func.__module__}.{func.__name__}"
+            self.route_shed_below[name] = below
+            self._route_index = None
             return func
 
         return wrapper
@@ -95,4 +405,5 @@ class Limiter:
     def only_count_failed(self, func: typing.Callable[P, R]) -> typing.Callable[P, R]:
         name = f"{func.__module__}.{func.__name__}"
         self.route_only_count_failed.add(name)
+        self._route_index = None
         return func
@@ -0,0 +1,318 @@
+from __future__ import annotations
+
+import functools
+import math
+import time
+import typing
+from bisect import bisect_left
+
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+
+from .jail import IPJail
+from .reporters.queue import ReportQueue
+
+if typing.TYPE_CHECKING:  # pragma: no cover
+    from .adaptive import LoadShedder
+    from .concurrency import ConcurrencyLimit
+    from .jail import ReportFunc
+    from .limiter import Limiter
+
+Labels = tuple[str, ...]
+# called with the metric name, labels and value of every increment and
+# observation, e.g. to forward them to statsd
+MetricsCallback = typing.Callable[[str, dict[str, str], float], None]
+
+# a route can have several concurrency limits, told apart by their position
+CONCURRENCY_LABELS = ("limit", "index", "max", "per_key")
+
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)  # fmt: skip
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Labels, values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    # values only change on the event loop thread, so there are no locks
+    kind = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        label_names: Labels = (),
+        callbacks: list[MetricsCallback] | None = None,
+    ) -> None:
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.callbacks = callbacks if callbacks is not None else []
+
+    def _notify(self, labels: Labels, value: float) -> None:
+        named = dict(zip(self.label_names, labels))
+        for callback in self.callbacks:
+            callback(self.name, named, value)
+
+    def samples(self) -> typing.Iterator[str]:
+        raise NotImplementedError  # pragma: no cover
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.kind}",
+            *self.samples(),
+        ]
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+    kind = "counter"
+    values: dict[Labels, float]
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        label_names: Labels = (),
+        callbacks: list[MetricsCallback] | None = None,
+    ) -> None:
+        super().__init__(name, description, label_names, callbacks)
+        self.values = {}
+
+    def inc(self, labels: Labels = (), value: float = 1) -> None:
+        values = self.values
+        values[labels] = values.get(labels, 0) + value
+        if self.callbacks:
+            self._notify(labels, value)
+
+    # for totals counted elsewhere, copied in when metrics are collected
+    def set(self, labels: Labels, value: float) -> None:
+        self.values[labels] = value
+
+    def samples(self) -> typing.Iterator[str]:
+        for labels, value in self.values.items():
+            yield (
+                f"{self.name}{_format_labels(self.label_names, labels)} "
+                f"{_format_value(value)}"
+            )
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+    counts: dict[Labels, list[int]]
+    sums: dict[Labels, float]
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        label_names: Labels = (),
+        callbacks: list[MetricsCallback] | None = None,
+        buckets: typing.Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, description, label_names, callbacks)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = {}
+        self.sums = {}
+
+    def observe(self, labels: Labels, value: float) -> None:
+        counts = self.counts.get(labels, None)
+        if counts is None:
+            # one count per bucket and one past the last, not cumulative
+            self.counts[labels] = counts = [0] * (len(self.buckets) + 1)
+            self.sums[labels] = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self.sums[labels] += value
+        if self.callbacks:
+            self._notify(labels, value)
+
+    def samples(self) -> typing.Iterator[str]:
+        names = self.label_names
+        for labels, counts in self.counts.items():
+            total = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                total += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(names, labels, le)} {total}"
+            formatted = _format_labels(names, labels)
+            yield f"{self.name}_sum{formatted} {_format_value(self.sums[labels])}"
+            yield f"{self.name}_count{formatted} {total}"
+
+
+class Metrics:
+    # counters and histograms of what the limiter does, off unless passed to
+    # the Limiter. hot paths only increment; key counts, queue sizes and other
+    # state are read when the metrics are rendered, by the collectors.
+    metrics: list[Metric]
+    collectors: list[typing.Callable[[], None]]
+    callbacks: list[MetricsCallback]
+
+    def __init__(self, callbacks: list[MetricsCallback] | None = None) -> None:
+        self.metrics = []
+        self.collectors = []
+        self.callbacks = callbacks if callbacks is not None else []
+        self.time_func = time.perf_counter
+
+        self.checks = self.counter(
+            "slowerapi_checks_total", "Limit checks by bucket.", ("bucket", "result")
+        )
+        self.requests = self.counter(
+            "slowerapi_requests_total", "Requests by outcome.", ("result",)
+        )
+        self.overhead = self.histogram(
+            "slowerapi_middleware_seconds",
+            "Time spent in the middleware before the app or rejecting.",
+            ("result",),
+        )
+        self.jailed = self.counter("slowerapi_jailed_total", "Ranges jailed.")
+        self.reports = self.counter(
+            "slowerapi_reports_total", "Reporter calls.", ("reporter", "result")
+        )
+        self.report_time = self.histogram(
+            "slowerapi_report_seconds", "Reporter call latency.", ("reporter",)
+        )
+        self.keys = self.gauge(
+            "slowerapi_keys", "Keys held per limit bucket.", ("bucket",)
+        )
+        self.evictions = self.counter(
+            "slowerapi_evictions_total", "Keys evicted per limit bucket.", ("bucket",)
+        )
+        self.jail_ranges = self.gauge(
+            "slowerapi_jail_ranges", "Jailed ranges.", ("family",)
+        )
+        self.concurrency_rejected = self.counter(
+            "slowerapi_concurrency_rejected_total",
+            "Requests rejected by concurrency limits.",
+            CONCURRENCY_LABELS,
+        )
+        self.concurrency_queued = self.gauge(
+            "slowerapi_concurrency_queued",
+            "Requests waiting for a concurrency slot.",
+            CONCURRENCY_LABELS,
+        )
+        self.shed_factor = self.gauge(
+            "slowerapi_shed_factor", "Load shedding factor, 1 when not shedding."
+        )
+        self.event_loop_lag = self.gauge(
+            "slowerapi_event_loop_lag_seconds", "Last measured event loop lag."
+        )
+        self.queue = self.gauge(
+            "slowerapi_report_queue", "Report queue state.", ("state",)
+        )
+
+    def _add(self, metric: Metric) -> None:
+        self.metrics.append(metric)
+
+    def counter(
+        self, name: str, description: str, label_names: Labels = ()
+    ) -> Counter:
+        metric = Counter(name, description, label_names, self.callbacks)
+        self._add(metric)
+        return metric
+
+    def gauge(self, name: str, description: str, label_names: Labels = ()) -> Gauge:
+        metric = Gauge(name, description, label_names, self.callbacks)
+        self._add(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        label_names: Labels = (),
+        buckets: typing.Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        metric = Histogram(name, description, label_names, self.callbacks, buckets)
+        self._add(metric)
+        return metric
+
+    async def report(
+        self, reporter: ReportFunc, request: Request, ip_range: str
+    ) -> None:
+        name = getattr(reporter, "__qualname__", type(reporter).__name__)
+        start = self.time_func()
+        try:
+            await reporter(request, ip_range)
+        except BaseException:
+            self.reports.inc((name, "error"))
+            raise
+        else:
+            self.reports.inc((name, "ok"))
+        finally:
+            self.report_time.observe((name,), self.time_func() - start)
+
+    def bind(self, limiter: Limiter) -> None:
+        jail = limiter.jail
+        if jail is not None:
+            jail.metrics = self
+            for reporter in getattr(jail, "reporters", ()):
+                if isinstance(reporter, ReportQueue):
+                    reporter.metrics = self
+                    self.collectors.append(functools.partial(self._queue, reporter))
+        if limiter.shedder is not None:
+            self.collectors.append(functools.partial(self._shedder, limiter.shedder))
+        self.collectors.append(lambda: self._limiter(limiter))
+
+    def _shedder(self, shedder: LoadShedder) -> None:
+        self.shed_factor.set((), shedder.factor)
+        self.event_loop_lag.set((), shedder.lag)
+
+    def _limiter(self, limiter: Limiter) -> None:
+        for bucket, strategy in limiter.buckets.items():
+            self.keys.set((bucket,), strategy.key_count())
+            self.evictions.set((bucket,), strategy.evictions)
+
+        routes: list[tuple[str, list[ConcurrencyLimit]]] = [
+            ("global", limiter.global_concurrency),
+            *limiter.route_concurrency.items(),
+        ]
+        for name, limits in routes:
+            for index, limit in enumerate(limits):
+                per_key = "true" if limit.per_key else "false"
+                labels = (name, str(index), str(limit.limit), per_key)
+                self.concurrency_rejected.set(labels, limit.rejected)
+                self.concurrency_queued.set(labels, limit.queued)
+
+        if isinstance(limiter.jail, IPJail):
+            ranges = limiter.jail.ranges()
+            self.jail_ranges.set(("ipv4",), ranges[32])
+            self.jail_ranges.set(("ipv6",), ranges[128])
+
+    def _queue(self, queue: ReportQueue) -> None:
+        for state in ("reported", "failed", "retried", "dropped", "duplicates"):
+            self.queue.set((state,), getattr(queue, state))
+        self.queue.set(("pending",), queue.pending)
+        self.queue.set(("in_flight",), queue.in_flight)
+        self.queue.set(("high_water",), queue.high_water)
+
+    def render(self) -> str:
+        for collect in self.collectors:
+            collect()
+        return "".join(metric.render() for metric in self.metrics)
+
+    # mount as a route, e.g. Route("/metrics", metrics.endpoint)
+    async def endpoint(self, request: Request) -> Response:
+        return PlainTextResponse(
+            self.render(), media_type="text/plain; version=0.0.4"
+        )
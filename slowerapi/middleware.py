@@ -1,150 +1,200 @@
-import typing
-from datetime import datetime
-
 from starlette.applications import Starlette
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
 from starlette.requests import Request
-from starlette.responses import JSONResponse, Response
-from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from .concurrency import ConcurrencyLimit
+from .context import get_context
 from .limit import Limit
 from .limiter import Limiter
+from .metrics import Metrics
+from .responses import ResponseFactory
+from .storage import Hit
 from .strategy import Ratelimited
 
-HandlerFunc = typing.Callable[..., typing.Any]
-
 
-class RatelimitMiddleware(BaseHTTPMiddleware):
-    async def dispatch(
-        self, request: Request, call_next: RequestResponseEndpoint
-    ) -> Response:
-        app: Starlette = request.app
+class RatelimitMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        responses: ResponseFactory | None = None,
+        close_jailed: bool = False,
+    ) -> None:
+        self.app = app
+        self.close_jailed = close_jailed
+        self.responses = responses if responses is not None else ResponseFactory()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        app: Starlette = scope["app"]
         limiter: Limiter | None = getattr(app.state, "limiter", None)
         if limiter is None or not limiter.enabled:
-            return await call_next(request)
-
+            await self.app(scope, receive, send)
+            return
+
+        await self._dispatch(scope, receive, send, limiter)
+
+    # requests are rejected from the scope alone, before `receive` is called,
+    # so their body is never read (with `Expect: 100-continue` never even sent)
+    async def _dispatch(
+        self, scope: Scope, receive: Receive, send: Send, limiter: Limiter
+    ) -> None:
+        metrics = limiter.metrics
+        start = metrics.time_func() if metrics is not None else 0.0
+        request = Request(scope, receive)
         if limiter.jail is not None and limiter.jail.is_jailed(request):
-            return self._make_jailed_response()
+            self._record(metrics, "jailed", start)
+            await self._make_jailed_response()(scope, receive, send)
+            return
 
         ratelimited = None
-        key = limiter.key_func(request)
+        context = get_context(request)
+        context.key = key = context.memo(limiter.key_func, request)
 
         all_requests = (
             not limiter.global_only_count_failed and not limiter.route_only_count_failed
         )
 
-        if limiter.global_limits:
-            response, ratelimited = await self._is_ratelimited(
-                limiter, request, "global", key, limiter.global_limits, all_requests
-            )
-            if response:
-                return response
-
-        handler: HandlerFunc | None = None
-        for route in app.routes:
-            match, _ = route.matches(request.scope)
-            if match == Match.FULL and hasattr(route, "endpoint"):
-                handler = route.endpoint  # type: ignore
+        plan = limiter.route_plan(scope)
+        # the route's cost counts against the global limits too
+        cost = 1
+        if plan is not None:
+            cost = plan.cost if isinstance(plan.cost, int) else plan.cost(request)
+
+        shedder = limiter.shedder
+        if shedder is not None:
+            if shedder.factor < 1:
+                if plan is not None and shedder.factor < plan.shed_below:
+                    shedder.shed += 1
+                    self._record(metrics, "shed", start)
+                    await self._make_shed_response()(scope, receive, send)
+                    return
+                cost = shedder.scale(cost)
 
         route_name = route_limits = None
-        if handler is not None:
-            route_name = f"{handler.__module__}.{handler.__name__}"
-            route_limits = limiter.route_limits.get(route_name, None)
-            only_count_failed = (
-                limiter.global_only_count_failed
-                or route_name in limiter.route_only_count_failed
-            )
-            if not all_requests and not only_count_failed:
-                response, ratelimited = await self._is_ratelimited(
-                    limiter, request, "global", key, limiter.global_limits, True
-                )
-                if response:
-                    return response
-
-            if route_limits:
-                response, ratelimited = await self._is_ratelimited(
-                    limiter,
-                    request,
-                    route_name,
-                    key,
-                    route_limits,
-                    not only_count_failed,
-                )
-                if response:
-                    return response
-
-        else:
-            only_count_failed = limiter.global_only_count_failed
-
-        response = await call_next(request)
-
-        if only_count_failed and response.status_code >= 400:  # request failed
-            rt_response, ratelimited = await self._is_ratelimited(
-                limiter, request, "global", key, limiter.global_limits, True
+        only_count_failed = limiter.global_only_count_failed
+        if plan is not None:
+            route_name, route_limits, only_count_failed = plan[:3]
+
+        hits = self._hits(limiter, key, route_name, route_limits, cost)
+        if hits:
+            # counted up front, unless the route only counts failed requests
+            increase = all_requests or (plan is not None and not only_count_failed)
+            response, ratelimited = await self._is_ratelimited(
+                limiter, request, hits, increase
             )
-            if rt_response:
-                return rt_response
-
-            if handler is not None and route_name and route_limits:
-                rt_response, ratelimited = await self._is_ratelimited(
-                    limiter, request, route_name, key, route_limits, True
-                )
-                if rt_response:
-                    return rt_response
-
-        if ratelimited:
-            self._add_headers(response, ratelimited)
-        return response
+            if response:
+                self._record(metrics, "limited", start)
+                await response(scope, receive, send)
+                return
+
+        replaced = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal ratelimited, replaced
+            if replaced:  # the app response was swapped for a 429
+                return
+
+            if message["type"] == "http.response.start":
+                # request failed, count it now that the status is known
+                if only_count_failed and message["status"] >= 400:
+                    rt_response, ratelimited = await self._is_ratelimited(
+                        limiter,
+                        request,
+                        self._hits(limiter, key, route_name, route_limits, cost),
+                        True,
+                    )
+                    if rt_response:
+                        replaced = True
+                        await rt_response(scope, receive, send)
+                        return
+
+                if ratelimited:
+                    message["headers"] = [
+                        *message.get("headers", ()),
+                        *self.responses.headers(ratelimited),
+                    ]
+
+            await send(message)
+
+        # hold a slot of every concurrency limit until the app is done
+        concurrency = limiter.global_concurrency
+        if plan is not None and plan.concurrency:
+            concurrency = [*concurrency, *plan.concurrency]
+        held = 0
+        if shedder is not None:
+            shedder.in_flight += 1
+        try:
+            for concurrency_limit in concurrency:
+                if not await concurrency_limit.acquire(key):
+                    self._record(metrics, "concurrency", start)
+                    response = self._make_concurrency_response(concurrency_limit)
+                    await response(scope, receive, send)
+                    return
+                held += 1
+
+            self._record(metrics, "allowed", start)
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            for concurrency_limit in concurrency[:held]:
+                concurrency_limit.release(key)
+            if shedder is not None:
+                shedder.in_flight -= 1
+
+    def _record(self, metrics: Metrics | None, result: str, start: float) -> None:
+        if metrics is not None:
+            metrics.requests.inc((result,))
+            metrics.overhead.observe((result,), metrics.time_func() - start)
+
+    def _hits(
+        self,
+        limiter: Limiter,
+        key: str,
+        route_name: str | None,
+        route_limits: list[Limit] | None,
+        cost: int,
+    ) -> list[Hit]:
+        hits: list[Hit] = []
+        if limiter.global_limits:
+            hits.append(("global", key, limiter.global_limits, cost))
+        if route_name and route_limits:
+            hits.append((route_name, key, route_limits, cost))
+        return hits
 
+    # checks all buckets of the request at once, the first limited one decides
     async def _is_ratelimited(
         self,
         limiter: Limiter,
         request: Request,
-        bucket: str,
-        key: str,
-        limits: list[Limit],
+        hits: list[Hit],
         increase: bool,
-    ) -> tuple[Response | None, Ratelimited | None]:
-        ratelimited = limiter.check_bucket(bucket, key, limits, increase)
-        if ratelimited is None or not ratelimited.limited:
-            return None, ratelimited
-
-        if limiter.jail is not None and limiter.jail.should_jail(request, key, limiter):
-            await limiter.jail.jail(request)
-            return self._make_jailed_response(), ratelimited
-        return self._make_ratelimited_response(ratelimited), ratelimited
-
-    def _make_jailed_response(self) -> Response:
-        return JSONResponse(
-            {
-                "detail": (
-                    "Banned from the API for exceeding allowed limits. "
-                    "Contact system administrators."
-                ),
-            },
-            status_code=429,
-        )
-
-    def _make_ratelimited_response(self, ratelimit: Ratelimited) -> Response:
-        response = JSONResponse(
-            {
-                "detail": (
-                    f"Rate limit exceeded: {ratelimit.limit.requests} "
-                    f"per {ratelimit.limit.window} seconds"
-                ),
-                "retry_after": int(ratelimit.reset_after * 1000),
-            },
-            status_code=429,
-        )
-        self._add_headers(response, ratelimit)
-        return response
-
-    def _add_headers(self, response: Response, ratelimit: Ratelimited) -> None:
-        response.headers["X-Ratelimit-Limit"] = str(ratelimit.limit.requests)
-        response.headers["X-Ratelimit-Remaining"] = str(ratelimit.remaining)
-
-        now_ms = int(datetime.now().timestamp() * 1000)
-        reset_after_ms = int(ratelimit.reset_after * 1000)
-        response.headers["X-Ratelimit-Reset"] = str(now_ms + reset_after_ms)
-
-        response.headers["Retry-After"] = str(reset_after_ms)
+    ) -> tuple[ASGIApp | None, Ratelimited | None]:
+        ratelimited = None
+        for (_, key, _, _), result in zip(hits, await limiter.hit_many(hits, increase)):
+            if result is None:
+                continue
+            ratelimited = result
+            if not result.limited:
+                continue
+
+            if limiter.jail is not None and await limiter.jail.should_jail(
+                request, key, limiter
+            ):
+                await limiter.jail.jail(request)
+                return self._make_jailed_response(), result
+            return self._make_ratelimited_response(result), result
+        return None, ratelimited
+
+    def _make_jailed_response(self) -> ASGIApp:
+        return self.responses.jailed(self.close_jailed)
+
+    def _make_shed_response(self) -> ASGIApp:
+        return self.responses.shed()
+
+    def _make_concurrency_response(self, limit: ConcurrencyLimit) -> ASGIApp:
+        return self.responses.concurrency(limit.limit)
+
+    def _make_ratelimited_response(self, ratelimit: Ratelimited) -> ASGIApp:
+        return self.responses.ratelimited(ratelimit)
@@ -0,0 +1,15 @@
+import typing
+
+
+# reporters that batch or queue have startup and shutdown hooks, plain
+# functions have none
+async def start_reporter(reporter: typing.Any) -> None:
+    startup = getattr(reporter, "startup", None)
+    if startup is not None:
+        await startup()
+
+
+async def stop_reporter(reporter: typing.Any) -> None:
+    shutdown = getattr(reporter, "shutdown", None)
+    if shutdown is not None:
+        await shutdown()
@@ -1,6 +1,40 @@
+from __future__ import annotations
+
+import asyncio
+import ipaddress
+import itertools
+import logging
+import typing
+
 import httpx
 from fastapi import Request
 
+BASE_URL = "https://api.cloudflare.com/client/v4/"
+
+logger = logging.getLogger(__name__)
+
+
+def _auth_headers(email_or_token: str, key: str | None) -> dict[str, str]:
+    if key is not None:
+        return {"x-auth-email": email_or_token, "x-auth-key": key}
+    return {"Authorization": f"Bearer {email_or_token}"}
+
+
+def collapse_ranges(ip_ranges: typing.Iterable[str]) -> list[str]:
+    # merge adjacent and overlapping ranges, the api wants one family at a time
+    v4, v6 = [], []
+    for ip_range in ip_ranges:
+        network = ipaddress.ip_network(ip_range)
+        if isinstance(network, ipaddress.IPv4Network):
+            v4.append(network)
+        else:
+            v6.append(network)
+    return [
+        str(network)
+        for networks in (v4, v6)
+        for network in ipaddress.collapse_addresses(networks)  # type: ignore
+    ]
+
 
 class CloudflareIPAccessRuleReporter:
     def __init__(
@@ -13,12 +47,7 @@ class CloudflareIPAccessRuleReporter:
         self.zone_id = zone_id
         self.note = note
         self.aclient = httpx.AsyncClient(
-            base_url="https://api.cloudflare.com/client/v4/",
-            headers=(
-                {"x-auth-email": email_or_token, "x-auth-key": key}
-                if key is not None
-                else {"Authorization": f"Bearer {email_or_token}"}
-            ),
+            base_url=BASE_URL, headers=_auth_headers(email_or_token, key)
         )
 
     async def __call__(self, request: Request, ip_range: str) -> None:
@@ -40,3 +69,156 @@ class CloudflareIPAccessRuleReporter:
             },
         )
         req.raise_for_status()
+
+
+class CloudflareIPListReporter:
+    # adds ranges to a custom ip list, coalesced into one bulk request per
+    # `batch_size` ranges or `delay` seconds. calls only add the range to the
+    # batch, a background task sends it and polls the bulk operation, retrying
+    # failed batches with exponential backoff. shutdown sends what is left.
+    reported: int
+    failed: int
+
+    def __init__(
+        self,
+        account_id: str,
+        list_id: str,
+        email_or_token: str,
+        key: str | None = None,
+        comment: str | None = None,
+        batch_size: int = 1000,
+        delay: float = 1.0,
+        poll_interval: float = 1.0,
+        poll_timeout: float = 60.0,
+        retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        drain_timeout: float = 10.0,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ) -> None:
+        self.endpoint = f"accounts/{account_id}/rules/lists"
+        self.list_id = list_id
+        self.comment = comment
+        self.batch_size = batch_size
+        self.delay = delay
+        self.poll_interval = poll_interval
+        self.poll_timeout = poll_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.drain_timeout = drain_timeout
+        self.aclient = httpx.AsyncClient(
+            base_url=BASE_URL,
+            headers=_auth_headers(email_or_token, key),
+            transport=transport,
+        )
+        self.reported = self.failed = 0
+
+        self._batch: dict[str, None] = {}
+        self._pending = asyncio.Event()  # a range is waiting
+        self._full = asyncio.Event()  # a whole batch is waiting
+        self._task: asyncio.Task[None] | None = None
+
+    async def __call__(self, request: Request, ip_range: str) -> None:
+        if self._task is None:
+            await self.startup()
+        self._batch[ip_range] = None
+        self._pending.set()
+        if len(self._batch) >= self.batch_size:
+            self._full.set()
+
+    def _take(self) -> list[str]:
+        ip_ranges = list(itertools.islice(self._batch, self.batch_size))
+        for ip_range in ip_ranges:
+            del self._batch[ip_range]
+        if not self._batch:
+            self._pending.clear()
+        if len(self._batch) < self.batch_size:
+            self._full.clear()
+        return ip_ranges
+
+    async def _send_batch(self) -> None:
+        ip_ranges = self._take()
+        try:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    delay = self.backoff * 2 ** (attempt - 1)
+                    await asyncio.sleep(min(delay, self.max_backoff))
+                try:
+                    await self.send(ip_ranges)
+                except Exception:
+                    logger.warning(
+                        "adding %d ranges to the ip list failed",
+                        len(ip_ranges),
+                        exc_info=True,
+                    )
+                else:
+                    self.reported += len(ip_ranges)
+                    return
+        except asyncio.CancelledError:
+            # adding a range twice is harmless, losing it is not
+            for ip_range in ip_ranges:
+                self._batch[ip_range] = None
+            self._pending.set()
+            raise
+        self.failed += len(ip_ranges)
+
+    async def _run(self) -> None:
+        while True:
+            await self._pending.wait()
+            try:
+                await asyncio.wait_for(self._full.wait(), self.delay)
+            except asyncio.TimeoutError:
+                pass
+            await self._send_batch()
+
+    async def flush(self) -> None:
+        while self._batch:
+            await self._send_batch()
+
+    async def startup(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def shutdown(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await asyncio.wait_for(self.flush(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("dropped %d ranges on shutdown", len(self._batch))
+        await self.aclient.aclose()
+
+    async def send(self, ip_ranges: list[str]) -> None:
+        comment = self.comment
+        if comment is None:
+            comment = "Automatic jail."
+        req = await self.aclient.post(
+            f"{self.endpoint}/{self.list_id}/items",
+            json=[{"ip": ip, "comment": comment} for ip in collapse_ranges(ip_ranges)],
+        )
+        req.raise_for_status()
+        operation_id = req.json()["result"]["operation_id"]
+
+        # the list is updated asynchronously, poll until the operation is done
+        deadline = asyncio.get_running_loop().time() + self.poll_timeout
+        while True:
+            req = await self.aclient.get(
+                f"{self.endpoint}/bulk_operations/{operation_id}"
+            )
+            req.raise_for_status()
+            result = req.json()["result"]
+            if result["status"] == "completed":
+                return
+            elif result["status"] == "failed":
+                raise RuntimeError(
+                    f"bulk operation {operation_id} failed: {result.get('error')}"
+                )
+            elif asyncio.get_running_loop().time() > deadline:
+                raise TimeoutError(f"bulk operation {operation_id} timed out")
+            await asyncio.sleep(self.poll_interval)
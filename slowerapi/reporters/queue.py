@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import typing
+from collections import OrderedDict
+
+from fastapi import Request
+
+from . import start_reporter, stop_reporter
+
+if typing.TYPE_CHECKING:  # pragma: no cover
+    from ..jail import ReportFunc
+    from ..metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ReportQueue:
+    # a reporter that hands jailed ranges to `workers` background tasks instead
+    # of reporting them on the request path. ranges already reported (the last
+    # `remember` of them) or still queued are skipped, failed reports are
+    # retried with exponential backoff, a full queue drops new ranges.
+    reported: int
+    failed: int
+    retried: int
+    dropped: int
+    duplicates: int
+    high_water: int
+    metrics: Metrics | None = None
+
+    def __init__(
+        self,
+        reporters: list[ReportFunc],
+        maxsize: int = 1024,
+        workers: int = 4,
+        retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        drain: bool = True,
+        drain_timeout: float = 10.0,
+        remember: int = 10_000,
+    ) -> None:
+        self.reporters = reporters
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.drain = drain
+        self.drain_timeout = drain_timeout
+        self.remember = remember
+        self.reported = self.failed = self.retried = 0
+        self.dropped = self.duplicates = self.high_water = 0
+
+        self._queue: asyncio.Queue[tuple[Request, str]] = asyncio.Queue(maxsize)
+        self._in_flight: set[str] = set()
+        self._done: OrderedDict[str, None] = OrderedDict()
+        self._tasks: list[asyncio.Task[None]] = []
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    async def __call__(self, request: Request, ip_range: str) -> None:
+        if ip_range in self._in_flight or ip_range in self._done:
+            self.duplicates += 1
+            return
+        if not self._tasks:
+            await self.startup()
+        try:
+            self._queue.put_nowait((request, ip_range))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return
+        self._in_flight.add(ip_range)
+        self.high_water = max(self.high_water, self._queue.qsize())
+
+    async def _work(self) -> None:
+        while True:
+            request, ip_range = await self._queue.get()
+            try:
+                await self._report(request, ip_range)
+            finally:
+                self._in_flight.discard(ip_range)
+                self._queue.task_done()
+
+    async def _report(self, request: Request, ip_range: str) -> None:
+        pending = self.reporters
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retried += 1
+                delay = self.backoff * 2 ** (attempt - 1)
+                await asyncio.sleep(min(delay, self.max_backoff))
+
+            failed = []
+            for reporter in pending:
+                try:
+                    if self.metrics is None:
+                        await reporter(request, ip_range)
+                    else:
+                        await self.metrics.report(reporter, request, ip_range)
+                except Exception:
+                    logger.warning("reporting %s failed", ip_range, exc_info=True)
+                    failed.append(reporter)
+            if not failed:
+                self.reported += 1
+                self._done[ip_range] = None
+                if len(self._done) > self.remember:
+                    self._done.popitem(last=False)
+                return
+            pending = failed
+        self.failed += 1
+
+    async def startup(self) -> None:
+        if not self._tasks:
+            for reporter in self.reporters:
+                await start_reporter(reporter)
+            self._tasks = [
+                asyncio.create_task(self._work()) for _ in range(self.workers)
+            ]
+
+    async def shutdown(self) -> None:
+        if self.drain and self._tasks:
+            try:
+                await asyncio.wait_for(self._queue.join(), self.drain_timeout)
+            except asyncio.TimeoutError:
+                pass
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for reporter in self.reporters:
+            await stop_reporter(reporter)
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+import typing
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .limit import Limit
+from .strategy import Ratelimited
+
+RawHeaders = list[tuple[bytes, bytes]]
+JSON_TYPE = (b"content-type", b"application/json")
+# small numbers are encoded once, remaining counts mostly are
+_NUMBERS = [str(i).encode() for i in range(1024)]
+
+
+def encode_int(value: int) -> bytes:
+    if 0 <= value < 1024:
+        return _NUMBERS[value]
+    return str(value).encode()
+
+
+class RawResponse:
+    # a response sent as two ASGI messages, without building a Response
+    __slots__ = ("status", "headers", "body")
+
+    def __init__(self, status: int, headers: RawHeaders, body: bytes) -> None:
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def _headers(self, scope: Scope) -> RawHeaders:
+        return self.headers
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status,
+                # a copy, other middleware may change the list in place
+                "headers": list(self._headers(scope)),
+            }
+        )
+        await send({"type": "http.response.body", "body": self.body})
+
+
+class ClosingResponse(RawResponse):
+    # asks an HTTP/1 server to close the connection after the response, so an
+    # unread request body is dropped instead of drained. HTTP/2 does not allow
+    # the header, the stream is reset there anyway when the body goes unread.
+    __slots__ = ("closing_headers",)
+
+    def __init__(self, status: int, headers: RawHeaders, body: bytes) -> None:
+        super().__init__(status, headers, body)
+        self.closing_headers = [*headers, (b"connection", b"close")]
+
+    def _headers(self, scope: Scope) -> RawHeaders:
+        if scope.get("http_version", "1.1") in ("1.0", "1.1"):
+            return self.closing_headers
+        return self.headers
+
+
+def encode_json(content: typing.Any) -> bytes:
+    # the same encoding as JSONResponse
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode()
+
+
+def json_response(status: int, content: typing.Any) -> RawResponse:
+    body = encode_json(content)
+    return RawResponse(
+        status, [JSON_TYPE, (b"content-length", encode_int(len(body)))], body
+    )
+
+
+class CoarseClock:
+    # the time in milliseconds, read at most once per `resolution` seconds
+    # while it is used. a timer marks it stale, so an idle clock costs nothing.
+    def __init__(self, resolution: float = 0.01) -> None:
+        self.resolution = resolution
+        self.time_func = time.time
+        self._ms = 0
+        self._stale = True
+
+    def _expire(self) -> None:
+        self._stale = True
+
+    def ms(self) -> int:
+        if self._stale:
+            self._ms = int(self.time_func() * 1000)
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return self._ms  # no loop to expire it, read every time
+            self._stale = False
+            loop.call_later(self.resolution, self._expire)
+        return self._ms
+
+
+class ResponseFactory:
+    # the middleware's responses and ratelimit headers. bodies are encoded
+    # once per limit, a 429 only splices in retry_after. subclass and override
+    # the *_content methods to change the bodies, or the response methods to
+    # return any ASGI app.
+    _ratelimited: dict[Limit, tuple[bytes, bytes]]
+    _concurrency: dict[int, RawResponse]
+    _limit_values: dict[int, bytes]
+
+    def __init__(self, clock: CoarseClock | None = None) -> None:
+        self.clock = clock if clock is not None else CoarseClock()
+        self._ratelimited = {}
+        self._concurrency = {}
+        self._limit_values = {}
+        self._jailed = json_response(429, self.jailed_content())
+        self._shed = json_response(503, self.shed_content())
+        jailed = self._jailed
+        self._jailed_closing = ClosingResponse(429, jailed.headers, jailed.body)
+
+    def ratelimited_content(self, limit: Limit) -> dict[str, typing.Any]:
+        return {
+            "detail": (
+                f"Rate limit exceeded: {limit.requests} per {limit.window} seconds"
+            )
+        }
+
+    def jailed_content(self) -> dict[str, typing.Any]:
+        return {
+            "detail": (
+                "Banned from the API for exceeding allowed limits. "
+                "Contact system administrators."
+            ),
+        }
+
+    def shed_content(self) -> dict[str, typing.Any]:
+        return {"detail": "Service overloaded, try again later."}
+
+    def concurrency_content(self, limit: int) -> dict[str, typing.Any]:
+        return {"detail": f"Too many concurrent requests: {limit} at a time"}
+
+    def _ratelimited_parts(self, limit: Limit) -> tuple[bytes, bytes]:
+        # the encoded body around the retry_after value
+        parts = self._ratelimited.get(limit, None)
+        if parts is None:
+            content = {**self.ratelimited_content(limit), "retry_after": 0}
+            body = encode_json(content)
+            marker = b'"retry_after":0'
+            split = body.rindex(marker) + len(marker) - 1
+            self._ratelimited[limit] = parts = body[:split], body[split + 1 :]
+        return parts
+
+    def headers(self, ratelimit: Ratelimited) -> RawHeaders:
+        requests = ratelimit.limit.requests
+        limit = self._limit_values.get(requests, None)
+        if limit is None:
+            self._limit_values[requests] = limit = encode_int(requests)
+        reset_after_ms = int(ratelimit.reset_after * 1000)
+        return [
+            (b"x-ratelimit-limit", limit),
+            (b"x-ratelimit-remaining", encode_int(ratelimit.remaining)),
+            (b"x-ratelimit-reset", encode_int(self.clock.ms() + reset_after_ms)),
+            (b"retry-after", encode_int(reset_after_ms)),
+        ]
+
+    def ratelimited(self, ratelimit: Ratelimited) -> ASGIApp:
+        head, tail = self._ratelimited_parts(ratelimit.limit)
+        body = head + encode_int(int(ratelimit.reset_after * 1000)) + tail
+        headers = self.headers(ratelimit)
+        headers.append(JSON_TYPE)
+        headers.append((b"content-length", encode_int(len(body))))
+        return RawResponse(429, headers, body)
+
+    def jailed(self, close: bool = False) -> ASGIApp:
+        return self._jailed_closing if close else self._jailed
+
+    def shed(self) -> ASGIApp:
+        return self._shed
+
+    def concurrency(self, limit: int) -> ASGIApp:
+        response = self._concurrency.get(limit, None)
+        if response is None:
+            response = json_response(429, self.concurrency_content(limit))
+            self._concurrency[limit] = response
+        return response
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import typing
+from collections import OrderedDict
+
+from starlette.requests import Request
+from starlette.routing import BaseRoute, Match
+from starlette.types import Scope
+
+from .concurrency import ConcurrencyLimit
+from .limit import Limit
+
+HandlerFunc = typing.Callable[..., typing.Any]
+# requests a hit counts as, or a function of the request returning it
+Cost = int | typing.Callable[[Request], int]
+
+
+class RoutePlan(typing.NamedTuple):
+    name: str
+    limits: list[Limit]
+    only_count_failed: bool
+    cost: Cost = 1
+    concurrency: typing.Sequence[ConcurrencyLimit] = ()
+    shed_below: float = 0.0  # rejected while the shed factor is below this
+
+
+PlanFunc = typing.Callable[[HandlerFunc], RoutePlan]
+_Entry = tuple[int, BaseRoute, typing.AbstractSet[str] | None, RoutePlan]
+_MISSING = object()
+
+
+def _first_segment(path: str) -> str:
+    return path[1:].split("/", 1)[0]
+
+
+class RouteIndex:
+    # a route replaced in place (`app.routes[i] = ...`) is noticed when a
+    # request matches the old one, the index is rebuilt then. requests that
+    # matched no route are not checked again, Limiter.invalidate_routes does.
+    _cache: OrderedDict[tuple[str, str], _Entry | None]
+
+    def __init__(
+        self,
+        routes: typing.Sequence[BaseRoute],
+        plan_func: PlanFunc,
+        cache_size: int = 1024,
+    ) -> None:
+        self.routes = routes
+        self.size = len(routes)
+        self.plan_func = plan_func
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._build()
+
+    def _build(self) -> None:
+        self._cache.clear()
+        static: dict[str, list[_Entry]] = {}
+        dynamic: list[_Entry] = []
+        for index, route in enumerate(self.routes):
+            if not hasattr(route, "endpoint"):
+                continue
+            methods = getattr(route, "methods", None)
+            if not isinstance(methods, (set, frozenset)) or not methods:
+                methods = None
+            plan = self.plan_func(route.endpoint)  # type: ignore
+            entry = (index, route, methods, plan)
+
+            path = getattr(route, "path", None)
+            segment = _first_segment(path) if isinstance(path, str) else "{"
+            if "{" in segment:
+                dynamic.append(entry)
+            else:
+                static.setdefault(segment, []).append(entry)
+
+        # keep the declaration order, the first full match is what starlette serves
+        self._dynamic = dynamic
+        self._by_segment = {
+            segment: sorted(entries + dynamic, key=lambda entry: entry[0])
+            for segment, entries in static.items()
+        }
+
+    def is_for(self, routes: typing.Sequence[BaseRoute]) -> bool:
+        return routes is self.routes and len(routes) == self.size
+
+    def lookup(self, scope: Scope) -> RoutePlan | None:
+        cache_key = scope["method"], scope["path"]
+        cached = self._cache.get(cache_key, _MISSING)
+        if cached is _MISSING:
+            entry = self._match(scope)
+            self._cache[cache_key] = entry
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        else:
+            entry = typing.cast("_Entry | None", cached)
+            self._cache.move_to_end(cache_key)
+
+        if entry is None:
+            return None
+        index, route, _, plan = entry
+        if self.routes[index] is not route:  # replaced in place
+            self._build()
+            return self.lookup(scope)
+        return plan
+
+    def _match(self, scope: Scope) -> _Entry | None:
+        method, path = scope["method"], scope["path"]
+        for entry in self._by_segment.get(_first_segment(path), self._dynamic):
+            methods = entry[2]
+            if methods is not None and method not in methods:
+                continue
+            match, _ = entry[1].matches(scope)
+            if match == Match.FULL:
+                return entry
+        return None
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import struct
+import time
+import typing
+
+from .limit import Limit
+from .strategy import Strategy
+
+MAGIC = b"SLWRSNP1"
+HEADER = struct.Struct("<8sd")  # magic, time written
+LIMIT = struct.Struct("<qq")  # requests, window
+LENGTH = struct.Struct("<H")
+END = 0xFFFF  # key length that ends a bucket's records
+
+# the strategy to restore a bucket into, None to skip it
+Resolver = typing.Callable[[str, Limit], "Strategy | None"]
+
+# a snapshot is the header followed by one section per bucket: its name,
+# strategy and state format as length prefixed strings, its limit, then one
+# record per key (length prefixed key and state) until a length of END.
+
+
+def _write_str(fp: typing.BinaryIO, value: str) -> None:
+    data = value.encode()
+    fp.write(LENGTH.pack(len(data)) + data)
+
+
+def _read(fp: typing.BinaryIO, size: int) -> bytes:
+    data = fp.read(size)
+    if len(data) != size:
+        raise ValueError("truncated snapshot")
+    return data
+
+
+def _read_str(fp: typing.BinaryIO) -> str:
+    (length,) = LENGTH.unpack(_read(fp, LENGTH.size))
+    return _read(fp, length).decode()
+
+
+def write_snapshot(
+    fp: typing.BinaryIO,
+    strategies: typing.Iterable[Strategy],
+    now: float | None = None,
+) -> int:
+    fp.write(HEADER.pack(MAGIC, time.time() if now is None else now))
+    written = 0
+    for strategy in strategies:
+        state_format = strategy.snapshot_format
+        if not state_format:
+            continue
+        _write_str(fp, strategy.name)
+        _write_str(fp, type(strategy).__qualname__)
+        _write_str(fp, state_format)
+        fp.write(LIMIT.pack(strategy.rate.requests, strategy.rate.window))
+
+        pack_length, pack_state = LENGTH.pack, struct.Struct(state_format).pack
+        for key, state in strategy.dump():
+            data = key.encode()
+            if len(data) < END:
+                fp.write(pack_length(len(data)) + data + pack_state(*state))
+                written += 1
+        fp.write(LENGTH.pack(END))
+    return written
+
+
+def read_snapshot(
+    fp: typing.BinaryIO, resolve: Resolver, now: float | None = None
+) -> int:
+    header = fp.read(HEADER.size)
+    if len(header) != HEADER.size or header[:8] != MAGIC:
+        raise ValueError("not a slowerapi snapshot")
+    _, written_at = HEADER.unpack(header)
+    elapsed = max(0.0, (time.time() if now is None else now) - written_at)
+
+    restored = 0
+    while True:
+        data = fp.read(LENGTH.size)
+        if not data:
+            break
+        if len(data) != LENGTH.size:
+            raise ValueError("truncated snapshot")
+        (length,) = LENGTH.unpack(data)
+        name = _read(fp, length).decode()
+        kind = _read_str(fp)
+        state_format = _read_str(fp)
+        requests, window = LIMIT.unpack(_read(fp, LIMIT.size))
+        record = struct.Struct(state_format)
+
+        # skip buckets now using another strategy, their state does not fit
+        strategy = resolve(name, Limit(requests, window))
+        load = None
+        if (
+            strategy is not None
+            and type(strategy).__qualname__ == kind
+            and strategy.snapshot_format == state_format
+        ):
+            load = strategy.load
+
+        unpack_length, unpack_state = LENGTH.unpack, record.unpack_from
+        while True:
+            (length,) = unpack_length(_read(fp, LENGTH.size))
+            if length == END:
+                break
+            data = _read(fp, length + record.size)
+            if load is not None:
+                key = data[:length].decode()
+                restored += load(key, unpack_state(data, length), elapsed)
+    return restored
@@ -0,0 +1,39 @@
+import typing
+from abc import ABC, abstractmethod
+
+from ..limit import Limit
+from ..strategy import Ratelimited
+
+# bucket, key, limits, cost
+Hit = tuple[str, str, typing.Sequence[Limit], int]
+
+
+class Storage(ABC):
+    @abstractmethod
+    async def hit(
+        self,
+        bucket: str,
+        key: str,
+        limits: typing.Sequence[Limit],
+        increase: bool,
+        cost: int = 1,
+    ) -> list[Ratelimited]:
+        ...  # pragma: no cover
+
+    async def hit_many(
+        self, hits: typing.Sequence[Hit], increase: bool = True
+    ) -> list[list[Ratelimited]]:
+        # storages with a cheaper way to send many hits at once override this
+        return [
+            await self.hit(bucket, key, limits, increase, cost)
+            for bucket, key, limits, cost in hits
+        ]
+
+    async def startup(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+__all__ = ["Hit", "Storage"]
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import asyncio
+import time
+import typing
+
+from ..limit import Limit
+from ..strategy import Ratelimited, make_ratelimited
+from . import Hit, Storage
+
+
+class _Counts:
+    __slots__ = ("limits", "remote", "resets", "delta", "sending")
+
+    def __init__(self, limits: typing.Sequence[Limit]) -> None:
+        self.limits = limits
+        self.remote = [0] * len(limits)  # last count seen from the remote
+        self.resets = [0.0] * len(limits)  # when those windows end
+        self.delta = 0  # local hits not sent yet
+        self.sending = 0  # local hits being sent
+
+
+class HybridStorage(Storage):
+    # counts hits locally and sends them to `remote` in batches every
+    # `flush_interval` seconds. decisions use the last count seen from the
+    # remote plus the local hits since, and a key's hits are sent right away
+    # once `max_delta` of them are pending. with n workers a limit is overshot
+    # by at most n * max_delta hits, fresh keys are assumed to be at 0.
+    _counts: dict[tuple[str, str], _Counts]
+    _dirty: dict[tuple[str, str], _Counts]
+
+    def __init__(
+        self, remote: Storage, flush_interval: float = 0.005, max_delta: int = 10
+    ) -> None:
+        self.remote = remote
+        self.flush_interval = flush_interval
+        self.max_delta = max_delta
+        self.time_func = time.monotonic
+        self.flushes = 0
+
+        self._counts = {}
+        self._dirty = {}
+        self._sweep_at = 1024
+        self._task: asyncio.Task[None] | None = None
+
+    async def hit(
+        self,
+        bucket: str,
+        key: str,
+        limits: typing.Sequence[Limit],
+        increase: bool,
+        cost: int = 1,
+    ) -> list[Ratelimited]:
+        if self._task is None:
+            await self.startup()
+        name = (bucket, key)
+        counts = self._counts.get(name, None)
+        if counts is None or counts.limits is not limits:
+            self._counts[name] = counts = _Counts(limits)
+
+        if increase:
+            counts.delta += cost
+            self._dirty[name] = counts
+            if counts.delta >= self.max_delta:
+                try:
+                    await self._flush({name: counts})
+                except Exception:
+                    pass  # decide locally, the hits are sent later
+
+        now = self.time_func()
+        local = counts.delta + counts.sending
+        ratelimits = []
+        for limit, remote, reset in zip(limits, counts.remote, counts.resets):
+            if reset <= now:  # the remote window is over, start from zero
+                remote, reset = 0, now + limit.window
+            ratelimits.append(make_ratelimited(limit, remote + local, reset - now))
+        return ratelimits
+
+    async def _flush(self, dirty: dict[tuple[str, str], _Counts]) -> None:
+        sent: list[tuple[tuple[str, str], _Counts, int]] = []
+        hits: list[Hit] = []
+        for name, counts in dirty.items():
+            self._dirty.pop(name, None)
+            if counts.delta:  # not already sent by another flush
+                sent.append((name, counts, counts.delta))
+                hits.append((*name, counts.limits, counts.delta))
+                counts.sending += counts.delta
+                counts.delta = 0
+        if not hits:
+            return
+
+        try:
+            results = await self.remote.hit_many(hits)
+        except BaseException:
+            # keep the hits, they go out with the next flush
+            for name, counts, delta in sent:
+                counts.sending -= delta
+                counts.delta += delta
+                self._dirty[name] = counts
+            raise
+
+        self.flushes += 1
+        now = self.time_func()
+        for (_, counts, delta), ratelimits in zip(sent, results):
+            counts.sending -= delta
+            for index, ratelimited in enumerate(ratelimits):
+                # past the limit the exact count is unknown, one over will do
+                current = ratelimited.limit.requests - ratelimited.remaining
+                counts.remote[index] = current + ratelimited.limited
+                counts.resets[index] = now + ratelimited.reset_after
+
+    def _sweep(self) -> None:
+        # forget keys with nothing pending whose windows are all over
+        now = self.time_func()
+        for name in [
+            name
+            for name, counts in self._counts.items()
+            if not counts.delta
+            and not counts.sending
+            and all(reset <= now for reset in counts.resets)
+        ]:
+            del self._counts[name]
+
+    async def flush(self) -> None:
+        await self._flush(dict(self._dirty))
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                continue  # remote unavailable, retried next interval
+            if len(self._counts) >= self._sweep_at:
+                self._sweep()
+                self._sweep_at = max(1024, 2 * len(self._counts))
+
+    async def startup(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        await self.remote.startup()
+
+    async def shutdown(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        await self.remote.shutdown()
@@ -0,0 +1,45 @@
+import time
+import typing
+
+from ..limit import Limit
+from ..strategy import Ratelimited, make_ratelimited
+from . import Storage
+
+
+# fixed window counters in this process, the same counting as RedisStorage.
+# a stand-in for a remote storage in tests and single process deployments.
+class MemoryStorage(Storage):
+    _windows: dict[str, tuple[int, float]]
+
+    def __init__(self) -> None:
+        self.time_func = time.monotonic
+        self._windows = {}
+        self._sweep_at = 1024
+
+    async def hit(
+        self,
+        bucket: str,
+        key: str,
+        limits: typing.Sequence[Limit],
+        increase: bool,
+        cost: int = 1,
+    ) -> list[Ratelimited]:
+        now = self.time_func()
+        ratelimits = []
+        for limit in limits:
+            name = f"{bucket}:{limit.requests}/{limit.window}:{key}"
+            current, window_end = self._windows.get(name, (0, 0.0))
+            if window_end <= now:
+                current, window_end = 0, now + limit.window
+            if increase:
+                current += cost
+                self._windows[name] = current, window_end
+            ratelimits.append(make_ratelimited(limit, current, window_end - now))
+
+        if len(self._windows) >= self._sweep_at:
+            # drop expired windows, amortized over the hits that grew the dict
+            windows = self._windows
+            for name in [name for name, (_, end) in windows.items() if end <= now]:
+                del windows[name]
+            self._sweep_at = max(1024, 2 * len(windows))
+        return ratelimits
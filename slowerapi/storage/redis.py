@@ -0,0 +1,98 @@
+import typing
+
+import redis.asyncio as redis
+
+from ..limit import Limit
+from ..strategy import Ratelimited, make_ratelimited
+from . import Hit, Storage
+
+
+class RedisStorage(Storage):
+    def __init__(
+        self,
+        client: redis.Redis | str,
+        prefix: str = "slowerapi:",
+        max_connections: int | None = None,
+    ) -> None:
+        # a client built from a url is ours to close, a passed one is not
+        self.owns_client = isinstance(client, str)
+        if isinstance(client, str):
+            # the client keeps a connection pool, one per storage is enough
+            client = redis.Redis.from_url(client, max_connections=max_connections)
+        self.client = client
+        self.prefix = prefix
+
+    def _queue(
+        self,
+        pipe: typing.Any,
+        bucket: str,
+        key: str,
+        limits: typing.Sequence[Limit],
+        increase: bool,
+        cost: int,
+    ) -> None:
+        for limit in limits:
+            name = f"{self.prefix}{bucket}:{limit.requests}/{limit.window}:{key}"
+            if increase:
+                pipe.set(name, 0, ex=limit.window, nx=True)
+                pipe.incrby(name, cost)
+            else:
+                pipe.get(name)
+            pipe.pttl(name)
+
+    def _parse(
+        self,
+        results: list[typing.Any],
+        offset: int,
+        limits: typing.Sequence[Limit],
+        increase: bool,
+    ) -> list[Ratelimited]:
+        step = 3 if increase else 2
+        ratelimits = []
+        for index, limit in enumerate(limits):
+            start = offset + index * step + step - 2
+            current, pttl = results[start : start + 2]
+            ttl = pttl / 1000 if pttl >= 0 else limit.window
+            ratelimits.append(make_ratelimited(limit, int(current or 0), ttl))
+        return ratelimits
+
+    async def hit(
+        self,
+        bucket: str,
+        key: str,
+        limits: typing.Sequence[Limit],
+        increase: bool,
+        cost: int = 1,
+    ) -> list[Ratelimited]:
+        if not limits:
+            return []
+
+        # fixed window counters for all limits in one MULTI/EXEC round-trip
+        pipe = self.client.pipeline(transaction=True)
+        self._queue(pipe, bucket, key, limits, increase, cost)
+        return self._parse(await pipe.execute(), 0, limits, increase)
+
+    async def hit_many(
+        self, hits: typing.Sequence[Hit], increase: bool = True
+    ) -> list[list[Ratelimited]]:
+        if not any(limits for _, _, limits, _ in hits):
+            return [[] for _ in hits]
+
+        # every hit in one MULTI/EXEC round-trip
+        pipe = self.client.pipeline(transaction=True)
+        for bucket, key, limits, cost in hits:
+            self._queue(pipe, bucket, key, limits, increase, cost)
+        results = await pipe.execute()
+
+        step = 3 if increase else 2
+        offset, ratelimits = 0, []
+        for _, _, limits, _ in hits:
+            ratelimits.append(self._parse(results, offset, limits, increase))
+            offset += step * len(limits)
+        return ratelimits
+
+    async def shutdown(self) -> None:
+        if self.owns_client:
+            # aclose replaced close in redis 5
+            close = getattr(self.client, "aclose", None) or self.client.close
+            await close()
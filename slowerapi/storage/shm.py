@@ -0,0 +1,134 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import time
+
+from ..limit import Limit
+from ..strategy import Strategy
+
+MAGIC = b"SLWRSHM1"
+HEADER = struct.Struct("<8sQQ")  # magic, slots, group size
+SLOT = struct.Struct("<QdQ")  # key hash, window end, count
+
+
+# Fixed-size open-addressed counter table in a memory-mapped file, shared by
+# every process that opens the same path (put it on /dev/shm).
+# Keys hash into a group of `group_size` slots, each group is guarded by one of
+# `stripes` byte-range locks and evicts its oldest window when it is full.
+class SharedMemoryTable:
+    evictions: int
+
+    def __init__(
+        self,
+        path: str,
+        slots: int = 1 << 16,
+        group_size: int = 8,
+        stripes: int = 64,
+    ) -> None:
+        if slots % group_size:
+            raise ValueError("slots must be a multiple of group_size")
+
+        self.path = path
+        self.slots = slots
+        self.group_size = group_size
+        self.groups = slots // group_size
+        self.stripes = stripes
+        self.time_func = time.time
+        self.evictions = 0
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = HEADER.size + slots * SLOT.size
+        self._lock(0, HEADER.size)
+        try:
+            if os.fstat(self._fd).st_size == 0:
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, HEADER.pack(MAGIC, slots, group_size), 0)
+            header = HEADER.unpack(os.pread(self._fd, HEADER.size, 0))
+        finally:
+            self._unlock(0, HEADER.size)
+        if header != (MAGIC, slots, group_size):
+            os.close(self._fd)
+            raise ValueError(f"{path} holds a table with a different layout")
+
+        self._mmap = mmap.mmap(self._fd, size)
+
+    def _lock(self, start: int, length: int = 1) -> None:
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, length, start)
+
+    def _unlock(self, start: int, length: int = 1) -> None:
+        fcntl.lockf(self._fd, fcntl.LOCK_UN, length, start)
+
+    def hit(
+        self, key_hash: int, window: int, increase: bool, cost: int = 1
+    ) -> tuple[int, float]:
+        key_hash = key_hash or 1  # 0 marks an empty slot
+        group = key_hash % self.groups
+        # lock bytes live past the end of the table so they never move
+        stripe = HEADER.size + self.slots * SLOT.size + group % self.stripes
+        offset = HEADER.size + group * self.group_size * SLOT.size
+        mm = self._mmap
+
+        self._lock(stripe)
+        try:
+            now = self.time_func()
+            free = oldest = -1
+            oldest_end = float("inf")
+            end = offset + self.group_size * SLOT.size
+            for slot in range(offset, end, SLOT.size):
+                slot_hash, window_end, count = SLOT.unpack_from(mm, slot)
+                if slot_hash == key_hash:
+                    if window_end > now:
+                        if increase:
+                            count += cost
+                            SLOT.pack_into(mm, slot, key_hash, window_end, count)
+                        return count, window_end - now
+                    free = slot  # expired, reuse in place
+                    break
+                elif free == -1 and (slot_hash == 0 or window_end <= now):
+                    free = slot
+                elif window_end < oldest_end:
+                    oldest, oldest_end = slot, window_end
+
+            if not increase:
+                return 0, window
+            if free == -1:
+                free = oldest
+                self.evictions += 1
+            SLOT.pack_into(mm, free, key_hash, now + window, cost)
+            return cost, window
+        finally:
+            self._unlock(stripe)
+
+    def strategy(
+        self, limit: Limit, name: str = "", max_keys: int | None = None
+    ) -> "SharedMemoryStrategy":
+        # the table has a fixed size, max_keys is not used
+        return SharedMemoryStrategy(limit, name, self)
+
+    def close(self) -> None:
+        self._mmap.close()
+        os.close(self._fd)
+
+
+class SharedMemoryStrategy(Strategy):
+    def __init__(self, limit: Limit, name: str, table: SharedMemoryTable) -> None:
+        super().__init__(limit, name)
+        self._table = table
+        # stable across processes, unlike hash()
+        self._hasher = hashlib.blake2b(f"{name}\0".encode(), digest_size=8)
+
+    def _hash(self, key: str) -> int:
+        hasher = self._hasher.copy()
+        hasher.update(key.encode())
+        return int.from_bytes(hasher.digest(), "little")
+
+    def check(
+        self, key: str, increase: bool, cost: int = 1
+    ) -> tuple[bool, int, float]:
+        current, ttl = self._table.hit(
+            self._hash(key), self._limit.window, increase, cost
+        )
+        remaining = self._limit.requests - current
+        return remaining < 0, max(0, remaining), ttl
@@ -1,9 +1,14 @@
+import math
+import time
 import typing
-
-from expirepy import ExpiringDict
+from array import array
+from collections import OrderedDict
 
 from .limit import Limit
 
+if typing.TYPE_CHECKING:  # pragma: no cover
+    from .expiry import ExpiryEngine
+
 
 class Ratelimited(typing.NamedTuple):
     limited: bool
@@ -12,37 +17,502 @@ class Ratelimited(typing.NamedTuple):
     reset_after: float
 
 
+def make_ratelimited(limit: Limit, current: int, reset_after: float) -> Ratelimited:
+    remaining = limit.requests - current
+    return Ratelimited(
+        limited=remaining < 0,
+        limit=limit,
+        remaining=max(0, remaining),
+        reset_after=reset_after,
+    )
+
+
+State = tuple[typing.Any, ...]
+
+
 class Strategy:
-    def __init__(self, limit: Limit) -> None:
+    evictions: int
+    expiry: "ExpiryEngine | None" = None
+    # struct format of a key's state in snapshots, empty if there is none
+    snapshot_format = ""
+
+    def __init__(
+        self, limit: Limit, name: str = "", max_keys: int | None = None
+    ) -> None:
         self._limit = limit
+        self.name = name
+        self.max_keys = max_keys
+        self.evictions = 0
+        self._sweep_at = 1024
+
+    # the limit this strategy enforces, `limit` checks it
+    @property
+    def rate(self) -> Limit:
+        return self._limit
+
+    # a hit counts `cost` requests
+    def limit(self, key: str, increase: bool, cost: int = 1) -> Ratelimited:
+        limited, remaining, reset_after = self.check(key, increase, cost)
+        return Ratelimited(limited, self._limit, remaining, reset_after)
 
-    def limit(self, key: str, increase: bool) -> Ratelimited:
+    # (limited, remaining, reset_after) without building a Ratelimited, strategies
+    # implement either this or limit
+    def check(
+        self, key: str, increase: bool, cost: int = 1
+    ) -> tuple[bool, int, float]:
+        limited, _, remaining, reset_after = self.limit(key, increase, cost)
+        return limited, remaining, reset_after
+
+    # seconds until the key's state is the same as an unseen key, None if the
+    # key is not stored. strategies without per key state never schedule keys.
+    def expires_in(self, key: str) -> float | None:
         raise NotImplementedError  # pragma: no cover
 
+    def forget(self, key: str) -> None:
+        raise NotImplementedError  # pragma: no cover
+
+    # keys held in memory, 0 for strategies without per key state
+    def key_count(self) -> int:
+        return 0
+
+    # the state of every key for snapshots, times relative to now
+    def dump(self) -> typing.Iterator[tuple[str, State]]:
+        return iter(())
+
+    # restores a key's state dumped `elapsed` seconds ago, False if it expired
+    def load(self, key: str, state: State, elapsed: float) -> bool:
+        raise NotImplementedError  # pragma: no cover
+
+    # drops the keys that are the same as unseen keys
+    def _sweep(self) -> None:
+        pass
+
+    def _added(self, store: dict[str, typing.Any]) -> None:
+        # sweep whenever the store doubled since the last sweep, so expired
+        # keys do not pile up without an ExpiryEngine, at O(1) amortized
+        if len(store) >= self._sweep_at:
+            self._sweep()
+            self._sweep_at = max(1024, 2 * len(store))
+
+    def _new_store(self) -> dict[str, typing.Any]:
+        return {} if self.max_keys is None else OrderedDict()
+
+    def _bound(self, store: dict[str, typing.Any], key: str) -> None:
+        # least recently written key goes first, store is from _new_store
+        lru = typing.cast("OrderedDict[str, typing.Any]", store)
+        lru.move_to_end(key)
+        if len(lru) > self.max_keys:  # type: ignore
+            lru.popitem(last=False)
+            self.evictions += 1
+
+
+class StrategyFactory(typing.Protocol):
+    # a Strategy subclass, or a functools.partial of one with its own settings
+    def __call__(
+        self, limit: Limit, name: str = "", max_keys: int | None = None
+    ) -> Strategy:
+        ...  # pragma: no cover
+
+
+class _Window:
+    __slots__ = ("count", "expires")
+
+    def __init__(self, expires: float) -> None:
+        self.count = 0
+        self.expires = expires
+
 
 class MovingWindowStrategy(Strategy):
-    _requests: ExpiringDict[str, int]
+    # a counter per key that resets one window after the key's first hit
+    _requests: dict[str, _Window]
+    snapshot_format = "<qd"  # count, ttl
+
+    def __init__(
+        self, limit: Limit, name: str = "", max_keys: int | None = None
+    ) -> None:
+        super().__init__(limit, name, max_keys)
+        self._requests = self._new_store()
+        self.time_func = time.monotonic
 
-    def __init__(self, limit: Limit) -> None:
-        super().__init__(limit)
-        self._requests = ExpiringDict(expires=limit.window)
+    def check(
+        self, key: str, increase: bool, cost: int = 1
+    ) -> tuple[bool, int, float]:
+        now = self.time_func()
+        entry = self._requests.get(key, None)
+        if entry is not None and entry.expires <= now:
+            entry = None  # the window lapsed, same as an unseen key
 
-    def limit(self, key: str, increase: bool) -> Ratelimited:
         if increase:
-            current = self._requests.get(key, 0) + 1
-            self._requests[key] = current
-            ttl = self._requests.ttl(key)
-        else:
-            current = self._requests.get(key, 0)
-            try:
-                ttl = self._requests.ttl(key)
-            except KeyError:
-                ttl = self._limit.window
-
-        remaining = self._limit.requests - current
-        return Ratelimited(
-            limited=remaining < 0,
-            limit=self._limit,
-            remaining=max(0, remaining),
-            reset_after=ttl,
+            if entry is None:
+                new_key = key not in self._requests
+                self._requests[key] = entry = _Window(now + self._limit.window)
+                if self.expiry is not None:
+                    self.expiry.schedule(self, key, self._limit.window)
+                if new_key:
+                    self._added(self._requests)
+            entry.count += cost
+            if self.max_keys is not None:
+                self._bound_lru(key, now)
+
+        if entry is None:
+            return False, self._limit.requests, self._limit.window
+        remaining = self._limit.requests - entry.count
+        return remaining < 0, max(0, remaining), entry.expires - now
+
+    def expires_in(self, key: str) -> float | None:
+        entry = self._requests.get(key, None)
+        return None if entry is None else entry.expires - self.time_func()
+
+    def forget(self, key: str) -> None:
+        self._requests.pop(key, None)
+
+    def _sweep(self) -> None:
+        now = self.time_func()
+        requests = self._requests
+        for key in [key for key, entry in requests.items() if entry.expires <= now]:
+            del requests[key]
+
+    def key_count(self) -> int:
+        return len(self._requests)
+
+    def dump(self) -> typing.Iterator[tuple[str, State]]:
+        now = self.time_func()
+        for key, entry in self._requests.items():
+            if entry.expires > now:
+                yield key, (entry.count, entry.expires - now)
+
+    def load(self, key: str, state: State, elapsed: float) -> bool:
+        count, ttl = state[0], float(state[1]) - elapsed
+        if ttl <= 0:
+            return False
+        self._requests[key] = entry = _Window(self.time_func() + ttl)
+        entry.count = count
+        if self.max_keys is not None:
+            self._bound_lru(key, self.time_func())
+        if self.expiry is not None:
+            self.expiry.schedule(self, key, ttl)
+        return True
+
+    def _bound_lru(self, key: str, now: float) -> None:
+        # like _bound, but keys that expired on their own are not evictions
+        lru = typing.cast("OrderedDict[str, _Window]", self._requests)
+        lru.move_to_end(key)
+        if len(lru) > self.max_keys:  # type: ignore
+            _, evicted = lru.popitem(last=False)
+            if evicted.expires > now:
+                self.evictions += 1
+
+
+class GCRAStrategy(Strategy):
+    # generic cell rate algorithm: one "theoretical arrival time" per key, a key
+    # whose tat is in the past is the same as a key that was never seen.
+    # up to `burst` hits (`requests` by default) fit at once, after that one
+    # per window / requests seconds. any span of one window therefore admits
+    # up to burst + requests - 1 hits.
+    _tats: dict[str, float]
+    snapshot_format = "<d"  # tat, from now
+
+    def __init__(
+        self,
+        limit: Limit,
+        name: str = "",
+        max_keys: int | None = None,
+        burst: int | None = None,
+    ) -> None:
+        super().__init__(limit, name, max_keys)
+        self._tats = self._new_store()
+        self._interval = limit.window / limit.requests if limit.requests else math.inf
+        # how far the tat may run ahead of now
+        self._burst_time = (
+            float(limit.window)
+            if burst is None or not limit.requests
+            else burst * self._interval
         )
+        # absorbs float error so `burst` hits always fit at once
+        self._tolerance = limit.window * 1e-9
+        self.time_func = time.monotonic
+
+    def check(
+        self, key: str, increase: bool, cost: int = 1
+    ) -> tuple[bool, int, float]:
+        now = self.time_func()
+        burst_time = self._burst_time
+        tat = max(self._tats.get(key, now), now)
+        new_tat = tat + self._interval * cost
+
+        if new_tat - now > burst_time + self._tolerance:
+            # the next hit does not fit, retry once it does
+            return True, 0, min(new_tat - burst_time - now, self._limit.window)
+
+        if increase:
+            new_key = key not in self._tats
+            if new_key and self.expiry is not None:
+                self.expiry.schedule(self, key, new_tat - now)
+            self._tats[key] = tat = new_tat
+            if new_key:
+                self._added(self._tats)
+            if self.max_keys is not None:
+                self._bound(self._tats, key)
+        remaining = int((burst_time - (tat - now) + self._tolerance) / self._interval)
+        return False, remaining, tat - now
+
+    def expires_in(self, key: str) -> float | None:
+        tat = self._tats.get(key, None)
+        return None if tat is None else tat - self.time_func()
+
+    def forget(self, key: str) -> None:
+        self._tats.pop(key, None)
+
+    def _sweep(self) -> None:
+        now = self.time_func()
+        tats = self._tats
+        for key in [key for key, tat in tats.items() if tat <= now]:
+            del tats[key]
+
+    def key_count(self) -> int:
+        return len(self._tats)
+
+    def dump(self) -> typing.Iterator[tuple[str, State]]:
+        now = self.time_func()
+        for key, tat in self._tats.items():
+            if tat > now:
+                yield key, (tat - now,)
+
+    def load(self, key: str, state: State, elapsed: float) -> bool:
+        left = state[0] - elapsed
+        if left <= 0:
+            return False
+        self._tats[key] = self.time_func() + left
+        if self.max_keys is not None:
+            self._bound(self._tats, key)
+        if self.expiry is not None:
+            self.expiry.schedule(self, key, left)
+        return True
+
+
+class _WindowCounter:
+    __slots__ = ("index", "current", "previous")
+
+    def __init__(self, index: float) -> None:
+        self.index = index
+        self.current = 0
+        self.previous = 0
+
+
+class SlidingWindowStrategy(Strategy):
+    # sliding window counter: the previous window's count is weighted by how
+    # much of it still overlaps the sliding window
+    _counters: dict[str, _WindowCounter]
+    snapshot_format = "<dqq"  # seconds since the window started, counts
+
+    def __init__(
+        self, limit: Limit, name: str = "", max_keys: int | None = None
+    ) -> None:
+        super().__init__(limit, name, max_keys)
+        self._counters = self._new_store()
+        self.time_func = time.monotonic
+
+    def check(
+        self, key: str, increase: bool, cost: int = 1
+    ) -> tuple[bool, int, float]:
+        window = self._limit.window
+        requests = self._limit.requests
+        index, offset = divmod(self.time_func(), window)
+
+        counter = self._counters.get(key, None)
+        if counter is None:
+            if not increase:
+                return False, requests, 0
+            self._counters[key] = counter = _WindowCounter(index)
+            if self.expiry is not None:
+                self.expiry.schedule(self, key, 2 * window - offset)
+            self._added(self._counters)
+        elif counter.index != index:
+            counter.previous = counter.current if counter.index + 1 == index else 0
+            counter.current = 0
+            counter.index = index
+
+        previous, current = counter.previous, counter.current
+        count = int(previous * (1 - offset / window)) + current
+
+        if count + cost > requests:
+            # the next hit does not fit, wait until enough of the previous
+            # window has slid out (or for the next window if this one is full)
+            room = requests - cost
+            if current <= room and previous:
+                wait = window * (1 - (room - current) / previous) - offset
+            elif room >= 0 and current:
+                wait = window * (2 - room / current) - offset
+            else:
+                wait = window - offset
+            return True, 0, max(wait, 0)
+
+        if increase:
+            counter.current = current = current + cost
+            count += cost
+            if self.max_keys is not None:
+                self._bound(self._counters, key)
+        return False, requests - count, window - offset + (window if current else 0)
+
+    def expires_in(self, key: str) -> float | None:
+        counter = self._counters.get(key, None)
+        if counter is None:
+            return None
+        # both counts are out of the sliding window two windows after the index
+        return (counter.index + 2) * self._limit.window - self.time_func()
+
+    def forget(self, key: str) -> None:
+        self._counters.pop(key, None)
+
+    def _sweep(self) -> None:
+        # both counts are out of the sliding window two windows after the index
+        index = self.time_func() // self._limit.window
+        counters = self._counters
+        for key in [
+            key for key, counter in counters.items() if counter.index + 2 <= index
+        ]:
+            del counters[key]
+
+    def key_count(self) -> int:
+        return len(self._counters)
+
+    def dump(self) -> typing.Iterator[tuple[str, State]]:
+        now = self.time_func()
+        window = self._limit.window
+        for key, counter in self._counters.items():
+            start = counter.index * window
+            if start + 2 * window > now:
+                yield key, (now - start, counter.current, counter.previous)
+
+    def load(self, key: str, state: State, elapsed: float) -> bool:
+        age, current, previous = state
+        now = self.time_func()
+        window = self._limit.window
+        # windows are aligned to this process's clock, the counts go to the
+        # window the dumped one started in
+        index = (now - age - elapsed) // window
+        expires_in = (index + 2) * window - now
+        if expires_in <= 0:
+            return False
+        self._counters[key] = counter = _WindowCounter(index)
+        counter.current, counter.previous = current, previous
+        if self.max_keys is not None:
+            self._bound(self._counters, key)
+        if self.expiry is not None:
+            self.expiry.schedule(self, key, expires_in)
+        return True
+
+
+class CountMinSketchStrategy(Strategy):
+    # approximate counts in fixed memory, for very high key cardinality.
+    # the window is split into `slots` sub-windows with one count-min sketch
+    # each, a check sums its `depth` cells over them so a sub-window drops out
+    # by zeroing its sketch alone (a copy of `_zeros`, no per-cell loop).
+    # counts are overestimated by at most `error` * requests in the window
+    # with a probability of 1 - `delta`, never underestimated.
+    # keys that reach `exact_threshold` are moved to exact counters (at most
+    # `max_exact`), which keeps heavy hitters from inflating other keys.
+    # memory is fixed regardless, `max_keys` is not used.
+    _exact: dict[str, list[int]]
+
+    def __init__(
+        self,
+        limit: Limit,
+        name: str = "",
+        max_keys: int | None = None,
+        error: float = 0.001,
+        delta: float = 0.01,
+        slots: int = 4,
+        exact_threshold: int | None = None,
+        max_exact: int = 1024,
+    ) -> None:
+        super().__init__(limit, name, max_keys)
+        self.width = math.ceil(math.e / error)
+        self.depth = math.ceil(math.log(1 / delta))
+        self.slots = slots
+        self.exact_threshold = exact_threshold
+        self.max_exact = max_exact
+        self.time_func = time.monotonic
+
+        self._slot_length = limit.window / slots
+        self._sketches = [self._empty() for _ in range(slots)]
+        self._zeros = self._empty()
+        self._index = 0
+        self._exact = {}
+
+    def _empty(self) -> "array[int]":
+        return array("I", bytes(4 * self.width * self.depth))
+
+    @property
+    def memory(self) -> int:
+        # bytes used by the counters, independent of the number of keys
+        return (self.slots + 1) * self.width * self.depth * 4
+
+    def key_count(self) -> int:
+        return len(self._exact)  # only keys moved to exact counters are held
+
+    def _cells(self, key: str) -> list[int]:
+        value = hash(key) & 0xFFFFFFFFFFFFFFFF
+        h1, h2 = value & 0xFFFFFFFF, value >> 32 | 1
+        width = self.width
+        return [row * width + (h1 + row * h2) % width for row in range(self.depth)]
+
+    def _rotate(self, index: int) -> None:
+        steps = index - self._index
+        self._index = index
+        if steps >= self.slots:
+            self._sketches = [self._empty() for _ in range(self.slots)]
+            self._exact.clear()
+            return
+
+        for step in range(1, steps + 1):
+            slot = (index - steps + step) % self.slots
+            self._sketches[slot][:] = self._zeros
+            for counts in self._exact.values():
+                counts[slot] = 0
+
+        for key in [key for key, counts in self._exact.items() if not any(counts)]:
+            del self._exact[key]
+
+    def check(
+        self, key: str, increase: bool, cost: int = 1
+    ) -> tuple[bool, int, float]:
+        now = self.time_func()
+        requests = self._limit.requests
+        index = int(now // self._slot_length)
+        if index != self._index:
+            self._rotate(index)
+        slot = index % self.slots
+        # the oldest sub-window is the next one to drop out
+        slot_left = (index + 1) * self._slot_length - now
+
+        counts = self._exact.get(key, None)
+        if counts is not None:
+            count = sum(counts)
+        else:
+            cells = self._cells(key)
+            sketches = self._sketches
+            count = min([sum([sketch[cell] for sketch in sketches]) for cell in cells])
+
+        if count + cost > requests:
+            return True, 0, slot_left
+
+        if increase:
+            count += cost
+            if counts is not None:
+                counts[slot] += cost
+            elif (
+                self.exact_threshold is not None
+                and count >= self.exact_threshold
+                and len(self._exact) < self.max_exact
+            ):
+                # start from the estimate so the key is never undercounted
+                self._exact[key] = counts = [0] * self.slots
+                counts[slot] = count
+            else:
+                sketch = self._sketches[slot]
+                for cell in cells:
+                    sketch[cell] += cost
+
+        reset_after = slot_left + self._limit.window - self._slot_length
+        return False, requests - count, reset_after
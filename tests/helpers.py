@@ -0,0 +1,5 @@
+from starlette.requests import Request
+
+
+def make_request(ip: str = "1.2.3.4") -> Request:
+    return Request({"type": "http", "headers": [], "client": (ip, 0)})
@@ -1,8 +1,15 @@
+import asyncio
+import json
 from unittest import mock
 
+import httpx
 import pytest
 
-from slowerapi.reporters.cf import CloudflareIPAccessRuleReporter
+from slowerapi.reporters.cf import (
+    CloudflareIPAccessRuleReporter,
+    CloudflareIPListReporter,
+    collapse_ranges,
+)
 
 
 @pytest.mark.asyncio
@@ -54,3 +61,110 @@ async def test_with_note() -> None:
         "configuration": {"target": "ip_range", "value": "1.2.3.0/24", "note": "note"},
     }
     post.assert_awaited_once_with(endpoint, json=json)
+
+
+def test_collapse_ranges() -> None:
+    ranges = ["1.2.3.0/24", "1.2.2.0/24", "1.2.2.0/24", "::/64", "5.0.0.0/8"]
+    assert collapse_ranges(ranges) == ["1.2.2.0/23", "5.0.0.0/8", "::/64"]
+
+
+class FakeListsAPI:
+    def __init__(self, statuses: list[str]) -> None:
+        self.statuses = statuses
+        self.requests: list[httpx.Request] = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if request.method == "POST":
+            result = {"operation_id": "op"}
+        else:
+            status = self.statuses.pop(0)
+            result = {"id": "op", "status": status, "error": "bad ip"}
+        return httpx.Response(200, json={"success": True, "result": result})
+
+    def make_reporter(self, **kwargs: float) -> CloudflareIPListReporter:
+        return CloudflareIPListReporter(
+            "acc",
+            "list",
+            "token",
+            poll_interval=0,
+            transport=httpx.MockTransport(self),
+            **kwargs,  # type: ignore
+        )
+
+
+async def wait_for_requests(api: FakeListsAPI, count: int) -> None:
+    async def wait() -> None:
+        while len(api.requests) < count:
+            await asyncio.sleep(0)
+
+    await asyncio.wait_for(wait(), 1)
+
+
+@pytest.mark.asyncio
+async def test_ip_list() -> None:
+    api = FakeListsAPI(["pending", "running", "completed"])
+    reporter = api.make_reporter(delay=0.01)
+
+    # calls return right away, the batch is sent in the background
+    await reporter(None, "1.2.3.0/24")  # type: ignore
+    await reporter(None, "1.2.2.0/24")  # type: ignore
+    await reporter(None, "::/64")  # type: ignore
+    assert api.requests == []
+
+    await wait_for_requests(api, 4)
+    post, *polls = api.requests
+    assert post.url.path == "/client/v4/accounts/acc/rules/lists/list/items"
+    assert post.headers["authorization"] == "Bearer token"
+    assert json.loads(post.content) == [
+        {"ip": "1.2.2.0/23", "comment": "Automatic jail."},
+        {"ip": "::/64", "comment": "Automatic jail."},
+    ]
+    assert len(polls) == 3
+    path = "/client/v4/accounts/acc/rules/lists/bulk_operations/op"
+    assert all(poll.url.path == path for poll in polls)
+
+    await asyncio.sleep(0)
+    assert reporter.reported == 3
+    await reporter.shutdown()
+    assert reporter.aclient.is_closed
+
+
+@pytest.mark.asyncio
+async def test_ip_list_batch_size() -> None:
+    api = FakeListsAPI(["completed", "completed"])
+    reporter = api.make_reporter(delay=3600, batch_size=2)
+
+    for i in range(5):
+        await reporter(None, f"1.2.{2 * i}.0/24")  # type: ignore
+
+    # full batches go out without waiting for `delay`
+    await wait_for_requests(api, 4)
+    posts = [request for request in api.requests if request.method == "POST"]
+    assert [len(json.loads(post.content)) for post in posts] == [2, 2]
+    assert list(reporter._batch) == ["1.2.8.0/24"]
+
+    # the rest is sent on shutdown
+    api.statuses.append("completed")
+    await reporter.shutdown()
+    assert reporter._batch == {}
+    assert reporter.reported == 5
+
+
+@pytest.mark.asyncio
+async def test_ip_list_failed(caplog: pytest.LogCaptureFixture) -> None:
+    api = FakeListsAPI(["failed", "completed"])
+    reporter = api.make_reporter(delay=0, retries=1, backoff=0)
+
+    await reporter(None, "1.2.3.0/24")  # type: ignore
+    await wait_for_requests(api, 4)
+    await asyncio.sleep(0)
+    assert reporter.reported == 1
+    assert "bad ip" in caplog.text
+
+    api.statuses.extend(["failed", "failed"])
+    await reporter(None, "1.2.4.0/24")  # type: ignore
+    await wait_for_requests(api, 8)
+    await asyncio.sleep(0)
+    assert reporter.failed == 1
+    await reporter.shutdown()
@@ -0,0 +1,107 @@
+import asyncio
+from unittest import mock
+
+import pytest
+
+from slowerapi import IPJail, get_visitor_ip
+from slowerapi.reporters.queue import ReportQueue
+
+from ..helpers import make_request
+
+
+@pytest.mark.asyncio
+async def test_report() -> None:
+    reporter = mock.AsyncMock()
+    queue = ReportQueue([reporter])
+
+    await queue(None, "1.2.3.0/24")  # type: ignore
+    await queue(None, "1.2.3.0/24")  # type: ignore # in flight
+    reporter.assert_not_awaited()  # not on the request path
+    await queue.shutdown()
+
+    reporter.assert_awaited_once_with(None, "1.2.3.0/24")
+    await queue(None, "1.2.3.0/24")  # type: ignore # already reported
+    assert queue.reported == 1
+    assert queue.duplicates == 2
+    assert queue.pending == queue.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_retry() -> None:
+    flaky = mock.AsyncMock(side_effect=[RuntimeError, None])
+    broken = mock.AsyncMock(side_effect=RuntimeError)
+    queue = ReportQueue([flaky], retries=2, backoff=0.001)
+
+    await queue(None, "1.2.3.0/24")  # type: ignore
+    await queue.shutdown()
+    assert flaky.await_count == 2
+    assert (queue.reported, queue.retried, queue.failed) == (1, 1, 0)
+
+    queue = ReportQueue([broken], retries=2, backoff=0.001)
+    await queue(None, "1.2.3.0/24")  # type: ignore
+    await queue.shutdown()
+    assert broken.await_count == 3
+    assert (queue.reported, queue.retried, queue.failed) == (0, 2, 1)
+
+
+@pytest.mark.asyncio
+async def test_full() -> None:
+    gate = asyncio.Event()
+
+    async def reporter(request: object, ip_range: str) -> None:
+        await gate.wait()
+
+    queue = ReportQueue([reporter], maxsize=1, workers=1)
+
+    for i in range(4):
+        await queue(None, f"1.2.{i}.0/24")  # type: ignore
+        await asyncio.sleep(0)  # let the worker pick it up
+    assert queue.dropped == 2
+    assert queue.high_water == 1
+    assert queue.in_flight == 2
+
+    gate.set()
+    await queue.shutdown()
+    assert queue.reported == 2
+
+
+@pytest.mark.asyncio
+async def test_no_drain() -> None:
+    async def reporter(request: object, ip_range: str) -> None:
+        await asyncio.Event().wait()
+
+    queue = ReportQueue([reporter], drain=False)
+
+    await queue(None, "1.2.3.0/24")  # type: ignore
+    await asyncio.wait_for(queue.shutdown(), 1)
+    assert queue.reported == 0
+
+
+@pytest.mark.asyncio
+async def test_jail_lifespan() -> None:
+    reporter = mock.AsyncMock()
+    queue = ReportQueue([reporter])
+    jail = IPJail(get_visitor_ip, [], [queue])
+
+    await jail.startup()
+    assert len(queue._tasks) == 4
+    await jail.jail(make_request("1.2.3.4"))
+    await jail.shutdown()
+
+    reporter.assert_awaited_once_with(mock.ANY, "1.2.3.0/24")
+    assert queue._tasks == []
+    # reporters behind the queue are started and stopped with it
+    reporter.startup.assert_awaited_once()
+    reporter.shutdown.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_jail_reporter_lifespan() -> None:
+    reporter = mock.AsyncMock()
+    jail = IPJail(get_visitor_ip, [], [reporter, lambda request, ip_range: None])
+
+    await jail.startup()
+    await jail.shutdown()
+
+    reporter.startup.assert_awaited_once()
+    reporter.shutdown.assert_awaited_once()
@@ -0,0 +1,115 @@
+import asyncio
+from unittest import mock
+
+import pytest
+
+from slowerapi import Limiter
+from slowerapi.limit import Limit
+from slowerapi.storage.hybrid import HybridStorage
+from slowerapi.storage.memory import MemoryStorage
+
+
+def make_storage(remote: MemoryStorage, max_delta: int = 10) -> HybridStorage:
+    storage = HybridStorage(remote, flush_interval=3600, max_delta=max_delta)
+    storage._task = mock.Mock()  # flushed by hand
+    storage.time_func = lambda: remote.time_func()
+    return storage
+
+
+@pytest.mark.asyncio
+async def test_local() -> None:
+    remote = MemoryStorage()
+    remote.hit_many = mock.AsyncMock(wraps=remote.hit_many)  # type: ignore
+    storage = make_storage(remote)
+    limits = [Limit(5, 10)]
+
+    for _ in range(5):
+        (ratelimited,) = await storage.hit("global", "key", limits, True)
+    assert ratelimited.remaining == 0
+    (ratelimited,) = await storage.hit("global", "key", limits, True)
+    assert ratelimited.limited
+    remote.hit_many.assert_not_awaited()
+
+    await storage.flush()
+    (ratelimited,) = await remote.hit("global", "key", limits, False)
+    assert ratelimited.limited
+    remote.hit_many.assert_awaited_once_with([("global", "key", limits, 6)])
+    await storage.flush()  # nothing left to send
+    remote.hit_many.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_workers() -> None:
+    remote = MemoryStorage()
+    remote.time_func = lambda: 100.0
+    first, second = make_storage(remote), make_storage(remote)
+    limits = [Limit(10, 10)]
+
+    for _ in range(4):
+        await first.hit("global", "key", limits, True)
+    await first.flush()
+    await second.hit("global", "key", limits, True)
+    await second.flush()
+
+    # the second worker has seen the first worker's hits
+    (ratelimited,) = await second.hit("global", "key", limits, False)
+    assert ratelimited.remaining == 5
+    assert ratelimited.reset_after == 10
+    # the first one has not yet, it only knows its own
+    (ratelimited,) = await first.hit("global", "key", limits, False)
+    assert ratelimited.remaining == 6
+
+    remote.time_func = lambda: 110.0  # the window is over
+    (ratelimited,) = await second.hit("global", "key", limits, False)
+    assert ratelimited.remaining == 10
+
+
+@pytest.mark.asyncio
+async def test_max_delta() -> None:
+    remote = MemoryStorage()
+    storage = make_storage(remote, max_delta=3)
+    limits = [Limit(10, 10)]
+
+    await storage.hit("global", "key", limits, True)
+    await storage.hit("global", "key", limits, True, 2)  # sent right away
+    (ratelimited,) = await remote.hit("global", "key", limits, False)
+    assert ratelimited.remaining == 7
+    assert not storage._dirty
+
+
+@pytest.mark.asyncio
+async def test_remote_down() -> None:
+    remote = MemoryStorage()
+    storage = make_storage(remote, max_delta=2)
+    limits = [Limit(10, 10)]
+    remote.hit_many = mock.AsyncMock(side_effect=ConnectionError)  # type: ignore
+
+    await storage.hit("global", "key", limits, True)
+    (ratelimited,) = await storage.hit("global", "key", limits, True)
+    assert ratelimited.remaining == 8  # still decided locally
+    with pytest.raises(ConnectionError):
+        await storage.flush()
+
+    del remote.hit_many
+    await storage.flush()
+    (ratelimited,) = await remote.hit("global", "key", limits, False)
+    assert ratelimited.remaining == 8
+
+
+@pytest.mark.asyncio
+async def test_lifespan() -> None:
+    remote = MemoryStorage()
+    storage = HybridStorage(remote, flush_interval=0.001)
+    limiter = Limiter(lambda request: "", storage=storage)
+    limits = [Limit(10, 10)]
+
+    await limiter.startup()
+    await limiter.hit("global", "key", limits, True)
+    await asyncio.sleep(0.02)
+    assert storage.flushes == 1
+    await limiter.hit("global", "key", limits, True)
+    await limiter.shutdown()
+
+    (ratelimited,) = await remote.hit("global", "key", limits, False)
+    assert ratelimited.remaining == 8
+    assert storage._task is None
@@ -0,0 +1,49 @@
+import pytest
+
+from slowerapi.limit import Limit
+from slowerapi.storage.memory import MemoryStorage
+
+
+@pytest.mark.asyncio
+async def test_hit() -> None:
+    storage = MemoryStorage()
+    storage.time_func = lambda: 100.0
+    limits = [Limit(2, 10), Limit(5, 60)]
+
+    short, long = await storage.hit("global", "key", limits, True)
+    assert (short.remaining, short.reset_after) == (1, 10)
+    assert (long.remaining, long.reset_after) == (4, 60)
+
+    short, long = await storage.hit("global", "key", limits, True, 2)
+    assert short.limited
+    assert long.remaining == 2
+    (short,) = await storage.hit("global", "key", limits[:1], False)
+    assert short.limited
+
+    storage.time_func = lambda: 110.0
+    (short,) = await storage.hit("global", "key", limits[:1], True)
+    assert short.remaining == 1
+
+
+@pytest.mark.asyncio
+async def test_hit_many() -> None:
+    storage = MemoryStorage()
+    limits = [Limit(2, 10)]
+
+    first, second = await storage.hit_many(
+        [("global", "a", limits, 1), ("global", "b", limits, 3)]
+    )
+    assert first[0].remaining == 1
+    assert second[0].limited
+
+
+@pytest.mark.asyncio
+async def test_sweep() -> None:
+    storage = MemoryStorage()
+    storage.time_func = lambda: 0.0
+    for i in range(1023):
+        await storage.hit("global", str(i), [Limit(1, 1)], True)
+
+    storage.time_func = lambda: 1.0
+    await storage.hit("global", "last", [Limit(1, 1)], True)
+    assert list(storage._windows) == ["global:1/1:last"]
@@ -0,0 +1,103 @@
+from unittest import mock
+
+import pytest
+from fakeredis import aioredis
+
+from slowerapi.limit import Limit
+from slowerapi.storage.redis import RedisStorage
+
+
+@pytest.mark.asyncio
+async def test_hit() -> None:
+    storage = RedisStorage(aioredis.FakeRedis())
+    limits = [Limit(2, 10), Limit(5, 60)]
+
+    short, long = await storage.hit("global", "key", limits, True)
+    assert not short.limited
+    assert short.remaining == 1
+    assert 9 < short.reset_after <= 10
+    assert long.remaining == 4
+    assert 59 < long.reset_after <= 60
+
+    await storage.hit("global", "key", limits, True)
+    short, long = await storage.hit("global", "key", limits, True)
+    assert short.limited
+    assert short.remaining == 0
+    assert not long.limited
+    assert long.remaining == 2
+
+    short, long = await storage.hit("global", "key", limits, False)
+    assert short.limited
+    assert long.remaining == 2
+
+    (other,) = await storage.hit("global", "other", limits[:1], False)
+    assert not other.limited
+    assert other.remaining == 2
+    assert other.reset_after == 10
+
+
+@pytest.mark.asyncio
+async def test_keys() -> None:
+    client = aioredis.FakeRedis()
+    storage = RedisStorage(client, prefix="test:")
+
+    assert await storage.hit("global", "key", [], True) == []
+    await storage.hit("route", "key", [Limit(2, 10)], True)
+    assert await client.get("test:route:2/10:key") == b"1"
+    assert 0 < await client.ttl("test:route:2/10:key") <= 10
+
+
+def test_from_url() -> None:
+    storage = RedisStorage("redis://localhost:6379/0", max_connections=4)
+    assert storage.client.connection_pool.max_connections == 4
+
+
+@pytest.mark.asyncio
+async def test_shutdown() -> None:
+    storage = RedisStorage("redis://localhost:6379/0")
+    storage.client = mock.Mock(aclose=mock.AsyncMock())
+    await storage.shutdown()
+    storage.client.aclose.assert_awaited_once()
+
+    client = mock.Mock(aclose=mock.AsyncMock())
+    await RedisStorage(client).shutdown()  # passed in, closed by its owner
+    client.aclose.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_cost() -> None:
+    storage = RedisStorage(aioredis.FakeRedis())
+    limits = [Limit(10, 10)]
+
+    (ratelimited,) = await storage.hit("global", "key", limits, True, 4)
+    assert ratelimited.remaining == 6
+    (ratelimited,) = await storage.hit("global", "key", limits, True, 7)
+    assert ratelimited.limited
+
+
+@pytest.mark.asyncio
+async def test_hit_many() -> None:
+    storage = RedisStorage(aioredis.FakeRedis())
+    limits = [Limit(2, 10), Limit(5, 60)]
+
+    first, second, empty = await storage.hit_many(
+        [("global", "a", limits, 1), ("global", "b", limits[1:], 3), ("x", "c", [], 1)]
+    )
+    assert [r.remaining for r in first] == [1, 4]
+    assert [r.remaining for r in second] == [2]
+    assert empty == []
+    (short, long) = await storage.hit("global", "a", limits, False)
+    assert (short.remaining, long.remaining) == (1, 4)
+
+
+@pytest.mark.asyncio
+async def test_hit_many_peek() -> None:
+    storage = RedisStorage(aioredis.FakeRedis())
+    limits = [Limit(2, 10)]
+    await storage.hit("global", "a", limits, True)
+
+    (first,), (second,) = await storage.hit_many(
+        [("global", "a", limits, 1), ("route", "a", limits, 1)], False
+    )
+    assert (first.remaining, second.remaining) == (1, 2)
+    assert await storage.hit_many([("global", "a", [], 1)]) == [[]]
@@ -0,0 +1,107 @@
+import multiprocessing
+from pathlib import Path
+
+import pytest
+
+from slowerapi import Limiter
+from slowerapi.limit import Limit
+from slowerapi.storage.shm import SharedMemoryStrategy, SharedMemoryTable
+
+
+def test_strategy(tmp_path: Path) -> None:
+    table = SharedMemoryTable(str(tmp_path / "table"), slots=64)
+    table.time_func = lambda: 100.0
+    limit_2_10 = Limit(2, 10)
+    strategy = table.strategy(limit_2_10, "global:2/10")
+    assert isinstance(strategy, SharedMemoryStrategy)
+
+    rt = strategy.limit("user_1", False)
+    assert rt.remaining == 2
+    assert rt.reset_after == 10
+
+    rt = strategy.limit("user_1", True)
+    assert rt.remaining == 1
+    table.time_func = lambda: 104.0
+    strategy.limit("user_1", True)
+    rt = strategy.limit("user_1", True)
+    assert rt.limited
+    assert rt.reset_after == 6
+
+    assert not table.strategy(limit_2_10, "other").limit("user_1", True).limited
+
+    table.time_func = lambda: 110.0
+    rt = strategy.limit("user_1", True)
+    assert not rt.limited
+    assert rt.remaining == 1
+    assert rt.reset_after == 10
+    table.close()
+
+
+def test_cost(tmp_path: Path) -> None:
+    table = SharedMemoryTable(str(tmp_path / "table"), slots=64)
+    strategy = table.strategy(Limit(10, 10), "global:10/10")
+
+    assert strategy.limit("user_1", True, 4).remaining == 6
+    assert strategy.limit("user_1", True, 4).remaining == 2
+    assert strategy.limit("user_1", True, 4).limited
+    table.close()
+
+
+def test_shared(tmp_path: Path) -> None:
+    path = str(tmp_path / "table")
+    first = SharedMemoryTable(path, slots=64).strategy(Limit(3, 60), "global")
+    second = SharedMemoryTable(path, slots=64).strategy(Limit(3, 60), "global")
+
+    first.limit("user_1", True)
+    second.limit("user_1", True)
+    assert first.limit("user_1", False).remaining == 1
+
+    with pytest.raises(ValueError):
+        SharedMemoryTable(path, slots=128)
+
+
+def _hit(path: str) -> None:
+    strategy = SharedMemoryTable(path, slots=64).strategy(Limit(100, 60), "global")
+    for _ in range(10):
+        strategy.limit("user_1", True)
+
+
+def test_processes(tmp_path: Path) -> None:
+    path = str(tmp_path / "table")
+    strategy = SharedMemoryTable(path, slots=64).strategy(Limit(100, 60), "global")
+    ctx = multiprocessing.get_context("fork")
+    processes = [ctx.Process(target=_hit, args=(path,)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert strategy.limit("user_1", False).remaining == 60
+
+
+def test_eviction(tmp_path: Path) -> None:
+    table = SharedMemoryTable(str(tmp_path / "table"), slots=2, group_size=2)
+    now = 100.0
+    table.time_func = lambda: now
+    strategy = table.strategy(Limit(5, 10), "global")
+
+    strategy.limit("user_1", True)
+    now = 101.0
+    strategy.limit("user_2", True)
+    strategy.limit("user_2", True)
+    assert table.evictions == 0
+
+    strategy.limit("user_3", True)
+    assert table.evictions == 1
+    assert strategy.limit("user_1", False).remaining == 5  # oldest window evicted
+    assert strategy.limit("user_2", False).remaining == 3
+
+
+def test_limiter(tmp_path: Path) -> None:
+    table = SharedMemoryTable(str(tmp_path / "table"), slots=64)
+    limiter = Limiter(lambda req: "", strategy=table.strategy)
+
+    limiter.check_bucket("global", "key", [Limit(1, 1)], True)
+    bucket = limiter.buckets["global:1/1"]
+    assert isinstance(bucket, SharedMemoryStrategy)
+    assert bucket.name == "global:1/1"
@@ -0,0 +1,101 @@
+import asyncio
+import time
+from unittest import mock
+
+import pytest
+from starlette.routing import Route
+from starlette.types import Scope
+
+from slowerapi import Limiter, RatelimitMiddleware
+from slowerapi.adaptive import LoadShedder
+
+
+def test_update() -> None:
+    shedder = LoadShedder(max_lag=0.05, max_in_flight=10, min_factor=0.2)
+
+    shedder.update(0.1)
+    assert shedder.factor == 0.5
+    shedder.update(0.1)
+    shedder.update(0.1)
+    assert shedder.factor == 0.2  # never below min_factor
+
+    shedder.update(0.0)
+    assert shedder.factor == pytest.approx(0.25)
+    shedder.in_flight = 11
+    shedder.update(0.0)
+    assert shedder.factor == pytest.approx(0.2)
+
+    shedder.in_flight = 0
+    for _ in range(20):
+        shedder.update(0.0)
+    assert shedder.factor == 1.0
+
+
+def test_scale() -> None:
+    shedder = LoadShedder()
+    shedder.factor = 0.4
+    shedder.random = mock.Mock(return_value=0.3)
+    assert shedder.scale(1) == 3  # 2.5 rounded up
+    shedder.random.return_value = 0.7
+    assert shedder.scale(1) == 2
+    assert shedder.scale(2) == 5
+
+
+@pytest.mark.asyncio
+async def test_run() -> None:
+    shedder = LoadShedder(interval=0.01, max_lag=0.02)
+    shedder.start()
+    await asyncio.sleep(0.001)
+    time.sleep(0.05)  # block the loop
+    await asyncio.sleep(0.02)
+    await shedder.stop()
+
+    assert shedder.factor < 1
+    assert shedder._task is None
+
+
+@pytest.mark.asyncio
+async def test_lifespan() -> None:
+    shedder = LoadShedder()
+    limiter = Limiter(mock.Mock(), shedder=shedder)
+
+    await limiter.startup()
+    assert shedder._task is not None
+    await limiter.shutdown()
+    assert shedder._task is None
+
+
+@pytest.mark.asyncio
+async def test_middleware() -> None:
+    shedder = LoadShedder()
+    limiter = Limiter(mock.Mock(return_value="key"), ("10/1d",), shedder=shedder)
+
+    @limiter.sheddable(below=0.5)
+    def low() -> None:
+        pass  # pragma: no cover
+
+    def normal() -> None:
+        pass  # pragma: no cover
+
+    shedder.factor = 0.4
+    shedder.random = mock.Mock(return_value=0.9)
+    app = mock.AsyncMock()
+    middleware = RatelimitMiddleware(app)
+    scope_app = mock.Mock()
+    scope_app.state.limiter = limiter
+    scope_app.routes = [Route("/low", low), Route("/", normal)]
+
+    def make_scope(path: str) -> Scope:
+        return {"type": "http", "app": scope_app, "method": "GET", "path": path}
+
+    send = mock.AsyncMock()
+    await middleware(make_scope("/low"), mock.AsyncMock(), send)
+    assert send.await_args_list[0].args[0]["status"] == 503
+    assert shedder.shed == 1
+
+    await middleware(make_scope("/"), mock.AsyncMock(), mock.AsyncMock())
+    app.assert_awaited_once()
+    # the hit cost 1 / 0.4, rounded down
+    ratelimited = limiter.check_bucket("global", "key", limiter.global_limits, False)
+    assert ratelimited is not None and ratelimited.remaining == 8
+    assert shedder.in_flight == 0
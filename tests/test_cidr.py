@@ -0,0 +1,95 @@
+import math
+import random
+
+import pytest
+
+from slowerapi.cidr import RadixTree, format_network, network, pack_ip
+
+
+def test_pack_ip() -> None:
+    assert pack_ip("1.2.3.4") == (32, 0x01020304)
+    assert pack_ip("::ffff:1.2.3.4") == (32, 0x01020304)
+    assert pack_ip("::1") == (128, 1)
+    with pytest.raises(ValueError):
+        pack_ip("testclient")
+
+
+def test_format_network() -> None:
+    assert format_network(0x01020300, 32, 24) == "1.2.3.0/24"
+    assert format_network(0x1122 << 112, 128, 16) == "1122::/16"
+    assert format_network(0, 128, 0) == "::/0"
+    assert format_network(1, 128, 128) == "0000:0000:0000:0000:0000:0000:0000:0001/128"
+
+
+def test_lookup() -> None:
+    tree = RadixTree(32)
+    assert not tree
+    assert tree.lookup(0x01020304, 0) is None
+
+    tree.insert(0x01020304, 24)
+    tree.insert(0x0A000000, 8, expires=10)
+    tree.insert(0x01020381, 32, expires=5)
+    assert len(tree) == 3
+
+    assert tree.lookup(0x010203FF, 0) == math.inf
+    assert tree.lookup(0x01020481, 0) is None
+    assert tree.lookup(0x0AFFFFFF, 0) == 10
+    assert tree.lookup(0x0B000000, 0) is None
+
+    # the shortest covering prefix is found first
+    assert tree.lookup(0x01020381, 0) == math.inf
+
+
+def test_expiry() -> None:
+    tree = RadixTree(32)
+    tree.insert(0x01020304, 24, expires=10)
+    tree.insert(0x01020304, 32, expires=20)
+
+    assert tree.lookup(0x01020304, 5) == 10
+    assert tree.lookup(0x01020304, 15) == 20
+    assert len(tree) == 1  # the expired /24 was dropped on the way
+    assert tree.lookup(0x01020305, 15) is None
+    assert tree.prune(25) == 1
+    assert not tree
+
+
+def test_remove() -> None:
+    tree = RadixTree(32)
+    tree.insert(0x01020304, 24)
+    tree.insert(0x01020404, 24)
+
+    assert not tree.remove(0x01020304, 16)
+    assert tree.remove(0x01020304, 24)
+    assert not tree.remove(0x01020304, 24)
+    assert list(tree.items()) == [(0x01020400, 24, math.inf)]
+    # the branch node left behind was spliced out
+    assert tree._root.children[0] is not None
+    assert tree._root.children[0].length == 24
+
+
+def random_addr(rng: random.Random) -> int:
+    # few distinct top bits so the prefixes overlap
+    return rng.getrandbits(12) << 116 | rng.getrandbits(116)
+
+
+def test_random() -> None:
+    rng = random.Random(0)
+    tree = RadixTree(128)
+    entries = set()
+    for _ in range(500):
+        length = rng.choice((10, 14, 16, 20, 128))
+        prefix = network(random_addr(rng), 128, length)
+        tree.insert(prefix, length)
+        entries.add((prefix, length))
+    assert len(tree) == len(entries)
+    assert set((p, n) for p, n, _ in tree.items()) == entries
+
+    for _ in range(500):
+        addr = random_addr(rng)
+        covered = any(network(addr, 128, n) == p for p, n in entries)
+        assert (tree.lookup(addr, 0) is not None) == covered
+
+    for prefix, length in entries:
+        assert tree.remove(prefix, length)
+    assert not tree
+    assert tree._root.children == [None, None]
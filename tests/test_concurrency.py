@@ -0,0 +1,147 @@
+import asyncio
+from unittest import mock
+
+import pytest
+from starlette.routing import Route
+from starlette.types import Receive, Scope, Send
+
+from slowerapi import Limiter, RatelimitMiddleware
+from slowerapi.concurrency import ConcurrencyLimit
+
+
+@pytest.mark.asyncio
+async def test_reject() -> None:
+    limit = ConcurrencyLimit(2)
+
+    assert await limit.acquire("a")
+    assert await limit.acquire("b")  # keys share the slots
+    assert not await limit.acquire("c")
+    assert limit.rejected == 1
+    assert limit.in_flight() == 2
+
+    limit.release("a")
+    assert await limit.acquire("c")
+    limit.release("b")
+    limit.release("c")
+    assert limit._active == {}
+
+
+@pytest.mark.asyncio
+async def test_per_key() -> None:
+    limit = ConcurrencyLimit(1, per_key=True)
+
+    assert await limit.acquire("a")
+    assert await limit.acquire("b")
+    assert not await limit.acquire("a")
+    assert limit.in_flight("a") == 1
+
+    limit.release("a")
+    limit.release("b")
+    assert limit._active == {}
+
+
+@pytest.mark.asyncio
+async def test_queue() -> None:
+    limit = ConcurrencyLimit(1, queue_timeout=1)
+    assert await limit.acquire("a")
+
+    waiter = asyncio.create_task(limit.acquire("b"))
+    await asyncio.sleep(0)
+    assert limit.queued == 1
+    assert not waiter.done()
+
+    limit.release("a")  # handed over, not freed
+    assert await waiter
+    assert limit.in_flight() == 1
+    limit.release("b")
+    assert not limit._active and not limit._waiters
+
+
+@pytest.mark.asyncio
+async def test_queue_timeout() -> None:
+    limit = ConcurrencyLimit(1, queue_timeout=0.01)
+    assert await limit.acquire("a")
+
+    assert not await limit.acquire("b")
+    assert limit.rejected == 1
+    assert limit.queued == 0
+
+    limit.release("a")  # skips the waiter that gave up
+    assert not limit._active and not limit._waiters
+
+
+@pytest.mark.asyncio
+async def test_queue_timeout_handed_over() -> None:
+    limit = ConcurrencyLimit(1, queue_timeout=1)
+    assert await limit.acquire("a")
+
+    async def wait_for(waiter: asyncio.Future[None], timeout: float) -> None:
+        # the slot is handed over in the same step the timeout fires
+        limit.release("a")
+        raise asyncio.TimeoutError
+
+    with mock.patch("asyncio.wait_for", wait_for):
+        assert await limit.acquire("b")
+    assert limit.rejected == 0
+    assert limit.in_flight() == 1
+    limit.release("b")
+    assert not limit._active and not limit._waiters
+
+
+@pytest.mark.asyncio
+async def test_queue_full() -> None:
+    limit = ConcurrencyLimit(1, queue_timeout=1, max_queue=1)
+    assert await limit.acquire("a")
+
+    waiter = asyncio.create_task(limit.acquire("b"))
+    await asyncio.sleep(0)
+    assert not await limit.acquire("c")
+
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    limit.release("a")
+    assert not limit._active and not limit._waiters
+
+
+@pytest.mark.asyncio
+async def test_middleware() -> None:
+    started, finish = asyncio.Event(), asyncio.Event()
+
+    async def app(scope: Scope, receive: Receive, send: Send) -> None:
+        started.set()
+        await finish.wait()
+        raise RuntimeError("failed")
+
+    limiter = Limiter(mock.Mock(return_value="key"))
+    limiter.add_global_concurrency(10)
+
+    @limiter.concurrency(1)
+    def endpoint() -> None:
+        pass  # pragma: no cover
+
+    middleware = RatelimitMiddleware(app)
+    scope_app = mock.Mock()
+    scope_app.state.limiter = limiter
+    scope_app.routes = [Route("/", endpoint)]
+
+    def make_scope() -> Scope:
+        return {"type": "http", "app": scope_app, "method": "GET", "path": "/"}
+
+    first = asyncio.create_task(
+        middleware(make_scope(), mock.AsyncMock(), mock.AsyncMock())
+    )
+    await started.wait()
+
+    send = mock.AsyncMock()
+    await middleware(make_scope(), mock.AsyncMock(), send)
+    assert send.await_args_list[0].args[0]["status"] == 429
+    (route_limit,) = limiter.route_concurrency[f"{__name__}.endpoint"]
+    assert route_limit.rejected == 1
+
+    finish.set()
+    with pytest.raises(RuntimeError):
+        await first
+    # released even though the app raised
+    assert route_limit.in_flight() == 0
+    assert limiter.global_concurrency[0].in_flight() == 0
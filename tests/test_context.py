@@ -0,0 +1,82 @@
+import gc
+import typing
+import weakref
+from unittest import mock
+
+import pytest
+from starlette.requests import Request
+
+from slowerapi import IPJail, Limiter, RatelimitMiddleware
+from slowerapi.context import STATE_KEY, RequestContext, get_context
+
+from .helpers import make_request
+
+
+def test_get_context() -> None:
+    request = make_request()
+    context = get_context(request)
+
+    assert request.scope["state"][STATE_KEY] is context
+    assert get_context(Request(request.scope)) is context
+
+
+def test_no_cycle() -> None:
+    request = make_request()
+    get_context(request).memo(lambda request: "key", request)
+    ref = weakref.ref(request)
+    gc.disable()
+    try:
+        del request  # freed by reference counting, no collection needed
+        assert ref() is None
+    finally:
+        gc.enable()
+
+
+def test_memo() -> None:
+    request = make_request()
+    context = RequestContext()
+    ip_func = mock.Mock(return_value="1.2.3.4")
+
+    assert context.memo(ip_func, request) == "1.2.3.4"
+    assert context.packed_ip(ip_func, request) == (32, 0x01020304)
+    assert context.ip_range(ip_func, request) == "1.2.3.0/24"
+    assert context.ip_range(ip_func, request, ipv4_prefix=16) == "1.2.0.0/16"
+    ip_func.assert_called_once_with(request)
+
+
+def test_set_ip() -> None:
+    context = RequestContext()
+    ip_func = mock.Mock()
+
+    context.set_ip(ip_func, "::1")
+    assert context.packed_ip(ip_func, make_request()) == (128, 1)
+    ip_func.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_middleware() -> None:
+    middleware = RatelimitMiddleware(mock.AsyncMock())
+    ip_func = mock.Mock(return_value="9.9.9.9")
+    jail = IPJail(ip_func, ["0/1s"])
+    await jail.jail(make_request())  # not empty, so is_jailed looks the ip up
+    ip_func.reset_mock(return_value=True)
+    ip_func.return_value = "1.2.3.4"
+
+    app = mock.Mock()
+    app.state.limiter = limiter = Limiter(ip_func, ("1/1d",), jail=jail)
+    app.routes = []
+    scope: dict[str, typing.Any] = {
+        "type": "http",
+        "app": app,
+        "method": "GET",
+        "path": "/",
+        "headers": [],
+    }
+    limiter.check_bucket("global", "1.2.3.4", limiter.global_limits, True)
+
+    await middleware(scope, mock.AsyncMock(), mock.AsyncMock())
+
+    # the key func, is_jailed and jail all share one call
+    ip_func.assert_called_once()
+    assert scope["state"][STATE_KEY].key == "1.2.3.4"
+    assert jail.is_jailed(make_request())
@@ -0,0 +1,138 @@
+import asyncio
+from unittest import mock
+
+import pytest
+
+from slowerapi import Limiter
+from slowerapi.expiry import ExpiryEngine
+from slowerapi.limit import Limit
+from slowerapi.strategy import GCRAStrategy, MovingWindowStrategy, SlidingWindowStrategy
+
+from .test_strategy import TimeHelper
+
+
+def test_wheel() -> None:
+    with TimeHelper() as th:
+        engine = ExpiryEngine(tick=1, bits=2, levels=2, time_func=th.time_func)
+        strategy = mock.Mock()
+        strategy.expires_in.return_value = 0
+
+        # level 0, level 1 and past the horizon of 16 ticks
+        for delay in (0, 3, 9, 40):
+            engine.schedule(strategy, str(delay), delay)
+        assert engine.pending == 4
+        assert engine.reclaim() == 1
+        strategy.forget.assert_called_once_with("0")
+
+        forgotten = []
+        for _ in range(45):
+            th.advance(1)
+            engine.advance()
+            engine.reclaim()
+            forgotten.append(len(strategy.forget.call_args_list))
+        # each key is reclaimed on the tick it expires
+        assert forgotten[1:4] == [1, 2, 2]
+        assert forgotten[7:10] == [2, 3, 3]
+        assert forgotten[38:41] == [3, 4, 4]
+        assert engine.pending == 0
+        assert engine.reclaimed == 4
+
+
+def test_reclaim() -> None:
+    engine = ExpiryEngine(tick=1, batch=2)
+    strategy = mock.Mock()
+    strategy.expires_in.side_effect = [None, 5, 0, 0]
+
+    for key in "abcd":
+        engine.schedule(strategy, key, 0)
+
+    assert engine.reclaim() == 0  # gone and rescheduled
+    assert engine.pending == 3
+    assert engine.reclaim() == 2
+    assert engine.reclaimed == 2
+    assert [call.args for call in strategy.forget.call_args_list] == [("c",), ("d",)]
+
+
+def test_strategies() -> None:
+    with TimeHelper() as th:
+        engine = ExpiryEngine(tick=1, time_func=th.time_func)
+        gcra = GCRAStrategy(Limit(2, 10))
+        sliding = SlidingWindowStrategy(Limit(2, 10))
+        strategies: list[GCRAStrategy | SlidingWindowStrategy] = [gcra, sliding]
+        for strategy in strategies:
+            strategy.time_func = th.time_func
+            strategy.expiry = engine
+            strategy.limit("user_1", True)
+            strategy.limit("user_1", True)
+        assert engine.pending == 2
+
+        th.advance(5)
+        gcra.limit("user_1", True)  # moves the tat to 15
+        engine.advance()
+        engine.reclaim()
+        assert engine.pending == 2
+
+        th.advance(5)
+        engine.advance()
+        assert engine.reclaim() == 0  # rescheduled
+        assert engine.pending == 2
+
+        th.advance(5)
+        engine.advance()
+        assert engine.reclaim() == 1
+        assert gcra._tats == {}
+        assert "user_1" in sliding._counters
+
+        th.advance(5)
+        engine.advance()
+        assert engine.reclaim() == 1
+        assert sliding._counters == {}
+
+
+def test_moving_window() -> None:
+    with TimeHelper() as th:
+        engine = ExpiryEngine(tick=1, time_func=th.time_func)
+        window = MovingWindowStrategy(Limit(2, 10), max_keys=200)
+        window.time_func = th.time_func
+        window.expiry = engine
+        for i in range(100):
+            window.limit(f"user_{i}", True)
+        assert engine.pending == 100
+
+        th.advance(10)
+        engine.advance()
+        # the windows lapsed, but the keys are still held until reclaimed
+        assert window.expires_in("user_0") == 0
+        assert engine.reclaim() == 100
+        assert engine.reclaimed == 100
+        assert window.key_count() == 0
+        assert window.expires_in("user_0") is None
+
+
+@pytest.mark.asyncio
+async def test_lifespan() -> None:
+    engine = ExpiryEngine(tick=0.001)
+    limiter = Limiter(lambda req: "", strategy=GCRAStrategy, expiry=engine)
+
+    limiter.check_bucket("global", "key", [Limit(1000, 0.002)], True)  # type: ignore
+    assert limiter.buckets["global:1000/0.002"].expiry is engine
+    await limiter.startup()
+    await asyncio.sleep(0.05)
+    await limiter.shutdown()
+
+    assert engine.reclaimed == 1
+    assert engine._task is None
+
+
+@pytest.mark.asyncio
+async def test_lazy_start() -> None:
+    engine = ExpiryEngine(tick=0.001)
+    strategy = GCRAStrategy(Limit(1000, 0.002))  # type: ignore
+    strategy.expiry = engine
+
+    strategy.limit("key", True)  # no startup, the first key starts the task
+    assert engine._task is not None
+    await asyncio.sleep(0.05)
+    assert engine.reclaimed == 1
+    assert engine.pending == 0
+    await engine.stop()
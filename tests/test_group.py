@@ -0,0 +1,34 @@
+from unittest import mock
+
+from slowerapi.group import LimitGroup
+from slowerapi.limit import Limit
+from slowerapi.strategy import Ratelimited
+
+
+def make_group(*results: tuple[bool, int, float]) -> LimitGroup:
+    limits = [Limit(i + 1, 1) for i in range(len(results))]
+    strategies = [mock.Mock(**{"check.return_value": result}) for result in results]
+    return LimitGroup("bucket", limits, strategies)  # type: ignore
+
+
+def test_check() -> None:
+    group = make_group((False, 5, 1.0), (False, 2, 1.0), (False, 3, 1.0))
+    assert group.check("key", True, 2) == Ratelimited(False, group.limits[1], 2, 1.0)
+    for strategy in group.strategies:
+        strategy.check.assert_called_once_with("key", True, 2)  # type: ignore
+
+    group = make_group((False, 0, 1.0), (True, 0, 2.0), (True, 0, 5.0), (True, 0, 3.0))
+    assert group.check("key", False) == Ratelimited(True, group.limits[2], 0, 5.0)
+
+
+def test_check_empty() -> None:
+    assert make_group().check("key", True) is None
+
+
+def test_is_for() -> None:
+    group = make_group((False, 1, 1.0))
+
+    assert group.is_for(group.limits)
+    assert not group.is_for(list(group.limits))
+    group.limits.append(Limit(1, 1))
+    assert not group.is_for(group.limits)
@@ -0,0 +1,107 @@
+import functools
+import json
+import random
+from unittest import mock
+
+import pytest
+from starlette.requests import Request
+
+from slowerapi import Limiter
+from slowerapi.hitters import HeavyHitter, HeavyHitters
+from slowerapi.limiter import MAX_TOP_KEYS
+from slowerapi.storage.memory import MemoryStorage
+
+
+def test_top() -> None:
+    hitters = HeavyHitters(capacity=2)
+    hitters.time_func = lambda: 0.0
+    hitters.add("a", 3)
+    hitters.add("b")
+    hitters.add("b")
+    hitters.add("c")  # replaces b, the lowest
+
+    assert hitters.top(1) == [HeavyHitter("a", 3, 0)]
+    assert hitters.top() == [HeavyHitter("a", 3, 0), HeavyHitter("c", 3, 2)]
+
+
+def test_accuracy() -> None:
+    rng = random.Random(0)
+    weights = [1 / (rank + 1) for rank in range(10_000)]
+    stream = rng.choices(range(10_000), weights, k=50_000)
+    exact: dict[str, int] = {}
+    hitters = HeavyHitters(capacity=100)
+    hitters.time_func = lambda: 0.0
+    for key in map(str, stream):
+        exact[key] = exact.get(key, 0) + 1
+        hitters.add(key)
+
+    top = hitters.top(10)
+    assert [hitter.key for hitter in top[:3]] == ["0", "1", "2"]
+    for hitter in top:
+        assert hitter.hits - hitter.error <= exact[hitter.key] <= hitter.hits
+    assert len(hitters._current.heap) <= 4 * 100 + 1
+
+
+def test_window() -> None:
+    now = 0.0
+    hitters = HeavyHitters(capacity=1, window=10)
+    hitters.time_func = lambda: now
+    hitters.add("a", 3)
+
+    now = 10.0
+    hitters.add("b")
+    # each could have had up to the other's count in the window it is missing
+    assert hitters.top() == [HeavyHitter("a", 4, 1), HeavyHitter("b", 4, 3)]
+
+    now = 20.0
+    assert hitters.top() == [HeavyHitter("b", 1, 0)]
+    now = 40.0
+    assert hitters.top() == []
+
+
+@pytest.mark.asyncio
+async def test_limiter() -> None:
+    limiter = Limiter(
+        mock.Mock(), ["10/1m"], heavy_hitters=functools.partial(HeavyHitters, 10)
+    )
+    for key in ("a", "b", "a"):
+        limiter.check_bucket("global", key, limiter.global_limits, True)
+    limiter.check_bucket("global", "b", limiter.global_limits, False)
+    limiter.check_bucket("global", "c", limiter.global_limits, True, 5)
+
+    assert limiter.top_keys("global", 2) == [
+        HeavyHitter("c", 5, 0),
+        HeavyHitter("a", 2, 0),
+    ]
+    assert limiter.top_keys("other") == []
+
+    limiter.storage = MemoryStorage()
+    await limiter.hit("route", "d", limiter.global_limits, True)
+    assert limiter.top_keys("route") == [HeavyHitter("d", 1, 0)]
+
+    request = Request({"type": "http", "query_string": b"n=1"})
+    response = await limiter.top_keys_endpoint(request)
+    assert json.loads(response.body) == {
+        "global": [{"key": "c", "hits": 5, "error": 0}],
+        "route": [{"key": "d", "hits": 1, "error": 0}],
+    }
+    request = Request({"type": "http", "query_string": b"bucket=route"})
+    response = await limiter.top_keys_endpoint(request)
+    assert json.loads(response.body) == {
+        "route": [{"key": "d", "hits": 1, "error": 0}]
+    }
+
+    request = Request({"type": "http", "query_string": b"n=abc"})
+    response = await limiter.top_keys_endpoint(request)
+    assert response.status_code == 400
+    limiter.top_keys = mock.Mock(return_value=[])  # type: ignore
+    request = Request({"type": "http", "query_string": b"n=1000000"})
+    await limiter.top_keys_endpoint(request)
+    limiter.top_keys.assert_called_with(mock.ANY, MAX_TOP_KEYS)
+
+
+def test_off() -> None:
+    limiter = Limiter(mock.Mock(), ["10/1m"])
+    limiter.check_bucket("global", "a", limiter.global_limits, True)
+    assert limiter.top_keys("global") == []
+    assert limiter.hitters == {}
@@ -2,39 +2,91 @@ from unittest import mock
 
 import pytest
 
-from slowerapi import IPJail
+from slowerapi import IPJail, get_visitor_ip
 from slowerapi.jail import reduce_ip_range
 
+from .helpers import make_request
+
 
 def test_reduce_ip_range() -> None:
     assert reduce_ip_range("1.2.3.4") == "1.2.3.0/24"
     inp = "0011:2233:4455:6677:0011:2233:4455:6677"
     assert reduce_ip_range(inp) == "0011:2233:4455:6677::/64"
+    assert reduce_ip_range("1.2.3.4", ipv4_prefix=16) == "1.2.0.0/16"
+    assert reduce_ip_range(inp, ipv6_prefix=48) == "0011:2233:4455::/48"
 
 
 def test_jail_limit() -> None:
-    jail = IPJail(str, ["50/1m"])
+    jail = IPJail(get_visitor_ip, ["50/1m"])
     assert jail.limits[0].requests == 50
     assert jail.limits[0].window == 60
 
 
 @pytest.mark.asyncio
 async def test_is_jailed() -> None:
-    jail = IPJail(str, [])
-    assert not jail.is_jailed("1.2.3.0")  # type: ignore
-    assert not jail.is_jailed("1.2.3.4")  # type: ignore
-    await jail.jail("1.2.3.4")  # type: ignore
-    assert jail.is_jailed("1.2.3.4")  # type: ignore
-    assert jail.is_jailed("1.2.3.0")  # type: ignore
+    jail = IPJail(get_visitor_ip, [])
+    assert not jail.is_jailed(make_request("1.2.3.0"))
+    assert not jail.is_jailed(make_request("1.2.3.4"))
+    await jail.jail(make_request("1.2.3.4"))
+    assert jail.is_jailed(make_request("1.2.3.4"))
+    assert jail.is_jailed(make_request("1.2.3.0"))
 
 
 @pytest.mark.asyncio
 async def test_reporter() -> None:
     reporter = mock.AsyncMock()
-    args = ("1.2.3.4", "1.2.3.0/24")
-    jail = IPJail(str, "", [reporter])
+    args = (mock.ANY, "1.2.3.0/24")
+    jail = IPJail(get_visitor_ip, "", [reporter])
 
-    await jail.jail("1.2.3.4")  # type: ignore
+    await jail.jail(make_request("1.2.3.4"))
     reporter.assert_awaited_once_with(*args)
-    await jail.jail("1.2.3.4")  # type: ignore
+    await jail.jail(make_request("1.2.3.4"))
     reporter.assert_awaited_once_with(*args)  # not called again
+
+
+@pytest.mark.asyncio
+async def test_prefixes() -> None:
+    jail = IPJail(get_visitor_ip, [], ipv4_prefix=32, ipv6_prefix=48)
+    await jail.jail(make_request("1.2.3.4"))
+    await jail.jail(make_request("11:2233:4455:6677::1"))
+
+    assert jail.is_jailed(make_request("1.2.3.4"))
+    assert not jail.is_jailed(make_request("1.2.3.5"))
+    assert jail.is_jailed(make_request("::ffff:1.2.3.4"))
+    assert jail.is_jailed(make_request("11:2233:4455:ffff::"))
+    assert not jail.is_jailed(make_request("11:2233:4456::"))
+
+
+@pytest.mark.asyncio
+async def test_jail_time() -> None:
+    reporter = mock.AsyncMock()
+    jail = IPJail(get_visitor_ip, [], [reporter], jail_time=60)
+    jail.time_func = mock.Mock(return_value=1000.0)
+
+    await jail.jail(make_request("1.2.3.4"))
+    assert jail.is_jailed(make_request("1.2.3.4"))
+    jail.time_func.return_value = 1060.0
+    assert not jail.is_jailed(make_request("1.2.3.4"))
+
+    await jail.jail(make_request("1.2.3.4"))
+    assert reporter.await_count == 2  # jailed again after the first one expired
+
+
+@pytest.mark.asyncio
+async def test_jail_time_prune() -> None:
+    jail = IPJail(get_visitor_ip, [], jail_time=60)
+    jail.time_func = mock.Mock(return_value=1000.0)
+
+    for i in range(1000):
+        await jail.jail(make_request(f"10.{i // 256}.{i % 256}.1"))
+    jail.time_func.return_value = 1060.0
+    # ranges that are never looked up again are still dropped
+    assert jail.ranges() == {32: 0, 128: 0}
+
+    jail.time_func.return_value = 2000.0
+    for i in range(1000):
+        await jail.jail(make_request(f"10.{i // 256}.{i % 256}.1"))
+    jail.time_func.return_value = 3000.0
+    for i in range(24):
+        await jail.jail(make_request(f"11.0.{i}.1"))
+    assert len(jail._trees[32]) == 24  # pruned once the tree reached 1024
@@ -0,0 +1,137 @@
+import asyncio
+import fcntl
+import math
+import os
+import pathlib
+from unittest import mock
+
+import pytest
+
+from slowerapi import IPJail, get_visitor_ip
+from slowerapi.journal import RECORD, JailJournal
+
+from .helpers import make_request
+
+
+def test_read(tmp_path: pathlib.Path) -> None:
+    path = str(tmp_path / "jail")
+    journal = JailJournal(path)
+    other = JailJournal(path)  # another worker
+
+    assert journal.read() == []
+    journal.append(32, 0x01020300, 24, math.inf)
+    other.append(128, 1 << 127, 1, 100.0)
+    assert journal.read() == [(32, 0x01020300, 24, math.inf), (128, 1 << 127, 1, 100.0)]
+    assert journal.read() == []
+    assert len(other.read()) == 2
+
+
+def test_compact(tmp_path: pathlib.Path) -> None:
+    path = str(tmp_path / "jail")
+    journal = JailJournal(path, compact_after=3)
+    journal.time_func = mock.Mock(return_value=50.0)
+    other = JailJournal(path)
+
+    journal.append(32, 0x01020300, 24, 10.0)  # expired by compaction time
+    other.append(32, 0x05000000, 8, 60.0)
+    assert len(other.read()) == 2
+    journal.append(32, 0x05000000, 8, 100.0)  # the later expiry wins
+
+    # appending never compacts, that is left to the sync task
+    assert (tmp_path / "jail.log").stat().st_size == 3 * RECORD.size
+    assert journal.should_compact()
+    journal.compact(journal.compact_after)
+    assert not journal.should_compact()
+    assert (tmp_path / "jail").stat().st_size == 8 + 8 + RECORD.size
+    assert (tmp_path / "jail.log").stat().st_size == 0
+    # compaction is noticed and the snapshot is read from the start
+    assert other.read() == [(32, 0x05000000, 8, 100.0)]
+
+    other.append(32, 0x06000000, 8, math.inf)
+    assert JailJournal(path).read() == [
+        (32, 0x05000000, 8, 100.0),
+        (32, 0x06000000, 8, math.inf),
+    ]
+
+
+def test_append_while_compacting(tmp_path: pathlib.Path) -> None:
+    path = str(tmp_path / "jail")
+    journal = JailJournal(path)
+    other = JailJournal(path)
+
+    fcntl.flock(other._reader, fcntl.LOCK_EX)  # compacting in another worker
+    journal.append(32, 0x01020300, 24, math.inf)  # does not block
+    assert (tmp_path / "jail.log").stat().st_size == 0
+    fcntl.flock(other._reader, fcntl.LOCK_UN)
+
+    journal.append(32, 0x01020400, 24, math.inf)
+    assert len(other.read()) == 2
+
+
+def test_not_a_snapshot(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "jail").write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        JailJournal(str(tmp_path / "jail")).read()
+
+
+@pytest.mark.asyncio
+async def test_jail(tmp_path: pathlib.Path) -> None:
+    path = str(tmp_path / "jail")
+    jail = IPJail(get_visitor_ip, [], journal=JailJournal(path))
+    await jail.jail(make_request("1.2.3.4"))
+
+    # a restart, or another worker, starts with the range jailed
+    restarted = IPJail(get_visitor_ip, [], journal=JailJournal(path))
+    assert restarted.is_jailed(make_request("1.2.3.4"))
+
+    assert not restarted.is_jailed(make_request("::1"))
+    await jail.jail(make_request("::1"))
+    restarted.sync()
+    assert restarted.is_jailed(make_request("::1"))
+
+
+@pytest.mark.asyncio
+async def test_jail_sync_task(tmp_path: pathlib.Path) -> None:
+    path = str(tmp_path / "jail")
+    jail = IPJail(get_visitor_ip, [], journal=JailJournal(path, sync_interval=0.001))
+    other = IPJail(get_visitor_ip, [], journal=JailJournal(path))
+
+    await jail.startup()
+    await other.jail(make_request("1.2.3.4"))
+    await asyncio.sleep(0.05)
+    await jail.shutdown()
+
+    assert jail.is_jailed(make_request("1.2.3.4"))
+    assert jail._task is None
+    assert jail.journal is not None and jail.journal._closed
+
+
+def test_close(tmp_path: pathlib.Path) -> None:
+    path = str(tmp_path / "jail")
+    journal = JailJournal(path)
+    journal._pending.append(b"\0" * RECORD.size)  # left over by a failed flush
+    descriptors = journal._log, journal._reader
+
+    journal.close()
+    journal.close()  # closing again does nothing
+    assert (tmp_path / "jail.log").stat().st_size == RECORD.size
+    for fd in descriptors:
+        with pytest.raises(OSError):
+            os.fstat(fd)
+
+
+@pytest.mark.asyncio
+async def test_jail_sync_task_compacts(tmp_path: pathlib.Path) -> None:
+    path = str(tmp_path / "jail")
+    journal = JailJournal(path, compact_after=2, sync_interval=0.001)
+    jail = IPJail(get_visitor_ip, [], journal=journal)
+
+    await jail.startup()
+    await jail.jail(make_request("1.2.3.4"))
+    await jail.jail(make_request("1.2.4.4"))
+    assert (tmp_path / "jail.log").stat().st_size == 2 * RECORD.size
+    await asyncio.sleep(0.05)
+    await jail.shutdown()
+
+    assert (tmp_path / "jail.log").stat().st_size == 0
+    assert len(JailJournal(path).read()) == 2
@@ -1,5 +1,12 @@
+import functools
+from unittest import mock
+
+import pytest
+from starlette.routing import Route
+
 from slowerapi import Limiter
 from slowerapi.limit import Limit
+from slowerapi.strategy import GCRAStrategy, Ratelimited
 
 
 def test_limiter() -> None:
@@ -52,3 +59,134 @@ def test_only_count_failed() -> None:
 
     name = f"{test.__module__}.{test.__name__}"
     assert name in limiter.route_only_count_failed
+
+
+def test_route_plan() -> None:
+    limiter = Limiter(lambda req: "", only_count_failed=True)
+    app = mock.Mock()
+
+    @limiter.limit("1/1")
+    def test() -> None:
+        pass  # pragma: no cover
+
+    app.routes = routes = [Route("/", test)]
+    scope = {"type": "http", "method": "GET", "path": "/", "app": app}
+
+    plan = limiter.route_plan(scope)
+    assert plan is not None
+    assert plan.name == f"{test.__module__}.{test.__name__}"
+    assert plan.limits == [Limit(1, 1)]
+    assert plan.only_count_failed
+    assert limiter.route_plan(scope) is plan
+
+    index = limiter._route_index
+    routes.append(Route("/other", test))
+    assert limiter.route_plan(scope) == plan
+    assert limiter._route_index is not index  # rebuilt after the routes changed
+
+    limiter.only_count_failed(test)
+    assert limiter._route_index is None
+
+    limiter.route_plan(scope)
+    limiter.invalidate_routes()
+    assert limiter._route_index is None
+
+
+@pytest.mark.asyncio
+async def test_hit() -> None:
+    limiter = Limiter(lambda req: "")
+    limits = [Limit(1, 1), Limit(2, 1)]
+
+    ratelimited = await limiter.hit("global", "key", limits, True)
+    assert ratelimited is not None
+    assert ratelimited.limit == Limit(1, 1)
+    assert ratelimited.remaining == 0
+
+
+@pytest.mark.asyncio
+async def test_hit_storage() -> None:
+    limit_1_1, limit_2_1 = Limit(1, 1), Limit(2, 1)
+    storage = mock.Mock()
+    storage.hit = mock.AsyncMock(
+        return_value=[
+            Ratelimited(False, limit_1_1, 0, 1),
+            Ratelimited(True, limit_2_1, 0, 0.5),
+        ]
+    )
+    limiter = Limiter(lambda req: "", storage=storage)
+    limiter.check_bucket = mock.Mock()  # type: ignore
+
+    ratelimited = await limiter.hit("global", "key", [limit_1_1, limit_2_1], True, 3)
+    assert ratelimited is not None
+    assert ratelimited.limited
+    assert ratelimited.limit == limit_2_1
+    storage.hit.assert_awaited_once_with(
+        "global", "key", [limit_1_1, limit_2_1], True, 3
+    )
+    limiter.check_bucket.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_hit_many() -> None:
+    limiter = Limiter(lambda req: "")
+    limits = [Limit(1, 1)]
+
+    first, second = await limiter.hit_many(
+        [("global", "key", limits, 1), ("route", "key", limits, 1)], True
+    )
+    assert first is not None and second is not None
+    assert not first.limited and not second.limited
+    # buckets after a limited one are not counted
+    (first,) = await limiter.hit_many(
+        [("global", "key", limits, 1), ("other", "key", limits, 1)], True
+    )
+    assert first is not None and first.limited
+    assert "other" not in limiter._groups
+
+
+def test_storage_strategy() -> None:
+    with pytest.raises(ValueError, match="strategy, max_keys cannot be used"):
+        Limiter(
+            lambda req: "", strategy=GCRAStrategy, max_keys=1, storage=mock.Mock()
+        )
+    with pytest.raises(ValueError, match="snapshot_path"):
+        Limiter(lambda req: "", snapshot_path="limits", storage=mock.Mock())
+
+
+def test_max_keys() -> None:
+    limiter = Limiter(lambda req: "", strategy=GCRAStrategy, max_keys=1)
+    limits = [Limit(1, 1), Limit(2, 1)]
+
+    limiter.check_bucket("global", "key_1", limits, True)
+    assert limiter.buckets["global:1/1"].max_keys == 1
+    assert limiter.evictions == 0
+
+    limiter.check_bucket("global", "key_2", limits, True)
+    assert limiter.evictions == 2
+
+
+def test_max_keys_per_strategy() -> None:
+    # as documented in the README
+    strategy = functools.partial(GCRAStrategy, max_keys=1)
+    limiter = Limiter(lambda req: "", strategy=strategy)
+
+    limiter.check_bucket("global", "key_1", [Limit(1, 1)], True)
+    limiter.check_bucket("global", "key_2", [Limit(1, 1)], True)
+    assert limiter.buckets["global:1/1"].max_keys == 1
+    assert limiter.evictions == 1
+
+
+def test_check_bucket_group() -> None:
+    limiter = Limiter(lambda req: "", ("1/1d",))
+
+    limiter.check_bucket("global", "key", limiter.global_limits, True)
+    group = limiter._groups["global"]
+    limiter.check_bucket("global", "key", limiter.global_limits, True)
+    assert limiter._groups["global"] is group
+
+    limiter.add_global_limit("5/1d")
+    ratelimit = limiter.check_bucket("global", "key", limiter.global_limits, True)
+    assert limiter._groups["global"] is not group
+    # the existing strategy is reused, its count survives the rebuild
+    assert ratelimit is not None and ratelimit.limited
+    assert ratelimit.limit.requests == 1
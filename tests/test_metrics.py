@@ -0,0 +1,163 @@
+from unittest import mock
+
+import pytest
+from starlette.requests import Request
+from starlette.routing import Route
+from starlette.types import Scope
+
+from slowerapi import IPJail, Limiter, RatelimitMiddleware, get_visitor_ip
+from slowerapi.adaptive import LoadShedder
+from slowerapi.metrics import Metrics
+from slowerapi.reporters.queue import ReportQueue
+
+from .helpers import make_request
+
+
+def test_render() -> None:
+    metrics = Metrics()
+    metrics.checks.inc(("global", "allowed"))
+    metrics.checks.inc(("global", "allowed"), 2)
+    metrics.checks.inc(('say "hi"\n', "limited"))
+    metrics.report_time.observe(("reporter",), 0.00002)
+    metrics.report_time.observe(("reporter",), 20.0)
+
+    text = metrics.render()
+    assert "# TYPE slowerapi_checks_total counter\n" in text
+    assert 'slowerapi_checks_total{bucket="global",result="allowed"} 3\n' in text
+    assert 'bucket="say \\"hi\\"\\n",result="limited"} 1\n' in text
+    assert "# TYPE slowerapi_report_seconds histogram\n" in text
+    assert 'slowerapi_report_seconds_bucket{reporter="reporter",le="1e-05"} 0\n' in text
+    assert (
+        'slowerapi_report_seconds_bucket{reporter="reporter",le="2.5e-05"} 1\n' in text
+    )
+    assert 'slowerapi_report_seconds_bucket{reporter="reporter",le="10"} 1\n' in text
+    assert 'slowerapi_report_seconds_bucket{reporter="reporter",le="+Inf"} 2\n' in text
+    assert 'slowerapi_report_seconds_sum{reporter="reporter"} 20.00002\n' in text
+    assert 'slowerapi_report_seconds_count{reporter="reporter"} 2\n' in text
+
+
+def test_callbacks() -> None:
+    callback = mock.Mock()
+    metrics = Metrics(callbacks=[callback])
+    metrics.checks.inc(("global", "allowed"))
+    metrics.overhead.observe(("allowed",), 0.5)
+
+    assert callback.call_args_list == [
+        mock.call(
+            "slowerapi_checks_total", {"bucket": "global", "result": "allowed"}, 1
+        ),
+        mock.call("slowerapi_middleware_seconds", {"result": "allowed"}, 0.5),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_limiter() -> None:
+    metrics = Metrics()
+    limiter = Limiter(mock.Mock(), ["2/1m"], metrics=metrics)
+    limits = limiter.global_limits
+    for key in ("a", "b", "b", "b"):
+        await limiter.hit("global", key, limits, True)
+    limiter.add_global_concurrency(1)
+    limiter.add_global_concurrency(1, per_key=True)
+    limiter.global_concurrency[0].rejected = 7
+    limiter.global_concurrency[1].rejected = 3
+
+    assert metrics.checks.values == {
+        ("global", "allowed"): 3,
+        ("global", "limited"): 1,
+    }
+    text = metrics.render()
+    assert 'slowerapi_keys{bucket="global:2/60"} 2\n' in text
+    assert 'slowerapi_evictions_total{bucket="global:2/60"} 0\n' in text
+    # several limits of a route each get their own series
+    assert (
+        'slowerapi_concurrency_rejected_total{limit="global",index="0",max="1",'
+        'per_key="false"} 7\n'
+    ) in text
+    assert (
+        'slowerapi_concurrency_rejected_total{limit="global",index="1",max="1",'
+        'per_key="true"} 3\n'
+    ) in text
+
+
+@pytest.mark.asyncio
+async def test_jail() -> None:
+    async def reporter(request: Request, ip_range: str) -> None:
+        pass
+
+    async def failing(request: Request, ip_range: str) -> None:
+        raise ValueError
+
+    queue = ReportQueue([reporter, failing], retries=0)
+    jail = IPJail(get_visitor_ip, ["1/1m"], [reporter, queue])
+    metrics = Metrics()
+    Limiter(mock.Mock(), jail=jail, metrics=metrics)
+
+    await jail.jail(make_request("1.2.3.4"))
+    await queue.shutdown()
+
+    assert metrics.jailed.values == {(): 1}
+    assert metrics.reports.values == {
+        ("test_jail.<locals>.reporter", "ok"): 2,
+        ("ReportQueue", "ok"): 1,
+        ("test_jail.<locals>.failing", "error"): 1,
+    }
+    assert set(metrics.report_time.counts) == {
+        ("test_jail.<locals>.reporter",),
+        ("ReportQueue",),
+        ("test_jail.<locals>.failing",),
+    }
+
+    text = metrics.render()
+    assert 'slowerapi_jail_ranges{family="ipv4"} 1\n' in text
+    assert 'slowerapi_jail_ranges{family="ipv6"} 0\n' in text
+    assert 'slowerapi_report_queue{state="failed"} 1\n' in text
+
+
+@pytest.mark.asyncio
+async def test_middleware() -> None:
+    metrics = Metrics()
+    shedder = LoadShedder()
+    limiter = Limiter(
+        mock.Mock(return_value="key"), ["1/1d"], metrics=metrics, shedder=shedder
+    )
+    limiter.add_global_concurrency(0)
+
+    def endpoint() -> None:
+        pass  # pragma: no cover
+
+    app = mock.AsyncMock()
+    middleware = RatelimitMiddleware(app)
+    scope_app = mock.Mock()
+    scope_app.state.limiter = limiter
+    scope_app.routes = [Route("/", endpoint)]
+
+    def make_scope() -> Scope:
+        return {"type": "http", "app": scope_app, "method": "GET", "path": "/"}
+
+    for _ in range(2):
+        await middleware(make_scope(), mock.AsyncMock(), mock.AsyncMock())
+    limiter.global_concurrency = []
+    await middleware(make_scope(), mock.AsyncMock(), mock.AsyncMock())
+
+    limiter.global_limits = []
+    await middleware(make_scope(), mock.AsyncMock(), mock.AsyncMock())
+    app.assert_awaited_once()
+
+    assert metrics.requests.values == {
+        ("concurrency",): 1,
+        ("limited",): 2,
+        ("allowed",): 1,
+    }
+    assert sum(metrics.overhead.counts[("limited",)]) == 2
+    shedder.factor = 0.5
+    assert "slowerapi_shed_factor 0.5\n" in metrics.render()
+
+
+@pytest.mark.asyncio
+async def test_endpoint() -> None:
+    metrics = Metrics()
+    metrics.jailed.inc()
+    response = await metrics.endpoint(make_request("1.2.3.4"))
+    assert response.media_type == "text/plain; version=0.0.4"
+    assert b"slowerapi_jailed_total 1\n" in response.body
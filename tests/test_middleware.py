@@ -1,102 +1,167 @@
+import typing
 from unittest import mock
 
 import pytest
-from starlette.routing import Match
+from fakeredis import aioredis
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.routing import Match, Route
+from starlette.types import Receive, Scope, Send
 
 from slowerapi import IPJail, Limiter, RatelimitMiddleware
 from slowerapi.limit import parse_limit
+from slowerapi.storage.redis import RedisStorage
 
 
 @pytest.fixture()
 def middleware() -> RatelimitMiddleware:
-    app = mock.Mock()
+    app = mock.AsyncMock()
     return RatelimitMiddleware(app)
 
 
+def make_scope(app: typing.Any) -> Scope:
+    return {
+        "type": "http",
+        "app": app,
+        "method": "GET",
+        "path": "/",
+        "headers": [],
+        "query_string": b"",
+    }
+
+
+def sent_status(send: mock.AsyncMock) -> int:
+    status: int = send.await_args_list[0].args[0]["status"]
+    return status
+
+
+@pytest.mark.asyncio
+async def test_not_http(middleware: RatelimitMiddleware) -> None:
+    scope = {"type": "lifespan"}
+    receive, send = mock.AsyncMock(), mock.AsyncMock()
+
+    await middleware(scope, receive, send)
+
+    middleware.app.assert_awaited_once_with(scope, receive, send)  # type: ignore
+
+
 @pytest.mark.asyncio
 async def test_no_limiter(middleware: RatelimitMiddleware) -> None:
-    request = mock.Mock()
-    request.app = middleware.app
-    call_next = mock.AsyncMock()
-    middleware.app.state.limiter = None  # type: ignore
+    scope = make_scope(mock.Mock())
+    scope["app"].state.limiter = None
+    receive, send = mock.AsyncMock(), mock.AsyncMock()
 
-    await middleware.dispatch(request, call_next)
+    await middleware(scope, receive, send)
 
-    call_next.assert_awaited_once_with(request)
+    middleware.app.assert_awaited_once_with(scope, receive, send)  # type: ignore
 
 
 @pytest.mark.asyncio
 async def test_disabled_limiter(middleware: RatelimitMiddleware) -> None:
-    request = mock.Mock()
-    request.app = middleware.app
+    scope = make_scope(mock.Mock())
     key_func = mock.Mock()
-    request.app.state.limiter = Limiter(key_func, (), enabled=False)  # type: ignore
-    call_next = mock.AsyncMock()
+    scope["app"].state.limiter = Limiter(key_func, (), enabled=False)
+    receive, send = mock.AsyncMock(), mock.AsyncMock()
 
-    await middleware.dispatch(request, call_next)
+    await middleware(scope, receive, send)
 
-    call_next.assert_awaited_once_with(request)
+    middleware.app.assert_awaited_once_with(scope, receive, send)  # type: ignore
     key_func.assert_not_called()
 
 
 @pytest.mark.asyncio
 async def test_is_jailed(middleware: RatelimitMiddleware) -> None:
-    request = mock.Mock()
-    request.app = middleware.app
+    scope = make_scope(mock.Mock())
     key_func = mock.Mock()
-    request.app.state.limiter = limiter = Limiter(key_func, ())  # type: ignore
+    scope["app"].state.limiter = limiter = Limiter(key_func, ())
     limiter.jail = mock.Mock()
     limiter.jail.is_jailed.return_value = True
-    call_next = mock.AsyncMock()
+    send = mock.AsyncMock()
 
-    await middleware.dispatch(request, call_next)
+    await middleware(scope, mock.AsyncMock(), send)
 
-    call_next.assert_not_called()
+    middleware.app.assert_not_called()  # type: ignore
     key_func.assert_not_called()
-    limiter.jail.is_jailed.assert_called_once_with(request)
+    limiter.jail.is_jailed.assert_called_once()
+    assert limiter.jail.is_jailed.call_args.args[0].scope is scope
+    assert sent_status(send) == 429
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("close_jailed", [False, True])
+@pytest.mark.parametrize("http_version", ["1.1", "2"])
+async def test_close_jailed(close_jailed: bool, http_version: str) -> None:
+    middleware = RatelimitMiddleware(mock.AsyncMock(), close_jailed=close_jailed)
+    scope = make_scope(mock.Mock())
+    scope["http_version"] = http_version
+    scope["app"].state.limiter = limiter = Limiter(mock.Mock(), ())
+    limiter.jail = mock.Mock()
+    limiter.jail.is_jailed.return_value = True
+    receive, send = mock.AsyncMock(), mock.AsyncMock()
+
+    await middleware(scope, receive, send)
+
+    receive.assert_not_called()
+    headers = send.await_args_list[0].args[0]["headers"]
+    closing = close_jailed and http_version == "1.1"
+    assert ((b"connection", b"close") in headers) is closing
+
+
+@pytest.mark.asyncio
+async def test_limited_body_unread(middleware: RatelimitMiddleware) -> None:
+    scope = make_scope(mock.Mock())
+    scope["method"] = "POST"
+    scope["app"].routes = []
+    scope["app"].state.limiter = Limiter(mock.Mock(return_value="key"), ["1/1d"])
+    await middleware(dict(scope), mock.AsyncMock(), mock.AsyncMock())
+    receive, send = mock.AsyncMock(), mock.AsyncMock()
+
+    await middleware(dict(scope), receive, send)
+
+    receive.assert_not_called()
+    assert sent_status(send) == 429
+    assert middleware.app.await_count == 1  # type: ignore
 
 
 @pytest.mark.asyncio
 async def test_key_func(middleware: RatelimitMiddleware) -> None:
-    request = mock.Mock()
-    request.app = middleware.app
+    scope = make_scope(mock.Mock())
     key_func = mock.Mock()
-    request.app.state.limiter = Limiter(key_func, ())  # type: ignore
-    request.app.routes = []  # type: ignore
-    call_next = mock.AsyncMock()
+    scope["app"].state.limiter = Limiter(key_func, ())
+    scope["app"].routes = []
 
-    await middleware.dispatch(request, call_next)
+    await middleware(scope, mock.AsyncMock(), mock.AsyncMock())
 
-    call_next.assert_awaited_once_with(request)
-    key_func.assert_called_once_with(request)
+    middleware.app.assert_awaited_once()  # type: ignore
+    key_func.assert_called_once()
+    assert key_func.call_args.args[0].scope is scope
 
 
 @pytest.mark.asyncio
 async def test_global_limit(middleware: RatelimitMiddleware) -> None:
-    request = mock.Mock()
-    request.app = middleware.app
+    scope = make_scope(mock.Mock())
     key_func = mock.Mock(return_value="key")
-    request.app.state.limiter = limiter = Limiter(key_func, ("1/1d",))  # type: ignore
-    request.app.routes = []  # type: ignore
-    call_next = mock.AsyncMock()
+    scope["app"].state.limiter = limiter = Limiter(key_func, ("1/1d",))
+    scope["app"].routes = []
     limiter.check_bucket = mock.Mock(wraps=limiter.check_bucket)  # type: ignore
     middleware._make_ratelimited_response = mock.Mock(  # type: ignore
         wraps=middleware._make_ratelimited_response
     )
 
-    await middleware.dispatch(request, call_next)
-    call_next.assert_awaited_once_with(request)
-    key_func.assert_called_once_with(request)
+    await middleware(scope, mock.AsyncMock(), mock.AsyncMock())
+    middleware.app.assert_awaited_once()  # type: ignore
+    key_func.assert_called_once()
 
     limiter.check_bucket.assert_called_once()
     middleware._make_ratelimited_response.assert_not_called()
 
-    response = await middleware.dispatch(request, call_next)
-    call_next.assert_awaited_once_with(request)  # not called again, got caught
+    send = mock.AsyncMock()
+    await middleware(scope, mock.AsyncMock(), send)
+    middleware.app.assert_awaited_once()  # type: ignore # not called again
 
     middleware._make_ratelimited_response.assert_called_once()
 
-    assert response.status_code == 429
+    assert sent_status(send) == 429
 
 
 @pytest.mark.asyncio
@@ -104,14 +169,12 @@ async def test_global_limit(middleware: RatelimitMiddleware) -> None:
 async def test_global_limit_jailed(
     middleware: RatelimitMiddleware, with_reporter: bool
 ) -> None:
-    request = mock.Mock()
-    request.app = middleware.app
+    scope = make_scope(mock.Mock())
     key_func = mock.Mock(return_value="key")
-    request.app.state.limiter = limiter = Limiter(key_func, ("1/1d",))  # type: ignore
-    request.app.routes = []  # type: ignore
+    scope["app"].state.limiter = limiter = Limiter(key_func, ("1/1d",))
+    scope["app"].routes = []
     reporters = [mock.AsyncMock()] if with_reporter else None
     limiter.jail = IPJail(lambda _: "1.2.3.4", ["0/1s"], reporters)  # type: ignore
-    call_next = mock.AsyncMock()
     limiter.check_bucket = mock.Mock(wraps=limiter.check_bucket)  # type: ignore
     middleware._make_ratelimited_response = mock.Mock(  # type: ignore
         wraps=middleware._make_ratelimited_response
@@ -120,58 +183,58 @@ async def test_global_limit_jailed(
         wraps=middleware._make_jailed_response
     )
 
-    await middleware.dispatch(request, call_next)
-    call_next.assert_awaited_once_with(request)
-    key_func.assert_called_once_with(request)
+    await middleware(scope, mock.AsyncMock(), mock.AsyncMock())
+    middleware.app.assert_awaited_once()  # type: ignore
+    key_func.assert_called_once()
 
     limiter.check_bucket.assert_called_once()
     middleware._make_ratelimited_response.assert_not_called()
     middleware._make_jailed_response.assert_not_called()
 
-    response = await middleware.dispatch(request, call_next)
-    call_next.assert_awaited_once_with(request)  # not called again, got caught
+    send = mock.AsyncMock()
+    await middleware(scope, mock.AsyncMock(), send)
+    middleware.app.assert_awaited_once()  # type: ignore # not called again
 
     middleware._make_ratelimited_response.assert_not_called()
     middleware._make_jailed_response.assert_called_once()
 
     if reporters is not None:
-        reporters[0].assert_awaited_once_with(request, "1.2.3.0/24")
+        reporters[0].assert_awaited_once_with(mock.ANY, "1.2.3.0/24")
 
-    assert response.status_code == 429
+    assert sent_status(send) == 429
 
 
 @pytest.mark.asyncio
 async def test_route_limit(middleware: RatelimitMiddleware) -> None:
-    request = mock.Mock()
-    request.app = middleware.app
+    scope = make_scope(mock.Mock())
     key_func = mock.Mock(return_value="key")
-    request.app.state.limiter = limiter = Limiter(key_func, ())  # type: ignore
+    scope["app"].state.limiter = limiter = Limiter(key_func, ())
     route = mock.Mock()
     route.matches = mock.Mock(return_value=(Match.FULL, 0))
     name = "cleaner_ratelimit_test.test.test_route"
     route.endpoint.__module__ = "cleaner_ratelimit_test.test"
     route.endpoint.__name__ = "test_route"
-    request.app.state.limiter.route_limits[name] = [parse_limit("1/1d")]  # type: ignore
-    request.app.routes = [route]  # type: ignore
-    call_next = mock.AsyncMock()
+    limiter.route_limits[name] = [parse_limit("1/1d")]
+    scope["app"].routes = [route]
     limiter.check_bucket = mock.Mock(wraps=limiter.check_bucket)  # type: ignore
     middleware._make_ratelimited_response = mock.Mock(  # type: ignore
         wraps=middleware._make_ratelimited_response
     )
 
-    await middleware.dispatch(request, call_next)
-    call_next.assert_awaited_once_with(request)
-    key_func.assert_called_once_with(request)
+    await middleware(scope, mock.AsyncMock(), mock.AsyncMock())
+    middleware.app.assert_awaited_once()  # type: ignore
+    key_func.assert_called_once()
 
     limiter.check_bucket.assert_called_once()
     middleware._make_ratelimited_response.assert_not_called()
 
-    response = await middleware.dispatch(request, call_next)
-    call_next.assert_awaited_once_with(request)  # not called again, got caught
+    send = mock.AsyncMock()
+    await middleware(scope, mock.AsyncMock(), send)
+    middleware.app.assert_awaited_once()  # type: ignore # not called again
 
     middleware._make_ratelimited_response.assert_called_once()
 
-    assert response.status_code == 429
+    assert sent_status(send) == 429
 
 
 @pytest.mark.asyncio
@@ -179,10 +242,9 @@ async def test_route_limit(middleware: RatelimitMiddleware) -> None:
 async def test_route_limit_jailed(
     middleware: RatelimitMiddleware, with_reporter: bool
 ) -> None:
-    request = mock.Mock()
-    request.app = middleware.app
+    scope = make_scope(mock.Mock())
     key_func = mock.Mock(return_value="key")
-    request.app.state.limiter = limiter = Limiter(key_func, ())  # type: ignore
+    scope["app"].state.limiter = limiter = Limiter(key_func, ())
     reporter = [mock.AsyncMock()] if with_reporter else None
     limiter.jail = IPJail(lambda _: "1.2.3.4", ["0/1s"], reporter)  # type: ignore
     route = mock.Mock()
@@ -190,9 +252,8 @@ async def test_route_limit_jailed(
     name = "cleaner_ratelimit_test.test.test_route"
     route.endpoint.__module__ = "cleaner_ratelimit_test.test"
     route.endpoint.__name__ = "test_route"
-    request.app.state.limiter.route_limits[name] = [parse_limit("1/1d")]  # type: ignore
-    request.app.routes = [route]  # type: ignore
-    call_next = mock.AsyncMock()
+    limiter.route_limits[name] = [parse_limit("1/1d")]
+    scope["app"].routes = [route]
     limiter.check_bucket = mock.Mock(wraps=limiter.check_bucket)  # type: ignore
     middleware._make_ratelimited_response = mock.Mock(  # type: ignore
         wraps=middleware._make_ratelimited_response
@@ -201,20 +262,121 @@ async def test_route_limit_jailed(
         wraps=middleware._make_jailed_response
     )
 
-    await middleware.dispatch(request, call_next)
-    call_next.assert_awaited_once_with(request)
-    key_func.assert_called_once_with(request)
+    await middleware(scope, mock.AsyncMock(), mock.AsyncMock())
+    middleware.app.assert_awaited_once()  # type: ignore
+    key_func.assert_called_once()
 
     limiter.check_bucket.assert_called_once()
     middleware._make_ratelimited_response.assert_not_called()
 
-    response = await middleware.dispatch(request, call_next)
-    call_next.assert_awaited_once_with(request)  # not called again, got caught
+    send = mock.AsyncMock()
+    await middleware(scope, mock.AsyncMock(), send)
+    middleware.app.assert_awaited_once()  # type: ignore # not called again
 
     middleware._make_ratelimited_response.assert_not_called()
     middleware._make_jailed_response.assert_called_once()
 
     if reporter is not None:
-        reporter[0].assert_awaited_once_with(request, "1.2.3.0/24")
+        reporter[0].assert_awaited_once_with(mock.ANY, "1.2.3.0/24")
+
+    assert sent_status(send) == 429
+
+
+@pytest.mark.asyncio
+async def test_headers() -> None:
+    async def app(scope: Scope, receive: Receive, send: Send) -> None:
+        await PlainTextResponse("ok")(scope, receive, send)
+
+    middleware = RatelimitMiddleware(app)
+    scope = make_scope(mock.Mock())
+    scope["app"].state.limiter = Limiter(mock.Mock(return_value="key"), ("5/1d",))
+    scope["app"].routes = []
+    send = mock.AsyncMock()
+
+    await middleware(scope, mock.AsyncMock(), send)
+
+    start = send.await_args_list[0].args[0]
+    assert start["status"] == 200
+    assert (b"x-ratelimit-limit", b"5") in start["headers"]
+    assert (b"x-ratelimit-remaining", b"4") in start["headers"]
+    assert send.await_args_list[1].args[0]["body"] == b"ok"
+
+
+@pytest.mark.asyncio
+async def test_only_count_failed() -> None:
+    async def app(scope: Scope, receive: Receive, send: Send) -> None:
+        await PlainTextResponse("failed", status_code=400)(scope, receive, send)
+
+    middleware = RatelimitMiddleware(app)
+    scope = make_scope(mock.Mock())
+    limiter = Limiter(mock.Mock(return_value="key"), ("1/1d",), only_count_failed=True)
+    scope["app"].state.limiter = limiter
+    scope["app"].routes = []
+
+    send = mock.AsyncMock()
+    await middleware(scope, mock.AsyncMock(), send)
+    assert sent_status(send) == 400
+
+    send = mock.AsyncMock()
+    await middleware(scope, mock.AsyncMock(), send)
+    assert sent_status(send) == 429
+    assert len(send.await_args_list) == 2  # the app body was dropped
+    assert b"Rate limit exceeded" in send.await_args_list[1].args[0]["body"]
+
+
+@pytest.mark.asyncio
+async def test_cost(middleware: RatelimitMiddleware) -> None:
+    scope = make_scope(mock.Mock())
+    limiter = Limiter(mock.Mock(return_value="key"), ("20/1d",))
+    cost = mock.Mock(return_value=6)
+
+    @limiter.limit("10/1d", cost=cost)
+    def endpoint() -> None:
+        pass  # pragma: no cover
+
+    scope["app"].state.limiter = limiter
+    scope["app"].routes = [Route("/", endpoint)]
+
+    send = mock.AsyncMock()
+    await middleware(scope, mock.AsyncMock(), send)
+    middleware.app.assert_awaited_once()  # type: ignore
+    assert isinstance(cost.call_args.args[0], Request)
+    # the global limit is charged the same cost
+    ratelimited = limiter.check_bucket("global", "key", limiter.global_limits, False)
+    assert ratelimited is not None and ratelimited.remaining == 14
+
+    send = mock.AsyncMock()
+    await middleware(scope, mock.AsyncMock(), send)
+    assert sent_status(send) == 429
+
+
+@pytest.mark.asyncio
+async def test_storage_one_call(middleware: RatelimitMiddleware) -> None:
+    scope = make_scope(mock.Mock())
+    storage = RedisStorage(aioredis.FakeRedis())
+    storage.hit = mock.AsyncMock(wraps=storage.hit)  # type: ignore
+    storage.hit_many = mock.AsyncMock(wraps=storage.hit_many)  # type: ignore
+    limiter = Limiter(mock.Mock(return_value="key"), ("20/1d",), storage=storage)
+
+    @limiter.limit("1/1d")
+    def endpoint() -> None:
+        pass  # pragma: no cover
+
+    scope["app"].state.limiter = limiter
+    scope["app"].routes = [Route("/", endpoint)]
+
+    await middleware(scope, mock.AsyncMock(), mock.AsyncMock())
+    # the global and route buckets go out in one round-trip
+    storage.hit_many.assert_awaited_once_with(
+        [
+            ("global", "key", limiter.global_limits, 1),
+            (f"{__name__}.endpoint", "key", [parse_limit("1/1d")], 1),
+        ],
+        True,
+    )
+    storage.hit.assert_not_awaited()
 
-    assert response.status_code == 429
+    send = mock.AsyncMock()
+    await middleware(scope, mock.AsyncMock(), send)
+    assert sent_status(send) == 429
+    assert storage.hit_many.await_count == 2
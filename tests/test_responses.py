@@ -0,0 +1,109 @@
+import asyncio
+import json
+import typing
+from unittest import mock
+
+import pytest
+from starlette.responses import JSONResponse
+
+from slowerapi import Limiter, RatelimitMiddleware
+from slowerapi.limit import Limit
+from slowerapi.responses import CoarseClock, RawResponse, ResponseFactory
+from slowerapi.strategy import Ratelimited
+
+
+async def render(response: typing.Any) -> tuple[int, dict[bytes, bytes], bytes]:
+    send = mock.AsyncMock()
+    await response({}, mock.AsyncMock(), send)
+    start, body = [call.args[0] for call in send.await_args_list]
+    return start["status"], dict(start["headers"]), body["body"]
+
+
+@pytest.mark.asyncio
+async def test_ratelimited() -> None:
+    factory = ResponseFactory()
+    factory.clock.time_func = lambda: 1000.0
+    ratelimit = Ratelimited(True, Limit(5, 60), 0, 12.3456)
+
+    status, headers, body = await render(factory.ratelimited(ratelimit))
+    assert status == 429
+    assert body == JSONResponse(
+        {"detail": "Rate limit exceeded: 5 per 60 seconds", "retry_after": 12345}
+    ).body
+    assert headers == {
+        b"x-ratelimit-limit": b"5",
+        b"x-ratelimit-remaining": b"0",
+        b"x-ratelimit-reset": b"1012345",
+        b"retry-after": b"12345",
+        b"content-type": b"application/json",
+        b"content-length": str(len(body)).encode(),
+    }
+
+    _, _, body = await render(factory.ratelimited(ratelimit._replace(reset_after=1)))
+    assert json.loads(body)["retry_after"] == 1000
+
+
+@pytest.mark.asyncio
+async def test_static() -> None:
+    factory = ResponseFactory()
+    status, headers, body = await render(factory.jailed())
+    assert status == 429
+    assert b"Banned" in body
+    assert headers[b"content-length"] == str(len(body)).encode()
+    status, _, body = await render(factory.shed())
+    assert status == 503
+    assert factory.concurrency(4) is factory.concurrency(4)
+    status, _, body = await render(factory.concurrency(4))
+    assert json.loads(body) == {"detail": "Too many concurrent requests: 4 at a time"}
+
+
+@pytest.mark.asyncio
+async def test_headers_copied() -> None:
+    response = RawResponse(429, [(b"a", b"b")], b"")
+
+    async def send(message: typing.Any) -> None:
+        message.get("headers", []).append((b"c", b"d"))
+
+    await response({}, mock.AsyncMock(), send)
+    assert response.headers == [(b"a", b"b")]
+
+
+@pytest.mark.asyncio
+async def test_clock() -> None:
+    clock = CoarseClock(resolution=0.01)
+    clock.time_func = mock.Mock(return_value=1.0)
+    assert clock.ms() == 1000
+    clock.time_func.return_value = 2.0
+    assert clock.ms() == 1000
+    await asyncio.sleep(0.02)
+    assert clock.ms() == 2000
+    assert clock.time_func.call_count == 2
+
+    clock = CoarseClock()
+    clock.time_func = mock.Mock(return_value=1.0)
+    await asyncio.to_thread(lambda: (clock.ms(), clock.ms()))
+    assert clock.time_func.call_count == 2  # no loop, not cached
+
+
+@pytest.mark.asyncio
+async def test_custom() -> None:
+    class Responses(ResponseFactory):
+        def ratelimited_content(self, limit: Limit) -> dict[str, typing.Any]:
+            return {"error": "slow down", "limit": limit.requests}
+
+    limiter = Limiter(mock.Mock(return_value="key"), ["1/1d"])
+    middleware = RatelimitMiddleware(mock.AsyncMock(), responses=Responses())
+    scope_app = mock.Mock()
+    scope_app.state.limiter = limiter
+    scope_app.routes = []
+    scope = {"type": "http", "app": scope_app, "method": "GET", "path": "/"}
+
+    await middleware(dict(scope), mock.AsyncMock(), mock.AsyncMock())
+    send = mock.AsyncMock()
+    await middleware(dict(scope), mock.AsyncMock(), send)
+    body = send.await_args_list[1].args[0]["body"]
+    assert json.loads(body) == {
+        "error": "slow down",
+        "limit": 1,
+        "retry_after": mock.ANY,
+    }
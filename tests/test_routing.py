@@ -0,0 +1,87 @@
+from unittest import mock
+
+from starlette.routing import Mount, Route
+
+from slowerapi.limit import Limit
+from slowerapi.routing import RouteIndex, RoutePlan
+
+
+def endpoint() -> None:
+    pass  # pragma: no cover
+
+
+def plan_func(handler: object) -> RoutePlan:
+    return RoutePlan(str(handler), [Limit(1, 1)], False)
+
+
+def make_scope(path: str, method: str = "GET") -> dict[str, str]:
+    return {"type": "http", "method": method, "path": path}
+
+
+def test_lookup() -> None:
+    routes = [
+        Route("/users/me", endpoint, methods=["GET"]),
+        Route("/users/{id}", endpoint, methods=["POST"]),
+        Route("/{page}", endpoint),
+        Mount("/static", mock.Mock()),
+    ]
+    plans = [RoutePlan(str(i), [], False) for i in range(3)]
+    index = RouteIndex(routes, mock.Mock(side_effect=plans))
+
+    assert index.lookup(make_scope("/users/me")) is plans[0]
+    assert index.lookup(make_scope("/users/me", "POST")) is plans[1]
+    assert index.lookup(make_scope("/users/me", "PUT")) is None
+    assert index.lookup(make_scope("/about")) is plans[2]
+    assert index.lookup(make_scope("/static/x")) is None
+
+
+def test_first_match() -> None:
+    routes = [Route("/{page}", endpoint), Route("/about", endpoint)]
+    plans = [RoutePlan("first", [], False), RoutePlan("second", [], False)]
+    index = RouteIndex(routes, mock.Mock(side_effect=plans))
+
+    assert index.lookup(make_scope("/about")) is plans[0]
+
+
+def test_cache() -> None:
+    route = mock.Mock(wraps=Route("/users/{id}", endpoint))
+    route.path = "/users/{id}"
+    route.methods = {"GET"}
+    index = RouteIndex([route], plan_func, cache_size=2)
+
+    plan = index.lookup(make_scope("/users/1"))
+    assert plan is not None
+    assert index.lookup(make_scope("/users/1")) is plan
+    route.matches.assert_called_once()
+
+    index.lookup(make_scope("/users/2"))
+    index.lookup(make_scope("/users/3"))
+    assert len(index._cache) == 2
+    assert ("GET", "/users/1") not in index._cache
+
+
+def test_is_for() -> None:
+    routes = [Route("/", endpoint)]
+    index = RouteIndex(routes, plan_func)
+
+    assert index.is_for(routes)
+    assert not index.is_for(list(routes))
+    routes.append(Route("/other", endpoint))
+    assert not index.is_for(routes)
+
+
+def test_replaced() -> None:
+    routes = [Route("/", endpoint), Route("/other", endpoint)]
+    plan_func = mock.Mock(side_effect=lambda handler: RoutePlan("", [], False))
+    index = RouteIndex(routes, plan_func)
+    old = index.lookup(make_scope("/"))
+
+    def other() -> None:
+        pass  # pragma: no cover
+
+    routes[0] = Route("/", other)  # replaced in place
+    assert index.is_for(routes)
+    plan_func.side_effect = lambda handler: RoutePlan(handler.__name__, [], False)
+    plan = index.lookup(make_scope("/"))
+    assert plan is not old and plan is not None and plan.name == "other"
+    assert index.lookup(make_scope("/")) is plan
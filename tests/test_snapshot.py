@@ -0,0 +1,137 @@
+import io
+import typing
+from unittest import mock
+
+import pytest
+
+from slowerapi import Limiter
+from slowerapi.limit import Limit
+from slowerapi.snapshot import read_snapshot, write_snapshot
+from slowerapi.strategy import (
+    CountMinSketchStrategy,
+    GCRAStrategy,
+    MovingWindowStrategy,
+    SlidingWindowStrategy,
+    Strategy,
+    StrategyFactory,
+)
+
+LIMIT = Limit(5, 10)
+
+
+def make_strategy(
+    factory: StrategyFactory, clock: typing.Callable[[], float]
+) -> Strategy:
+    strategy = factory(LIMIT, "global:5/10", None)
+    strategy.time_func = clock  # type: ignore
+    return strategy
+
+
+@pytest.mark.parametrize(
+    "factory", [MovingWindowStrategy, GCRAStrategy, SlidingWindowStrategy]
+)
+def test_round_trip(factory: StrategyFactory) -> None:
+    now = 100.0
+    strategy = make_strategy(factory, lambda: now)
+    strategy.limit("a", True, 3)
+    now = 104.0
+    strategy.limit("b", True, 4)
+    remaining = [strategy.limit(key, False).remaining for key in "ab"]
+
+    fp = io.BytesIO()
+    assert write_snapshot(fp, [strategy], now=1000.0) == 2
+
+    # a fresh process, with another monotonic clock
+    now = 7.0
+    restored = make_strategy(factory, lambda: now)
+    expiry = mock.Mock()
+    restored.expiry = expiry
+    fp.seek(0)
+    assert read_snapshot(fp, lambda name, limit: restored, now=1000.0) == 2
+
+    assert [restored.limit(key, False).remaining for key in "ab"] == remaining
+    assert restored.limit("b", True, 2).limited
+    assert expiry.schedule.call_count == 2
+    assert restored.key_count() == 2
+
+
+def test_elapsed() -> None:
+    now = 0.0
+    strategy = make_strategy(MovingWindowStrategy, lambda: now)
+    strategy.limit("a", True)
+    now = 5.0
+    strategy.limit("b", True)
+    fp = io.BytesIO()
+    write_snapshot(fp, [strategy], now=1000.0)
+
+    restored = make_strategy(MovingWindowStrategy, lambda: now)
+    fp.seek(0)
+    # a expired while the process was down, b has 3 seconds left
+    assert read_snapshot(fp, lambda name, limit: restored, now=1007.0) == 1
+    assert restored.limit("a", False).remaining == 5
+    assert restored.limit("b", False) == (False, LIMIT, 4, 3.0)
+
+
+def test_skip() -> None:
+    strategy = GCRAStrategy(LIMIT, "global:5/10")
+    strategy.limit("a", True)
+    sketch = CountMinSketchStrategy(LIMIT, "sketch:5/10")
+    sketch.limit("a", True)
+    fp = io.BytesIO()
+    assert write_snapshot(fp, [sketch, strategy, strategy]) == 2
+
+    resolve = mock.Mock(return_value=SlidingWindowStrategy(LIMIT))
+    fp.seek(0)
+    assert read_snapshot(fp, resolve) == 0
+    assert resolve.call_args_list == [mock.call("global:5/10", LIMIT)] * 2
+
+    fp.seek(0)
+    assert read_snapshot(fp, mock.Mock(return_value=None)) == 0
+
+
+def test_invalid() -> None:
+    with pytest.raises(ValueError):
+        read_snapshot(io.BytesIO(b"nope"), mock.Mock())
+
+    strategy = GCRAStrategy(LIMIT, "global:5/10")
+    strategy.limit("a", True)
+    fp = io.BytesIO()
+    write_snapshot(fp, [strategy])
+    with pytest.raises(ValueError):
+        read_snapshot(io.BytesIO(fp.getvalue()[:-3]), mock.Mock())
+
+
+@pytest.mark.asyncio
+async def test_lifespan(tmp_path: typing.Any) -> None:
+    path = str(tmp_path / "snapshot")
+    limiter = Limiter(mock.Mock(), ["2/1m"], snapshot_path=path)
+    await limiter.startup()  # nothing to restore yet
+    limiter.check_bucket("global", "a", limiter.global_limits, True)
+    limiter.check_bucket("global", "a", limiter.global_limits, True)
+    await limiter.shutdown()
+
+    limiter = Limiter(mock.Mock(), ["2/1m"], snapshot_path=path)
+    await limiter.startup()
+    ratelimited = limiter.check_bucket("global", "a", limiter.global_limits, True)
+    assert ratelimited is not None and ratelimited.limited
+    # restored buckets are kept even if they are not hit before shutdown
+    limiter.buckets["global:2/60"].forget("a")
+    await limiter.shutdown()
+    assert list(tmp_path.iterdir()) == [tmp_path / "snapshot"]
+
+    with open(path, "wb") as fp:
+        fp.write(b"garbage")
+    limiter = Limiter(mock.Mock(), ["2/1m"], snapshot_path=path)
+    await limiter.startup()
+    assert limiter.buckets == {}
+
+
+@pytest.mark.asyncio
+async def test_shutdown_write_failed(tmp_path: typing.Any) -> None:
+    path = str(tmp_path / "missing" / "snapshot")
+    jail = mock.Mock(shutdown=mock.AsyncMock())
+    limiter = Limiter(mock.Mock(), ["2/1m"], jail=jail, snapshot_path=path)
+    limiter.check_bucket("global", "a", limiter.global_limits, True)
+
+    await limiter.shutdown()
+    jail.shutdown.assert_awaited_once()
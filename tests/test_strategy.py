@@ -1,16 +1,19 @@
 import typing
 
 from slowerapi.limit import Limit
-from slowerapi.strategy import MovingWindowStrategy
+from slowerapi.strategy import (
+    CountMinSketchStrategy,
+    GCRAStrategy,
+    MovingWindowStrategy,
+    SlidingWindowStrategy,
+)
 
 
 def test_moving_window() -> None:
     limit_5_10 = Limit(5, 10)
     with TimeHelper() as th:
         window = MovingWindowStrategy(limit_5_10)
-        # hijack timing function
-        window._requests.time_func = th.time_func
-        window._requests.time_scale = th.scale
+        window.time_func = th.time_func
 
         rt = window.limit("user_1", True)
         assert rt.limited is False
@@ -48,6 +51,305 @@ def test_moving_window() -> None:
         assert rt.reset_after == 10
 
 
+def test_gcra() -> None:
+    limit_5_10 = Limit(5, 10)
+    with TimeHelper() as th:
+        gcra = GCRAStrategy(limit_5_10)
+        gcra.time_func = th.time_func
+
+        rt = gcra.limit("user_1", False)
+        assert rt.limited is False
+        assert rt.remaining == 5
+
+        rt = gcra.limit("user_1", True)
+        assert rt.limited is False
+        assert rt.limit == limit_5_10
+        assert rt.remaining == 4
+        assert rt.reset_after == 2
+
+        gcra.limit("user_1", True)
+        gcra.limit("user_1", True)
+        gcra.limit("user_1", True)
+
+        rt = gcra.limit("user_1", True)
+        assert rt.limited is False
+        assert rt.remaining == 0
+        assert rt.reset_after == 10
+
+        rt = gcra.limit("user_1", True)
+        assert rt.limited is True
+        assert rt.remaining == 0
+        assert rt.reset_after == 2
+
+        rt = gcra.limit("user_2", True)
+        assert rt.limited is False
+        assert rt.remaining == 4
+
+        # one emission interval later exactly one request fits again
+        th.advance(2)
+        rt = gcra.limit("user_1", True)
+        assert rt.limited is False
+        assert rt.remaining == 0
+        assert gcra.limit("user_1", True).limited is True
+
+        th.advance(10)
+        rt = gcra.limit("user_1", True)
+        assert rt.remaining == 4
+        assert len(gcra._tats) == 2
+
+
+def test_gcra_fractional() -> None:
+    with TimeHelper() as th:
+        gcra = GCRAStrategy(Limit(3, 1))
+        gcra.time_func = th.time_func
+
+        for remaining in (2, 1, 0):
+            rt = gcra.limit("user_1", True)
+            assert rt.limited is False
+            assert rt.remaining == remaining
+        assert gcra.limit("user_1", True).limited is True
+
+
+def test_gcra_burst() -> None:
+    with TimeHelper() as th:
+        gcra = GCRAStrategy(Limit(5, 10), burst=1)
+        gcra.time_func = th.time_func
+
+        # one hit per second: only every other one fits the 2s interval
+        allowed = []
+        for _ in range(10):
+            allowed.append(not gcra.limit("user_1", True).limited)
+            th.advance(1)
+        assert allowed == [True, False] * 5
+
+        default = GCRAStrategy(Limit(5, 10))
+        default.time_func = th.time_func
+        allowed = []
+        for _ in range(10):
+            allowed.append(not default.limit("user_1", True).limited)
+            th.advance(1)
+        assert sum(allowed) == 9  # burst + requests - 1
+
+
+def test_gcra_zero() -> None:
+    gcra = GCRAStrategy(Limit(0, 10))
+    rt = gcra.limit("user_1", True)
+    assert rt.limited is True
+    assert rt.reset_after == 10
+
+
+def test_sliding_window() -> None:
+    limit_4_10 = Limit(4, 10)
+    with TimeHelper() as th:
+        window = SlidingWindowStrategy(limit_4_10)
+        window.time_func = th.time_func
+
+        rt = window.limit("user_1", False)
+        assert rt.limited is False
+        assert rt.remaining == 4
+        assert "user_1" not in window._counters
+
+        rt = window.limit("user_1", True)
+        assert rt.limited is False
+        assert rt.limit == limit_4_10
+        assert rt.remaining == 3
+        assert rt.reset_after == 20
+
+        th.advance(5)
+        window.limit("user_1", True)
+        window.limit("user_1", True)
+        rt = window.limit("user_1", True)
+        assert rt.remaining == 0
+        assert rt.reset_after == 15
+
+        rt = window.limit("user_1", True)
+        assert rt.limited is True
+        assert rt.reset_after == 7.5  # into the next window, until 3/4 is weighted
+        assert window._counters["user_1"].current == 4  # not counted
+
+        # half of the previous window still counts: 4 * 0.5 = 2
+        th.advance(10)
+        rt = window.limit("user_1", False)
+        assert rt.remaining == 2
+        window.limit("user_1", True)
+        rt = window.limit("user_1", True)
+        assert rt.remaining == 0
+
+        rt = window.limit("user_1", True)
+        assert rt.limited is True
+        assert rt.reset_after == 2.5
+
+        th.advance(2.5)
+        assert window.limit("user_1", True).limited is False
+
+        # a window with no requests in between drops the old count entirely
+        th.advance(20)
+        rt = window.limit("user_1", True)
+        assert rt.remaining == 3
+        assert rt.reset_after == 12.5
+
+
+def test_sliding_window_zero() -> None:
+    window = SlidingWindowStrategy(Limit(0, 10))
+    assert window.limit("user_1", True).limited is True
+
+
+def test_count_min_sketch() -> None:
+    limit_4_10 = Limit(4, 10)
+    with TimeHelper() as th:
+        th.advance(100)
+        sketch = CountMinSketchStrategy(limit_4_10, error=0.01, delta=0.01, slots=2)
+        sketch.time_func = th.time_func
+        assert sketch.width == 272
+        assert sketch.depth == 5
+        assert sketch.memory == 3 * 272 * 5 * 4
+
+        rt = sketch.limit("user_1", False)
+        assert rt.limited is False
+        assert rt.remaining == 4
+
+        rt = sketch.limit("user_1", True)
+        assert rt.limited is False
+        assert rt.limit == limit_4_10
+        assert rt.remaining == 3
+        assert rt.reset_after == 10
+
+        th.advance(5)  # next sub-window
+        sketch.limit("user_1", True)
+        sketch.limit("user_1", True)
+        rt = sketch.limit("user_1", True)
+        assert rt.remaining == 0
+        assert rt.reset_after == 10
+
+        rt = sketch.limit("user_1", True)
+        assert rt.limited is True
+        assert rt.reset_after == 5
+
+        assert sketch.limit("user_2", True).remaining == 3
+
+        # the first sub-window drops out
+        th.advance(5)
+        rt = sketch.limit("user_1", True)
+        assert rt.limited is False
+        assert rt.remaining == 0
+
+        th.advance(20)
+        assert sketch.limit("user_1", True).remaining == 3
+        for cell in sketch._cells("user_2"):
+            assert sum(slot[cell] for slot in sketch._sketches) <= 1
+
+
+def test_count_min_sketch_exact() -> None:
+    with TimeHelper() as th:
+        sketch = CountMinSketchStrategy(
+            Limit(10, 10), slots=2, exact_threshold=3, max_exact=1
+        )
+        sketch.time_func = th.time_func
+
+        for _ in range(5):
+            sketch.limit("user_1", True)
+        assert sketch._exact == {"user_1": [5, 0]}
+        # only counted until promoted
+        assert max(max(slot) for slot in sketch._sketches) == 2
+
+        for _ in range(5):
+            sketch.limit("user_2", True)
+        assert "user_2" not in sketch._exact  # max_exact reached
+        assert sketch.limit("user_2", False).remaining == 5
+
+        th.advance(5)
+        assert sketch.limit("user_1", True).remaining == 4
+        assert sketch._exact == {"user_1": [5, 1]}
+
+        th.advance(5)
+        assert sketch._exact == {"user_1": [5, 1]}
+        assert sketch.limit("user_1", False).remaining == 9
+        assert sketch._exact == {"user_1": [0, 1]}
+
+        th.advance(5)
+        sketch.limit("user_3", False)
+        assert sketch._exact == {}
+
+
+def test_max_keys() -> None:
+    limit_5_10 = Limit(5, 10)
+    with TimeHelper() as th:
+        window = MovingWindowStrategy(limit_5_10, max_keys=2)
+        window.time_func = th.time_func
+        gcra = GCRAStrategy(limit_5_10, max_keys=2)
+        gcra.time_func = th.time_func
+        sliding = SlidingWindowStrategy(limit_5_10, max_keys=2)
+        sliding.time_func = th.time_func
+
+        for strategy in (window, gcra, sliding):
+            strategy.limit("user_1", True)
+            strategy.limit("user_2", True)
+            strategy.limit("user_1", True)
+            strategy.limit("user_3", False)  # peeks do not store keys
+            assert strategy.evictions == 0
+
+            strategy.limit("user_3", True)
+            assert strategy.evictions == 1
+            # user_2 was written to least recently
+            assert strategy.limit("user_2", False).remaining == 5
+            assert strategy.limit("user_1", False).remaining == 3
+
+        assert len(window._requests) == len(gcra._tats) == len(sliding._counters) == 2
+
+        # keys that expired on their own are not counted as evicted
+        th.advance(10)
+        window.limit("user_4", True)
+        assert window.evictions == 1
+
+
+def test_sweep() -> None:
+    limit_5_10 = Limit(5, 10)
+    with TimeHelper() as th:
+        gcra = GCRAStrategy(limit_5_10)
+        gcra.time_func = th.time_func
+        sliding = SlidingWindowStrategy(limit_5_10)
+        sliding.time_func = th.time_func
+
+        for strategy in (gcra, sliding):
+            for i in range(2000):
+                strategy.limit(f"user_{i}", True)
+            assert strategy.key_count() == 2000
+
+        # without an expiry engine, stale keys go once the store has doubled
+        th.advance(3600)
+        for strategy in (gcra, sliding):
+            for i in range(2048):
+                strategy.limit(f"new_{i}", True)
+            assert strategy.key_count() == 2048  # only the new keys
+            assert strategy.expires_in("user_0") is None
+            assert strategy.limit("new_0", False).remaining == 4
+
+
+def test_cost() -> None:
+    limit_10_60 = Limit(10, 60)
+    with TimeHelper() as th:
+        window = MovingWindowStrategy(limit_10_60)
+        window.time_func = th.time_func
+        gcra = GCRAStrategy(limit_10_60)
+        gcra.time_func = th.time_func
+        sliding = SlidingWindowStrategy(limit_10_60)
+        sliding.time_func = th.time_func
+        cms = CountMinSketchStrategy(limit_10_60)
+        cms.time_func = th.time_func
+
+        for strategy in (window, gcra, sliding, cms):
+            assert strategy.limit("user", True, 4).remaining == 6
+            assert strategy.limit("user", False, 6).remaining == 6
+            assert strategy.limit("user", True, 4).remaining == 2
+            assert strategy.limit("user", True, 3).limited
+            assert strategy.limit("other", True, 11).limited
+
+        # the others only count hits that fit
+        assert not gcra.limit("user", True, 2).limited
+        assert not sliding.limit("user", True, 2).limited
+        assert not cms.limit("user", True, 2).limited
+
+
 # taken from expirepy
 T = typing.TypeVar("T", bound="TimeHelper")
 